@@ -0,0 +1,84 @@
+"""
+Recall and memory of the quantized entity embedding store.
+
+Compares QuantizedEmbeddingStore top-k results against exact float32 cosine
+search, for float16 and int8 codes with and without full-precision re-ranking,
+and reports the index size against the Python float lists each Entity used to
+carry. Uses a workspace's create_final_entities embeddings when given, otherwise
+clustered synthetic vectors (real description embeddings are far from uniform).
+
+    python -m benchmarks.embedding_recall --entities 100000
+    python -m benchmarks.embedding_recall --workspace ragtest
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from grag_api.embedding_store import QUANTIZATIONS, QuantizedEmbeddingStore
+from grag_api.query import ENTITY_EMBEDDING_TABLE
+
+
+def workspace_vectors(workspace) -> np.ndarray:
+    path = Path(workspace) / "output" / "graph" / "artifacts" / f"{ENTITY_EMBEDDING_TABLE}.parquet"
+    embeddings = pd.read_parquet(path, columns=["description_embedding"])["description_embedding"].dropna()
+    return np.stack(embeddings.to_numpy()).astype(np.float32)
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def python_list_bytes(n: int, dim: int) -> int:
+    """A list of dim Python floats: an 8-byte pointer plus a 24-byte float object per element."""
+    return n * (sys.getsizeof([0.0] * dim) + dim * sys.getsizeof(0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k and memory of the quantized embedding store.")
+    parser.add_argument("--workspace", default=None, help="Read embeddings from this workspace's artifacts")
+    parser.add_argument("--entities", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    vectors = workspace_vectors(args.workspace) if args.workspace else synthetic_vectors(args.entities, args.dim)
+    n, dim = vectors.shape
+    ids = [str(i) for i in range(n)]
+
+    # queries near stored entities, as questions land near the entities they mention
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, n, args.queries)] + 0.05 * rng.standard_normal((args.queries, dim))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = [set(np.argsort(-(unit @ query))[:args.k].tolist()) for query in queries]
+
+    print(f"{n} entities x {dim} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'store':<22}{'recall':>8}{'ms/query':>10}{'index MB':>10}")
+    print(f"{'python float lists':<22}{1.0:>8.3f}{'':>10}{python_list_bytes(n, dim) / 2 ** 20:>10.1f}")
+    print(f"{'float32 matrix':<22}{1.0:>8.3f}{'':>10}{vectors.nbytes / 2 ** 20:>10.1f}")
+    for quantization in QUANTIZATIONS:
+        store = QuantizedEmbeddingStore(ids, vectors, quantization=quantization)
+        for rerank_factor in (1, args.rerank_factor):
+            store.rerank_factor = rerank_factor
+            start = time.perf_counter()
+            results = [store.similarity_search_by_vector(query, k=args.k) for query in queries]
+            elapsed = (time.perf_counter() - start) / len(queries)
+            recall = np.mean([
+                len({int(r.document.id) for r in result} & truth) / args.k
+                for result, truth in zip(results, exact)
+            ])
+            label = f"{quantization} rerank x{rerank_factor}" if rerank_factor > 1 else f"{quantization} codes only"
+            print(f"{label:<22}{recall:>8.3f}{elapsed * 1000:>10.2f}{store.memory_bytes() / 2 ** 20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
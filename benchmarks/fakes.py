@@ -0,0 +1,78 @@
+"""Deterministic stand-ins for the OpenAI chat and embedding clients used by the query path."""
+import asyncio
+import hashlib
+from typing import Any
+
+import numpy as np
+
+from graphrag.query.llm.base import BaseLLM, BaseLLMCallback, BaseTextEmbedding
+
+FAKE_RESPONSE = (
+    "| Carrier Name | Lineal Foot Rules | Notes |\n"
+    "| ------------ | ----------------- | ----- |\n"
+    "| XPO | Shipments occupying more than 10 linear feet are rated at 1,000 lbs per linear foot. | Information not available for exceptions. |\n"
+)
+
+
+def text_vector(text: str, dim: int) -> np.ndarray:
+    """A unit vector derived from the text's hash, identical across runs and processes."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeEmbedding(BaseTextEmbedding):
+    """Embeds text into a hash-seeded random unit vector with no network call."""
+
+    def __init__(self, dim: int = 1536, delay: float = 0.0):
+        self.dim = dim
+        self.delay = delay
+
+    def embed(self, text: str, **kwargs: Any) -> list[float]:
+        return text_vector(text, self.dim).tolist()
+
+    async def aembed(self, text: str, **kwargs: Any) -> list[float]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.embed(text)
+
+
+class FakeChatLLM(BaseLLM):
+    """Streams a fixed answer word by word through the callbacks, like ChatOpenAI with streaming=True."""
+
+    def __init__(self, response: str = FAKE_RESPONSE, token_delay: float = 0.0):
+        self.response = response
+        self.token_delay = token_delay
+
+    def _tokens(self):
+        return [word + " " for word in self.response.split(" ")]
+
+    def generate(
+            self,
+            messages: str | list[Any],
+            streaming: bool = True,
+            callbacks: list[BaseLLMCallback] | None = None,
+            **kwargs: Any,
+    ) -> str:
+        full_response = ""
+        for token in self._tokens():
+            full_response += token
+            for callback in callbacks or []:
+                callback.on_llm_new_token(token)
+        return full_response
+
+    async def agenerate(
+            self,
+            messages: str | list[Any],
+            streaming: bool = True,
+            callbacks: list[BaseLLMCallback] | None = None,
+            **kwargs: Any,
+    ) -> str:
+        full_response = ""
+        for token in self._tokens():
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            full_response += token
+            for callback in callbacks or []:
+                callback.on_llm_new_token(token)
+        return full_response
@@ -0,0 +1,185 @@
+"""
+Scaling benchmark for the graph finalization workflows.
+
+Builds synthetic entity graphs at multiples of the ragtest graph's size, cut into
+per-text-unit partial graphs the way entity extraction emits them, and times
+graphrag's merge_graphs and cluster_graph verbs and its create_final_nodes and
+create_final_communities workflows against the columnar replacements in
+grag_api.graph_tables. That both give the same output is tested in
+tests/test_graph_tables.py. graphrag's NetworkX path gets slow at the larger
+scales, so it is only run up to --baseline-max-scale; above that only the
+columnar times are reported.
+
+    python -m benchmarks.graph_finalize --scales 10 30 100
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from datashaper import NoopVerbCallbacks, NoopWorkflowCallbacks, TableContainer, VerbInput, Workflow
+
+from graphrag.index.cache import NoopPipelineCache
+from graphrag.index.context import PipelineRunContext, PipelineRunStats
+from graphrag.index.storage import MemoryPipelineStorage
+from graphrag.index.verbs.graph.clustering.cluster_graph import cluster_graph as graphrag_cluster_graph
+from graphrag.index.verbs.graph.merge.merge_graphs import merge_graphs as graphrag_merge_graphs
+from graphrag.index.workflows.v1 import create_final_communities, create_final_nodes
+from grag_api.graph_tables import GRAPH_VERBS, cluster_graph, merge_graphs, use_columnar_workflows
+
+SOURCE_ARTIFACTS = Path("ragtest/output/graph/artifacts")
+CLUSTER_STRATEGY = {"type": "leiden", "max_cluster_size": 10}
+NODES_CONFIG = {"layout_graph_enabled": False, "snapshot_top_level_nodes": False, "level_for_node_positions": 0}
+ENTITY_TYPES = ["ORGANIZATION", "GEO", "EVENT", "PERSON"]
+
+
+class WorkflowReference:
+    """The name, config and steps of a pipeline workflow, as use_columnar_workflows rewrites them."""
+
+    def __init__(self, name: str, config: dict, steps: list):
+        self.name, self.config, self.steps = name, config, steps
+
+
+def source_graph_size(artifacts_dir=SOURCE_ARTIFACTS) -> tuple[int, int]:
+    """(nodes, edges) of the checked-in graph."""
+    artifacts_dir = Path(artifacts_dir)
+    nodes = pd.read_parquet(artifacts_dir / "create_final_nodes.parquet", columns=["title"])["title"].nunique()
+    edges = len(pd.read_parquet(artifacts_dir / "create_final_relationships.parquet", columns=["id"]))
+    return nodes, edges
+
+
+def synthetic_partial_graphs(nodes: int, edges: int, edges_per_unit: int = 4, seed: int = 0) -> pd.DataFrame:
+    """
+    A create_base_extracted_entities input: one GraphML graph per text unit. Most edges stay within
+    a neighbourhood of about 30 nodes so the graph has communities to find; entities recur across
+    units, and a tenth of the edges are extracted twice, so merging has repeated nodes and edges.
+    """
+    rng = np.random.default_rng(seed)
+    sources = rng.integers(0, nodes, edges)
+    local = sources + rng.integers(1, 30, edges)
+    targets = np.where(rng.random(edges) < 0.9, local % nodes, rng.integers(0, nodes, edges))
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    repeated = rng.random(len(sources)) < 0.1
+    sources = np.concatenate([sources, sources[repeated]])
+    targets = np.concatenate([targets, targets[repeated]])
+    order = rng.permutation(len(sources))
+    sources, targets = sources[order], targets[order]
+
+    graphs = []
+    for unit, start in enumerate(range(0, len(sources), edges_per_unit)):
+        graph = nx.Graph()
+        unit_id = f"unit-{unit}"
+        for source, target in zip(sources[start:start + edges_per_unit], targets[start:start + edges_per_unit]):
+            for node in (source, target):
+                graph.add_node(
+                    f'"ENTITY {node}"',
+                    type=ENTITY_TYPES[node % len(ENTITY_TYPES)],
+                    description=f"Entity {node} as described in {unit_id}",
+                    source_id=unit_id,
+                )
+            graph.add_edge(
+                f'"ENTITY {source}"',
+                f'"ENTITY {target}"',
+                weight=1.0,
+                description=f"Entity {source} relates to entity {target} in {unit_id}",
+                source_id=unit_id,
+            )
+        graphs.append("\n".join(nx.generate_graphml(graph)))
+    return pd.DataFrame({"entities_graph": graphs})
+
+
+def verb_input(table: pd.DataFrame) -> VerbInput:
+    return VerbInput(source=TableContainer(table=table))
+
+
+def run_workflow(name: str, steps: list, table: pd.DataFrame, verbs: dict | None = None) -> pd.DataFrame:
+    workflow = Workflow(verbs=verbs or {}, schema={"name": name, "steps": steps}, validate=False)
+    workflow.add_table("workflow:create_base_entity_graph", table)
+    # graphrag's create_final_nodes steps snapshot to the run's storage
+    context = PipelineRunContext(stats=PipelineRunStats(), cache=NoopPipelineCache(), storage=MemoryPipelineStorage())
+    asyncio.run(workflow.run(context, NoopWorkflowCallbacks()))
+    return workflow.output()
+
+
+def final_workflows() -> dict[str, tuple[list, list]]:
+    """graphrag's and the columnar steps of create_final_nodes and create_final_communities."""
+    references = [
+        WorkflowReference("create_final_nodes", NODES_CONFIG, create_final_nodes.build_steps(NODES_CONFIG)),
+        WorkflowReference("create_final_communities", {}, create_final_communities.build_steps({})),
+    ]
+    graphrag_steps = {reference.name: reference.steps for reference in references}
+    use_columnar_workflows(references)
+    return {reference.name: (graphrag_steps[reference.name], reference.steps) for reference in references}
+
+
+def timed(function) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def bench_scale(scale: int, base_nodes: int, base_edges: int, baseline: bool) -> list[dict]:
+    nodes, edges = base_nodes * scale, base_edges * scale
+    partial_graphs = synthetic_partial_graphs(nodes, edges)
+    callbacks = NoopVerbCallbacks()
+    rows = []
+
+    def stage(name, columnar, graphrag=None):
+        columnar_s, columnar_output = timed(columnar)
+        row = {"stage": name, "scale": scale, "nodes": nodes, "edges": edges, "columnar_s": columnar_s}
+        if baseline and graphrag is not None:
+            row["graphrag_s"], _ = timed(graphrag)
+        rows.append(row)
+        return columnar_output
+
+    merge_args = {"column": "entities_graph", "to": "entity_graph"}
+    merged = stage(
+        "merge_graphs",
+        lambda: merge_graphs(verb_input(partial_graphs), callbacks, **merge_args).table,
+        lambda: graphrag_merge_graphs(verb_input(partial_graphs), callbacks, **merge_args).table,
+    )
+
+    cluster_args = {"strategy": CLUSTER_STRATEGY, "column": "entity_graph", "to": "clustered_graph", "level_to": "level"}
+    clustered = stage(
+        "cluster_graph",
+        lambda: cluster_graph(verb_input(merged), callbacks, **cluster_args).table,
+        lambda: graphrag_cluster_graph(verb_input(merged), callbacks, **cluster_args).table,
+    )
+    base_entity_graph = clustered[["level", "clustered_graph"]]
+
+    for name, (graphrag_steps, columnar_steps) in final_workflows().items():
+        stage(
+            name,
+            lambda steps=columnar_steps, name=name: run_workflow(name, steps, base_entity_graph, GRAPH_VERBS),
+            lambda steps=graphrag_steps, name=name: run_workflow(name, steps, base_entity_graph),
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark graph finalization on synthetic graphs.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 30, 100])
+    parser.add_argument("--baseline-max-scale", type=int, default=30, help="Largest scale to also run graphrag's verbs at")
+    parser.add_argument("--nodes", type=int, default=None, help="Base node count (default: the ragtest graph's)")
+    parser.add_argument("--edges", type=int, default=None, help="Base edge count (default: the ragtest graph's)")
+    args = parser.parse_args()
+
+    base_nodes, base_edges = (args.nodes, args.edges) if args.nodes and args.edges else source_graph_size()
+    print(f"base graph: {base_nodes} nodes, {base_edges} edges")
+    print(f"{'stage':<26}{'scale':>6}{'nodes':>9}{'edges':>9}{'graphrag s':>12}{'columnar s':>12}{'speedup':>9}")
+    for scale in args.scales:
+        for row in bench_scale(scale, base_nodes, base_edges, baseline=scale <= args.baseline_max_scale):
+            graphrag_s = row.get("graphrag_s")
+            print(
+                f"{row['stage']:<26}{row['scale']:>6}{row['nodes']:>9}{row['edges']:>9}"
+                f"{graphrag_s if graphrag_s is not None else float('nan'):>12.2f}{row['columnar_s']:>12.2f}"
+                f"{graphrag_s / row['columnar_s'] if graphrag_s is not None else float('nan'):>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark for query-only processes.
+
+Starts fresh interpreters that import grag_api and create a GraphRAG instance,
+the startup a serving pod pays, and compares them with the same startup that
+also creates the indexer, dataset and PDF processor as GraphRAG used to do
+eagerly. Reports the median wall time of each, the heavy modules the query-only
+start still imports, the slowest imports from `python -X importtime`, and any
+files written under the workspace during startup.
+
+    python -m benchmarks.import_time --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["graphrag.index", "yaml", "boto3", "botocore", "unstructured_client", "requests"]
+
+QUERY_ONLY = """
+import grag_api
+grag = grag_api.GraphRAG(workspace={workspace!r})
+"""
+
+EAGER = QUERY_ONLY + """
+grag.indexer, grag.db, grag.pdf_processor
+"""
+
+REPORT_MODULES = """
+import sys
+print(",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+
+def run(code: str, cwd, extra_args=()) -> tuple[float, subprocess.CompletedProcess]:
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *extra_args, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, process
+
+
+def snapshot(path: Path) -> dict[str, float]:
+    return {str(p.relative_to(path)): p.stat().st_mtime for p in path.rglob("*") if p.is_file()}
+
+
+def slowest_imports(stderr: str, top: int) -> list[tuple[int, str]]:
+    """Parse `-X importtime` output into (cumulative microseconds, module), slowest first."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # nested imports are indented below the module that imported them
+        if not module.startswith("  "):
+            rows.append((int(cumulative), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure grag_api cold-start time for query-only processes.")
+    parser.add_argument("--workspace", default=str(REPO_ROOT / "ragtest"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    workspace = Path(args.workspace).resolve()
+    with tempfile.TemporaryDirectory() as cwd:
+        results = {}
+        for name, template in (("query-only", QUERY_ONLY), ("eager", EAGER)):
+            code = template.format(workspace=str(workspace))
+            run(code, cwd)  # warm the OS file cache and bytecode caches
+            before = snapshot(workspace)
+            times = [run(code, cwd)[0] for _ in range(args.repeat)]
+            written = sorted(path for path, mtime in snapshot(workspace).items() if before.get(path) != mtime)
+            _, process = run(code + REPORT_MODULES.format(modules=HEAVY_MODULES), cwd)
+            results[name] = {
+                "median_s": statistics.median(times),
+                "heavy_modules": process.stdout.strip().splitlines()[-1] if process.stdout.strip() else "",
+                "written": written,
+            }
+
+        for name, result in results.items():
+            print(f"{name:<11} {result['median_s'] * 1000:8.0f} ms  "
+                  f"heavy modules: {result['heavy_modules'] or '-'}  "
+                  f"files written: {', '.join(result['written']) or '-'}")
+        saved = results["eager"]["median_s"] - results["query-only"]["median_s"]
+        print(f"query-only start saves {saved * 1000:.0f} ms ({saved / results['eager']['median_s']:.0%})")
+
+        _, process = run(QUERY_ONLY.format(workspace=str(workspace)), cwd, ["-X", "importtime"])
+        print("\nslowest imports (query-only):")
+        for cumulative, module in slowest_imports(process.stderr, args.top):
+            print(f"{cumulative / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
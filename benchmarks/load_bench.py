@@ -0,0 +1,206 @@
+"""
+End-to-end load test of GraphRAG.aquery against a local mock OpenAI server.
+
+Starts benchmarks.mock_openai in a separate process (streaming tokens at a
+realistic rate, with optional 429s and latency spikes), builds a synthetic
+workspace, then runs N simulated users that each ask a question, wait for the
+full answer and pause for a think time before the next one. Reports throughput,
+time to first token (SearchResult.latency, from FirstCharCallback), p50/p95/p99
+completion time, failures and event-loop lag. Runs fully offline.
+
+    python -m benchmarks.load_bench --users 20 --duration 60 --error-rate 0.05 --spike-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.mock_openai import run_server
+from benchmarks.query_bench import DEFAULT_QUESTIONS
+from benchmarks.synthetic import build_workspace
+from grag_api.batch import read_questions
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Mock OpenAI server did not start on port {port}")
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def at(q):
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1]}
+
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.05):
+    """Record how late the event loop wakes a task that asked to sleep for `interval`."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - start - interval, 0.0))
+
+
+async def simulate_user(
+        grag,
+        user: int,
+        questions: list[str],
+        deadline: float,
+        think_time: float,
+        unique_questions: bool,
+        records: list[dict],
+        rng: random.Random,
+):
+    while time.monotonic() < deadline:
+        question = rng.choice(questions)
+        if unique_questions:
+            # A per-user suffix keeps identical questions from being coalesced into one search
+            question = f"{question} (user {user})"
+        start = time.monotonic()
+        try:
+            result = await grag.aquery(question, callbacks=[])
+            records.append({
+                "user": user,
+                "ok": True,
+                "ttft": result.latency,
+                "completion_time": result.completion_time,
+                "wall_time": time.monotonic() - start,
+            })
+        except Exception as e:
+            records.append({"user": user, "ok": False, "error": repr(e), "wall_time": time.monotonic() - start})
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1.0 / think_time))
+
+
+async def run_load(grag, questions: list[str], users: int, duration: float, think_time: float,
+                   unique_questions: bool, seed: int) -> dict:
+    records, lag_samples = [], []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    # Load the index and vector store once before the clock starts
+    await grag.aquery(questions[0], callbacks=[])
+
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*[
+        simulate_user(grag, user, questions, deadline, think_time, unique_questions, records,
+                      random.Random(seed + user))
+        for user in range(users)
+    ])
+    elapsed = time.monotonic() - start
+    stop.set()
+    await monitor
+
+    succeeded = [r for r in records if r["ok"]]
+    return {
+        "users": users,
+        "duration_s": elapsed,
+        "completed": len(succeeded),
+        "failed": len(records) - len(succeeded),
+        "throughput_qps": len(succeeded) / elapsed if elapsed else 0.0,
+        "ttft_s": percentiles([r["ttft"] for r in succeeded if r["ttft"] is not None]),
+        "completion_time_s": percentiles([r["completion_time"] for r in succeeded]),
+        "wall_time_s": percentiles([r["wall_time"] for r in succeeded]),
+        "event_loop_lag_s": percentiles(lag_samples),
+        "errors": sorted({r["error"] for r in records if not r["ok"]}),
+    }
+
+
+def print_report(report: dict):
+    print(f"users={report['users']} duration={report['duration_s']:.1f}s "
+          f"completed={report['completed']} failed={report['failed']} "
+          f"throughput={report['throughput_qps']:.2f} q/s")
+    print(f"{'metric':<20} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for metric in ("ttft_s", "completion_time_s", "wall_time_s", "event_loop_lag_s"):
+        summary = report[metric]
+        cells = [f"{summary[q] * 1000:>10.1f}" if summary[q] is not None else f"{'-':>10}"
+                 for q in ("p50", "p95", "p99", "max")]
+        print(f"{metric:<20} {' '.join(cells)}")
+    for error in report["errors"]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test GraphRAG.aquery against a local mock OpenAI server.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load after warm-up")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between a user's queries")
+    parser.add_argument("--unique-questions", action="store_true", help="Defeat query coalescing")
+    parser.add_argument("--questions", default=None, help="JSONL file of questions (requests.jsonl shape)")
+    parser.add_argument("--workspace", default=None, help="Existing workspace; default builds a synthetic one")
+    parser.add_argument("--scale", type=int, default=1, help="Synthetic graph scale")
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--response-tokens", type=int, default=300)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of OpenAI calls answered with 429")
+    parser.add_argument("--spike-rate", type=float, default=0.0)
+    parser.add_argument("--spike-latency", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    from grag_api import GraphRAG
+
+    questions = [q["question"] for q in read_questions(args.questions)] if args.questions else DEFAULT_QUESTIONS
+    port = free_port()
+    server = multiprocessing.Process(target=run_server, daemon=True, kwargs={
+        "port": port,
+        "tokens_per_second": args.tokens_per_second,
+        "response_tokens": args.response_tokens,
+        "first_token_latency": args.first_token_latency,
+        "embedding_latency": args.embedding_latency,
+        "embedding_dim": args.embedding_dim,
+        "error_rate": args.error_rate,
+        "spike_rate": args.spike_rate,
+        "spike_latency": args.spike_latency,
+        "seed": args.seed,
+    })
+    server.start()
+    try:
+        wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workspace = args.workspace or str(
+                build_workspace(Path(workdir) / "workspace", scale=args.scale, embedding_dim=args.embedding_dim)
+            )
+            grag = GraphRAG(workspace=workspace, api_key="mock", api_base=f"http://127.0.0.1:{port}/v1")
+            # Keep the benchmark's vectors out of the app's LanceDB directory
+            grag.querier.lancedb_uri = str(Path(workdir) / "lancedb")
+            report = asyncio.run(run_load(
+                grag, questions, args.users, args.duration, args.think_time, args.unique_questions, args.seed
+            ))
+    finally:
+        server.terminate()
+        server.join()
+
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+A local OpenAI-compatible server for load tests.
+
+Serves /v1/chat/completions (streamed as server-sent events at a configurable
+token rate, or as a single JSON body) and /v1/embeddings (hash-seeded vectors
+from benchmarks.fakes.text_vector, as floats or base64). A fraction of requests
+is answered with 429 and another fraction gets a latency spike before the first
+token, so client retries and tail latency show up in the numbers. Nothing leaves
+the machine.
+
+    python -m benchmarks.mock_openai --port 8089 --tokens-per-second 60 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.fakes import FAKE_RESPONSE, text_vector
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}
+
+
+class MockOpenAIServer:
+    """Minimal HTTP/1.1 keep-alive server speaking the parts of the OpenAI API the query path uses."""
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 8089,
+            tokens_per_second: float = 60.0,
+            response_tokens: int = 300,
+            first_token_latency: float = 0.4,
+            embedding_latency: float = 0.05,
+            embedding_dim: int = 256,
+            error_rate: float = 0.0,
+            spike_rate: float = 0.0,
+            spike_latency: float = 5.0,
+            seed: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.first_token_latency = first_token_latency
+        self.embedding_latency = embedding_latency
+        self.embedding_dim = embedding_dim
+        self.error_rate = error_rate
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.random = random.Random(seed)
+        self.stats = {"chat": 0, "embeddings": 0, "rate_limited": 0, "spikes": 0}
+
+    def _tokens(self) -> list[str]:
+        words = FAKE_RESPONSE.split(" ")
+        return [words[i % len(words)] + " " for i in range(self.response_tokens)]
+
+    async def _first_token_delay(self):
+        delay = self.first_token_latency
+        if self.random.random() < self.spike_rate:
+            self.stats["spikes"] += 1
+            delay += self.spike_latency
+        await asyncio.sleep(delay)
+
+    async def _send_json(self, writer, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _rate_limited(self, writer) -> bool:
+        if self.random.random() >= self.error_rate:
+            return False
+        self.stats["rate_limited"] += 1
+        await self._send_json(
+            writer, 429,
+            {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+            {"retry-after-ms": "250"},
+        )
+        return True
+
+    async def chat(self, payload: dict, writer):
+        self.stats["chat"] += 1
+        if await self._rate_limited(writer):
+            return
+        model = payload.get("model", "gpt-4o")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        tokens = self._tokens()
+        await self._first_token_delay()
+
+        if not payload.get("stream"):
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            await self._send_json(writer, 200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+        )
+
+        async def send_event(data: str):
+            event = f"data: {data}\n\n".encode("utf-8")
+            writer.write(f"{len(event):X}\r\n".encode("latin-1") + event + b"\r\n")
+            await writer.drain()
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            })
+
+        interval = 1.0 / self.tokens_per_second
+        await send_event(chunk({"role": "assistant", "content": ""}))
+        for token in tokens:
+            await send_event(chunk({"content": token}))
+            await asyncio.sleep(interval)
+        await send_event(chunk({}, "stop"))
+        await send_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def embeddings(self, payload: dict, writer):
+        self.stats["embeddings"] += 1
+        if await self._rate_limited(writer):
+            return
+        await asyncio.sleep(self.embedding_latency)
+        inputs = payload.get("input", [])
+        # A single string or a single token array is one input; a list of either is a batch
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for index, item in enumerate(inputs):
+            vector = text_vector(item if isinstance(item, str) else json.dumps(item), self.embedding_dim)
+            if payload.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        await self._send_json(writer, 200, {
+            "object": "list", "data": data, "model": payload.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+
+                if path.endswith("/chat/completions"):
+                    await self.chat(payload, writer)
+                elif path.endswith("/embeddings"):
+                    await self.embeddings(payload, writer)
+                else:
+                    await self._send_json(writer, 404, {"error": {"message": f"Unknown path {path}"}})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(**kwargs):
+    """Process entry point: serve until terminated."""
+    try:
+        asyncio.run(MockOpenAIServer(**kwargs).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible API for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--response-tokens", type=int, default=300)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="Fraction of chat requests with a latency spike")
+    parser.add_argument("--spike-latency", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Mock OpenAI API on http://{args.host}:{args.port}/v1")
+    run_server(**vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Query-path micro-benchmark.
+
+Times each stage of GraphRAGQuerier against the checked-in ragtest artifacts with
+deterministic fake chat and embedding models, so no OpenAI latency is included:
+artifact load, indexer_adapters conversion, vector store setup, build_context,
+prompt formatting, token counting and the whole asearch call. Runs on synthetic
+graphs scaled from the same artifacts and compares medians against a saved baseline;
+it exits with an error when a scale has no baseline yet, so record one first on
+the machine that runs the comparison.
+
+    python -m benchmarks.query_bench --scales 1 10 100
+    python -m benchmarks.query_bench --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import tiktoken
+from graphrag.query.llm.text_utils import num_tokens
+
+from benchmarks.fakes import FakeChatLLM, FakeEmbedding
+from benchmarks.synthetic import build_workspace
+from grag_api.batch import read_questions
+from grag_api.config import load_config
+from grag_api.query import GraphRAGQuerier
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "query.json"
+
+DEFAULT_QUESTIONS = [
+    "What is the fuel surcharge for Roadrunner?",
+    "What do carriers charge for lineal foot rules?",
+    "Compare the over-length fees of all carriers and list each charge in a table.",
+    "What are the payment terms for freight charges?",
+    "Does the New York Metro Charge apply to deliveries in New Jersey?",
+    "Which carriers require an inside delivery appointment, and what do they charge?",
+    "How are claims for lost or damaged freight filed?",
+    "What is the Geographic Linehaul Surcharge?",
+]
+
+
+class BenchmarkQuerier(GraphRAGQuerier):
+    """GraphRAGQuerier wired to deterministic fakes instead of the OpenAI clients."""
+
+    def __init__(self, workspace, config, embedding_dim: int = 256):
+        super().__init__(workspace, config=config)
+        self.embedding_dim = embedding_dim
+        self.lancedb_uri = str(Path(workspace) / "lancedb")
+
+    def setup_llm_and_embeddings(self):
+        token_encoder = tiktoken.get_encoding(self.config['encoding_model'])
+        return FakeChatLLM(), token_encoder, FakeEmbedding(dim=self.embedding_dim)
+
+
+def summarize(times: list[float]) -> dict:
+    ordered = sorted(times)
+    return {
+        "median": statistics.median(ordered),
+        "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        "runs": len(ordered),
+    }
+
+
+def timed(fn, times: list[float]):
+    start = time.perf_counter()
+    result = fn()
+    times.append(time.perf_counter() - start)
+    return result
+
+
+def run_scale(scale: int, questions: list[str], repeat: int, embedding_dim: int, workdir: Path) -> dict:
+    workspace = build_workspace(workdir / f"scale_{scale}", scale=scale, embedding_dim=embedding_dim)
+    querier = BenchmarkQuerier(str(workspace), load_config(), embedding_dim=embedding_dim)
+    stages = {stage: [] for stage in (
+        "artifact_load", "adapter_conversion", "vector_store_setup",
+        "build_context", "prompt_formatting", "token_counting", "search_end_to_end",
+    )}
+
+    tables = timed(querier.read_artifacts, stages["artifact_load"])
+    timed(lambda: querier.convert_artifacts(tables), stages["adapter_conversion"])
+    description_embedding_store = timed(querier.setup_vector_store, stages["vector_store_setup"])
+    llm_instance, token_encoder, text_embedder = querier.setup_llm_and_embeddings()
+    search_engine = querier.setup_local_search(llm_instance, token_encoder, text_embedder, description_embedding_store)
+
+    for _ in range(repeat):
+        for question in questions:
+            context_text, _ = timed(
+                lambda: search_engine.context_builder.build_context(
+                    query=question, **search_engine.context_builder_params
+                ),
+                stages["build_context"],
+            )
+            prompt = timed(
+                lambda: search_engine.system_prompt.format(
+                    context_data=context_text, response_type=search_engine.response_type
+                ),
+                stages["prompt_formatting"],
+            )
+            timed(lambda: num_tokens(prompt, token_encoder), stages["token_counting"])
+            timed(lambda: asyncio.run(search_engine.asearch(question)), stages["search_end_to_end"])
+
+    return {stage: summarize(times) for stage, times in stages.items()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the results next to the baseline and return the stages that regressed."""
+    regressions = []
+    print(f"{'scale':>6} {'stage':<20} {'median ms':>10} {'p95 ms':>10} {'baseline':>10} {'ratio':>7}")
+    for scale, stages in results.items():
+        for stage, summary in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            ratio = summary["median"] / base["median"] if base and base["median"] else None
+            flag = ""
+            if ratio is not None and ratio > tolerance:
+                regressions.append(f"x{scale} {stage}")
+                flag = "  REGRESSION"
+            print(
+                f"{scale:>6} {stage:<20} {summary['median'] * 1000:>10.2f} {summary['p95'] * 1000:>10.2f} "
+                f"{base['median'] * 1000 if base else float('nan'):>10.2f} "
+                f"{ratio if ratio is not None else float('nan'):>7.2f}{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GraphRAG query path without OpenAI calls.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--questions", default=None, help="JSONL file of questions (requests.jsonl shape)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed median slowdown vs. baseline")
+    parser.add_argument("--output", default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    missing = [str(scale) for scale in args.scales if str(scale) not in baseline]
+    if missing and not args.save_baseline:
+        # without a baseline there is nothing to compare against, so no regression could be reported
+        sys.exit(f"{baseline_path} has no baseline for scales {', '.join(missing)}; record one with --save-baseline")
+
+    questions = [q["question"] for q in read_questions(args.questions)] if args.questions else DEFAULT_QUESTIONS
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {
+            str(scale): run_scale(scale, questions, args.repeat, args.embedding_dim, Path(workdir))
+            for scale in args.scales
+        }
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({**baseline, **results}, indent=2))
+        print(f"Saved baseline to {baseline_path}")
+    elif regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
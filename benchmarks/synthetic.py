@@ -0,0 +1,138 @@
+"""Build benchmark workspaces from the checked-in ragtest artifacts, optionally scaled up."""
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.fakes import text_vector
+from grag_api.artifact_store import read_artifact
+from grag_api.query import (
+    COMMUNITY_REPORT_TABLE,
+    ENTITY_EMBEDDING_TABLE,
+    ENTITY_TABLE,
+    RELATIONSHIP_TABLE,
+    TEXT_UNIT_TABLE,
+)
+
+SOURCE_ARTIFACTS = Path("ragtest/output/graph/artifacts")
+
+
+def read_source_artifacts(artifacts_dir=SOURCE_ARTIFACTS) -> dict[str, pd.DataFrame]:
+    artifacts_dir = Path(artifacts_dir)
+    return {
+        table: read_artifact(artifacts_dir / f"{table}.parquet")
+        for table in (ENTITY_TABLE, COMMUNITY_REPORT_TABLE, RELATIONSHIP_TABLE, TEXT_UNIT_TABLE)
+    }
+
+
+def entities_from_nodes(nodes: pd.DataFrame, embedding_dim: int) -> pd.DataFrame:
+    """
+    Recreate the create_final_entities table (not checked in) from create_final_nodes,
+    with deterministic description embeddings from the fake embedder.
+    """
+    entities = nodes.drop_duplicates(subset="id")
+    return pd.DataFrame({
+        "id": entities["id"].values,
+        "name": entities["title"].values,
+        "type": entities["type"].values,
+        "description": entities["description"].values,
+        "human_readable_id": entities["human_readable_id"].values,
+        "text_unit_ids": [
+            source_id.split(",") if source_id else [] for source_id in entities["source_id"]
+        ],
+        "description_embedding": [
+            text_vector(description or "", embedding_dim) for description in entities["description"]
+        ],
+    })
+
+
+def _suffix_ids(values: pd.Series, suffix: str) -> pd.Series:
+    return values.map(lambda ids: None if ids is None else [f"{i}{suffix}" for i in ids])
+
+
+def _copy(tables: dict[str, pd.DataFrame], copy: int, community_offset: int, id_offset: int) -> dict[str, pd.DataFrame]:
+    """One disjoint copy of the graph: every id, title and community is made unique to the copy."""
+    suffix = f"-{copy}"
+    title_suffix = f" #{copy}"
+
+    nodes = tables[ENTITY_TABLE].copy()
+    nodes["id"] = nodes["id"] + suffix
+    nodes["title"] = nodes["title"] + title_suffix
+    nodes["human_readable_id"] = nodes["human_readable_id"] + copy * id_offset
+    nodes["source_id"] = nodes["source_id"].map(
+        lambda ids: ",".join(f"{i}{suffix}" for i in ids.split(",")) if ids else ids
+    )
+    nodes["community"] = nodes["community"].map(
+        lambda c: None if c is None else str(int(c) + copy * community_offset)
+    )
+
+    entities = tables[ENTITY_EMBEDDING_TABLE].copy()
+    entities["id"] = entities["id"] + suffix
+    entities["name"] = entities["name"] + title_suffix
+    entities["human_readable_id"] = entities["human_readable_id"] + copy * id_offset
+    entities["text_unit_ids"] = _suffix_ids(entities["text_unit_ids"], suffix)
+
+    reports = tables[COMMUNITY_REPORT_TABLE].copy()
+    reports["id"] = reports["id"] + suffix
+    reports["community"] = reports["community"].map(lambda c: str(int(c) + copy * community_offset))
+
+    relationships = tables[RELATIONSHIP_TABLE].copy()
+    relationships["id"] = relationships["id"] + suffix
+    relationships["source"] = relationships["source"] + title_suffix
+    relationships["target"] = relationships["target"] + title_suffix
+    relationships["human_readable_id"] = (relationships["human_readable_id"].astype(int) + copy * id_offset).astype(str)
+    relationships["text_unit_ids"] = _suffix_ids(relationships["text_unit_ids"], suffix)
+
+    text_units = tables[TEXT_UNIT_TABLE].copy()
+    text_units["id"] = text_units["id"] + suffix
+    for column in ("document_ids", "entity_ids", "relationship_ids"):
+        text_units[column] = _suffix_ids(text_units[column], suffix)
+
+    return {
+        ENTITY_TABLE: nodes,
+        ENTITY_EMBEDDING_TABLE: entities,
+        COMMUNITY_REPORT_TABLE: reports,
+        RELATIONSHIP_TABLE: relationships,
+        TEXT_UNIT_TABLE: text_units,
+    }
+
+
+def scale_artifacts(tables: dict[str, pd.DataFrame], scale: int) -> dict[str, pd.DataFrame]:
+    """
+    Grow the graph `scale` times by appending disjoint copies of it.
+
+    Copies share descriptions and text, so query-time work per copy matches the
+    real corpus while the number of candidates, rows and vectors grows linearly.
+    """
+    if scale <= 1:
+        return tables
+    community_offset = int(pd.to_numeric(tables[COMMUNITY_REPORT_TABLE]["community"]).max()) + 1
+    id_offset = int(max(
+        tables[ENTITY_TABLE]["human_readable_id"].max(),
+        tables[RELATIONSHIP_TABLE]["human_readable_id"].astype(int).max(),
+    )) + 1
+    copies = [tables] + [_copy(tables, copy, community_offset, id_offset) for copy in range(1, scale)]
+    return {
+        table: pd.concat([c[table] for c in copies], ignore_index=True)
+        for table in tables
+    }
+
+
+def write_workspace(tables: dict[str, pd.DataFrame], workspace) -> Path:
+    """Write artifacts the way GraphRAGIndexer leaves them, including the _index timestamp."""
+    workspace = Path(workspace)
+    artifacts_dir = workspace / "output" / "graph" / "artifacts"
+    artifacts_dir.mkdir(parents=True, exist_ok=True)
+    for table, df in tables.items():
+        df.to_parquet(artifacts_dir / f"{table}.parquet")
+    (workspace / "_index").write_text(str(int(time.time())))
+    return workspace
+
+
+def build_workspace(workspace, scale: int = 1, embedding_dim: int = 256, artifacts_dir=SOURCE_ARTIFACTS) -> Path:
+    """
+    Create a queryable workspace from the checked-in artifacts, scaled `scale` times.
+    """
+    tables = read_source_artifacts(artifacts_dir)
+    tables[ENTITY_EMBEDDING_TABLE] = entities_from_nodes(tables[ENTITY_TABLE], embedding_dim)
+    return write_workspace(scale_artifacts(tables, scale), workspace)
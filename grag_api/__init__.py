@@ -1,21 +1,130 @@
-from .index import GraphRAGIndexer
 from .query import GraphRAGQuerier
 from .config import load_config
-from .db import DB
-from grag_api.extract.json_extract import process_json_content
-from grag_api.extract.pdf_extract import PDFProcessor
+from grag_api.batch import abatch_query
+from grag_api.pool import EnginePool
+from grag_api.tombstones import Tombstones
+from grag_api.metrics import DOCUMENTS_UPSERTED, INDEX_RUNS, INDEX_SECONDS
+import importlib
 import os
 from datetime import datetime
+from functools import cached_property
+
+# ingestion and indexing pull in the graphrag index pipeline, YAML, boto3 and the
+# Unstructured client; they are imported on first use so query-only processes start fast
+_LAZY_IMPORTS = {
+    "GraphRAGIndexer": "grag_api.index",
+    "DB": "grag_api.db",
+    "PDFProcessor": "grag_api.extract.pdf_extract",
+    "process_json_content": "grag_api.extract.json_extract",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
 
 class GraphRAG:
-    def __init__(self, workspace="ragtest", api_key=None):
-        config = load_config(api_key)
-        self.indexer = GraphRAGIndexer(workspace, config=config)
-        self.querier = GraphRAGQuerier(workspace, config=config)
-        self.db = DB()
-        self.pdf_processor = PDFProcessor(config)
+    def __init__(self, workspace="ragtest", api_key=None, api_base=None, pool=None, sharded=False):
+        """
+        The indexer, dataset and PDF processor are created on first use, so an
+        instance that only answers queries imports and writes nothing for them.
+
+        :param pool: Optional EnginePool shared by several GraphRAG instances; queries for this
+                     workspace then go through the pool instead of a querier owned by this instance
+        :param sharded: Index each file into its own shard and route queries to the relevant
+                        shards, instead of one graph for the whole dataset
+        """
+        self.config = load_config(api_key, api_base)
+        self.pool = pool
+        self.sharded = sharded
+        self.querier = None if pool is not None or sharded else GraphRAGQuerier(workspace, config=self.config)
+        self.tombstones = Tombstones(workspace)
         self.workspace = workspace
 
+    @cached_property
+    def indexer(self):
+        from grag_api.index import GraphRAGIndexer
+        return GraphRAGIndexer(self.workspace, config=self.config)
+
+    @cached_property
+    def sharded_indexer(self):
+        from grag_api.shards import ShardedIndexer
+        return ShardedIndexer(self.workspace, config=self.config)
+
+    @cached_property
+    def router(self):
+        from grag_api.router import ShardRouter
+        return ShardRouter(self.workspace, config=self.config, pool=self.pool)
+
+    def _workspace_for(self, title):
+        """The workspace of the index that holds a file's rows."""
+        if not self.sharded:
+            return self.workspace
+        from grag_api.shards import shard_key, shard_workspace
+        return shard_workspace(self.workspace, shard_key(title))
+
+    def _tombstones_for(self, title):
+        """The tombstones of the index that holds a file's rows."""
+        if not self.sharded:
+            return self.tombstones
+        return Tombstones(self._workspace_for(title))
+
+    def _revive(self, rows, match_titles=True):
+        """
+        Remove the tombstones of upserted rows, so a file deleted and uploaded again is queried again.
+
+        :param match_titles: Also remove the tombstones of the rows' files, for rows that make up whole files
+        """
+        by_title = {}
+        for row in rows:
+            by_title.setdefault(row.get("title"), []).append(row["id"])
+        for title, ids in by_title.items():
+            self._tombstones_for(title).remove(ids, titles=[title] if match_titles else [])
+
+    def _after_upsert(self, rows):
+        self._revive(rows)
+        self._store_tables(rows)
+
+    def _store_tables(self, rows):
+        """Keep the tables PDFProcessor parsed from a file's pages in the tariff table store of its index."""
+        from grag_api.tariff_tables import TariffTableStore
+        by_title = {}
+        for row in rows:
+            if row.get("tables"):
+                by_title.setdefault(row["title"], []).append(row)
+        for title, pages in by_title.items():
+            TariffTableStore.for_workspace(self._workspace_for(title)).add_pages(pages)
+
+    def _delete_tables(self, title, documents=(), pages=()):
+        """Drop the stored tables of a deleted file or page."""
+        from grag_api.tariff_tables import TariffTableStore
+        store = TariffTableStore.open_existing(self._workspace_for(title))
+        if store is not None:
+            store.delete_documents(documents)
+            store.delete_pages(pages)
+
+    @cached_property
+    def db(self):
+        from grag_api.db import DB
+        return DB()
+
+    @cached_property
+    def pdf_processor(self):
+        from grag_api.extract.pdf_extract import PDFProcessor
+        return PDFProcessor(self.config)
+
+    @cached_property
+    def ingestion_queue(self):
+        from grag_api.ingest import IngestionQueue
+        queue = IngestionQueue(self.workspace, self.db, self.pdf_processor, on_commit=self._after_upsert)
+        queue.start()
+        return queue
+
     def upsert_pdf(self, pdf_path):
         filename = os.path.basename(pdf_path)
         existing_titles = self.db.get_all_titles()
@@ -24,30 +133,79 @@ class GraphRAG:
             print(f"File '{filename}' already exists in the database. Skipping insertion.")
             return
         pdf_data = self.pdf_processor.run(pdf_path)
-        self.db.batch_upsert_data(pdf_data)
+        ids = self.db.batch_upsert_data(pdf_data)
+        self._after_upsert([{**row, "id": id} for row, id in zip(pdf_data, ids)])
+        DOCUMENTS_UPSERTED.labels(source="pdf").inc(len(pdf_data))
+
+    def enqueue_pdf(self, filename, data, retry=False):
+        """
+        Save an uploaded PDF and ingest it in the background; see `ingestion_queue.jobs()` for its status.
+
+        :param retry: Queue the file again if its last attempt failed
+        :return: The job id, or None if the file is already in the dataset, queued, or failed without retry
+        """
+        return self.ingestion_queue.submit(filename, data, retry=retry)
 
     def delete_pdf(self, filename):
+        # queries stop using the file right away; the next index drops it for good
+        self._tombstones_for(filename).add(self.db.get_ids_by_title(filename), title=filename)
         self.db.delete_data_by_title(filename)
+        self._delete_tables(filename, documents=[filename])
 
     def upsert_json(self, json_elements):
+        from grag_api.extract.json_extract import process_json_content
         json_data = process_json_content(json_elements)
-        self.db.batch_upsert_data(json_data)
+        ids = self.db.batch_upsert_data(json_data)
+        self._revive([{**row, "id": id} for row, id in zip(json_data, ids)], match_titles=False)
+        DOCUMENTS_UPSERTED.labels(source="json").inc(len(json_data))
 
     def delete_item(self, id):
+        title = None
+        if self.sharded:
+            dataset = self.db.load_data()
+            titles = dataset.loc[dataset["id"] == id, "title"]
+            title = titles.iloc[0] if len(titles) else None
+            self._tombstones_for(title).add([id])
+        else:
+            self.tombstones.add([id])
         self.db.delete_data([id])
+        self._delete_tables(title, pages=[id])
 
     def get_all_files(self):
         return self.db.get_all_titles()
 
     async def aindex(self):
         dataset = self.db.load_data()
-        await self.indexer.run(dataset)
+        try:
+            with INDEX_SECONDS.time():
+                if self.sharded:
+                    # each shard purges its own tombstones as it is re-indexed
+                    await self.sharded_indexer.run(dataset)
+                else:
+                    await self.indexer.run(dataset)
+        except Exception:
+            INDEX_RUNS.labels(status="error").inc()
+            raise
+        INDEX_RUNS.labels(status="ok").inc()
+        if not self.sharded:
+            self.tombstones.purge(dataset["id"])
 
     async def aquery(self, question, callbacks=[], system_prompt=None):
+        if self.sharded:
+            return await self.router.query(question, callbacks=callbacks, system_prompt=system_prompt)
+        if self.pool is not None:
+            return await self.pool.query(self.workspace, question, callbacks=callbacks, system_prompt=system_prompt)
         return await self.querier.query(question, callbacks=callbacks, system_prompt=system_prompt)
 
+    async def abatch_query(self, questions_path, output_dir, concurrency=8, system_prompt=None):
+        return await abatch_query(self, questions_path, output_dir, concurrency=concurrency, system_prompt=system_prompt)
+
     def get_last_training_time(self):
         index_file_path = os.path.join(self.workspace, "_index")
+        if self.sharded:
+            from grag_api.shards import list_shards, shard_workspace
+            shard_indexes = [shard_workspace(self.workspace, key) / "_index" for key in list_shards(self.workspace)]
+            index_file_path = max(shard_indexes, key=lambda path: path.read_text().strip(), default=index_file_path)
         if not os.path.exists(index_file_path):
             return None
 
@@ -0,0 +1,200 @@
+"""
+Read-only, memory-mapped index generations shared by every process serving a workspace.
+
+The indexer publishes each generation of the query tables as uncompressed Arrow
+IPC files, holding only the columns queriers read, with entity embeddings stored as a fixed-size float32 matrix and the
+LanceDB entity index built once alongside them:
+
+    <workspace>/arena/CURRENT            name of the newest generation
+    <workspace>/arena/<generation>/      one .arrow file per table, plus lancedb/
+
+Workers memory-map the files instead of decoding Parquet into their own heap, so
+the Arrow buffers live once in the OS page cache however many workers attach,
+and no worker has to rebuild (or race to overwrite) the vector store. A new
+generation is written to a temporary directory and renamed into place before
+CURRENT is switched, so readers never see a partial generation.
+"""
+import argparse
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from grag_api.artifact_store import read_artifact, read_artifact_table
+
+log = logging.getLogger(__name__)
+
+ARENA_DIR = "arena"
+CURRENT_FILE = "CURRENT"
+EMBEDDING_COLUMN = "description_embedding"
+LANCEDB_DIR = "lancedb"
+
+
+@dataclass
+class Arena:
+    """One published generation, memory-mapped."""
+
+    generation: str
+    path: Path
+    tables: dict[str, pa.Table]
+
+    @property
+    def lancedb_uri(self) -> str:
+        return str(self.path / LANCEDB_DIR)
+
+    def to_pandas(self, columns: dict[str, list[str]] | None = None,
+                  exclude_columns=(EMBEDDING_COLUMN,)) -> dict[str, pd.DataFrame]:
+        """
+        Convert the tables for the indexer_adapters, leaving out the embedding columns:
+        query-time vector search goes through the published LanceDB index instead.
+
+        :param columns: Optional table -> columns to read; other columns stay in the mapping
+        :param exclude_columns: Columns left out of every table
+        """
+        frames = {}
+        for name, table in self.tables.items():
+            wanted = columns.get(name, table.column_names) if columns is not None else table.column_names
+            frames[name] = table.select(
+                [c for c in table.column_names if c in wanted and c not in exclude_columns]
+            ).to_pandas()
+        return frames
+
+    def embedding_matrix(self, table: str, id_column: str = "id") -> tuple[list[str], np.ndarray] | None:
+        """
+        The embeddings of a table as an (n, dim) float32 array backed by the mapped file, without copying.
+
+        :return: (ids, matrix), or None if the embeddings were published as variable-length lists
+        """
+        arrow_table = self.tables[table]
+        column = arrow_table.column(EMBEDDING_COLUMN).combine_chunks()
+        if not pa.types.is_fixed_size_list(column.type):
+            return None
+        dim = column.type.list_size
+        matrix = column.values.to_numpy(zero_copy_only=True).reshape(-1, dim)
+        return arrow_table.column(id_column).to_pylist(), matrix
+
+
+def _fixed_size_embeddings(table: pa.Table) -> pa.Table:
+    """Store the embedding column as fixed_size_list<float32> so it maps straight to a matrix."""
+    index = table.schema.get_field_index(EMBEDDING_COLUMN)
+    column = table.column(index).combine_chunks()
+    lengths = pc.list_value_length(column).to_numpy(zero_copy_only=False)
+    if column.null_count or len(set(lengths.tolist())) > 1:
+        log.warning("Embeddings are missing or ragged; keeping them as variable-length lists")
+        return table.set_column(index, EMBEDDING_COLUMN, column.cast(pa.list_(pa.float32())))
+    values = pc.cast(column.flatten(), pa.float32())
+    fixed = pa.FixedSizeListArray.from_arrays(values, int(lengths[0]) if len(lengths) else 0)
+    return table.set_column(index, EMBEDDING_COLUMN, fixed)
+
+
+def _write_ipc(table: pa.Table, path: Path):
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def current_generation(arena_root) -> str | None:
+    current_file = Path(arena_root) / CURRENT_FILE
+    if not current_file.exists():
+        return None
+    return current_file.read_text().strip() or None
+
+
+def publish_arena(artifacts_dir, arena_root, generation: str, tables: dict[str, list[str]], build_vector_store=None,
+                  keep: int = 2) -> Path:
+    """
+    Publish the given artifact tables as a new memory-mappable generation and make it current.
+
+    :param artifacts_dir: Directory with the indexer's Parquet artifacts
+    :param arena_root: The workspace's arena directory
+    :param generation: Name of the generation, the index timestamp
+    :param tables: Table -> the columns to publish; columns the artifact lacks are skipped
+    :param build_vector_store: Optional callable(dict of DataFrames, lancedb uri) that builds
+                               the query-time vector store for this generation
+    :param keep: Number of generations kept on disk, so workers still on the previous one can finish
+    :return: The generation's directory
+    """
+    arena_root = Path(arena_root)
+    arena_root.mkdir(parents=True, exist_ok=True)
+    final_dir = arena_root / generation
+    tmp_dir = arena_root / f".{generation}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+
+    for table, columns in tables.items():
+        path = Path(artifacts_dir) / f"{table}.parquet"
+        available = set(pq.read_schema(path).names)
+        arrow_table = read_artifact_table(path, columns=[c for c in columns if c in available])
+        if EMBEDDING_COLUMN in arrow_table.column_names:
+            arrow_table = _fixed_size_embeddings(arrow_table)
+        _write_ipc(arrow_table, tmp_dir / f"{table}.arrow")
+
+    if build_vector_store is not None:
+        frames = {table: read_artifact(Path(artifacts_dir) / f"{table}.parquet") for table in tables}
+        build_vector_store(frames, str(tmp_dir / LANCEDB_DIR))
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    current_tmp = arena_root / f"{CURRENT_FILE}.tmp"
+    current_tmp.write_text(generation)
+    os.replace(current_tmp, arena_root / CURRENT_FILE)
+    log.info("Published arena generation %s", generation)
+
+    generations = sorted(
+        (p for p in arena_root.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for old in generations[:-keep]:
+        if old.name != generation:
+            # workers that still map files from it keep their pages until they switch
+            shutil.rmtree(old, ignore_errors=True)
+    return final_dir
+
+
+def open_arena(arena_root, generation: str | None = None) -> Arena | None:
+    """
+    Memory-map a published generation, by default the current one.
+
+    :return: The Arena, or None if that generation has not been published
+    """
+    generation = generation or current_generation(arena_root)
+    if generation is None:
+        return None
+    path = Path(arena_root) / generation
+    if not path.is_dir():
+        return None
+    tables = {}
+    for ipc_file in path.glob("*.arrow"):
+        # the table's buffers point into the mapping, which stays open as long as they do
+        tables[ipc_file.stem] = pa.ipc.open_file(pa.memory_map(str(ipc_file), "r")).read_all()
+    return Arena(generation=generation, path=path, tables=tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a workspace's current index as a shared arena.")
+    parser.add_argument("workspace", nargs="?", default="ragtest")
+    args = parser.parse_args()
+
+    from grag_api.query import ARENA_COLUMNS, build_entity_vector_store
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    workspace = Path(args.workspace)
+    generation = (workspace / "_index").read_text().strip()
+    publish_arena(
+        workspace / "output" / "graph" / "artifacts",
+        workspace / ARENA_DIR,
+        generation,
+        ARENA_COLUMNS,
+        build_entity_vector_store,
+    )
+
+
+if __name__ == "__main__":
+    main()
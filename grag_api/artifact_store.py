@@ -0,0 +1,241 @@
+"""
+Content-addressed, zstd-compressed storage for the large text columns of index artifacts.
+
+graphrag writes every workflow's output as its own Parquet file, so the same
+bodies are stored several times over: create_base_documents and
+create_final_documents both hold every document's raw_content, the chunks of
+create_base_text_units are the texts of create_final_text_units, and each
+entity graph is kept before and after summarization. After a run the large
+text columns are moved into <artifacts>/blobs.sqlite, one zstd-compressed
+blob per distinct value keyed by its SHA-256, and the artifacts keep the key in
+place of the value, with the compacted columns listed in the Parquet schema
+metadata. The artifacts themselves are rewritten with zstd.
+
+read_artifact_table and read_artifact read an artifact with its blob columns
+resolved, so code reading text columns goes through them instead of Parquet.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from grag_api.metrics import ARTIFACT_BLOBS
+
+log = logging.getLogger(__name__)
+
+BLOB_STORE_FILE = "blobs.sqlite"
+BLOB_COLUMNS_KEY = b"grag.blob_columns"
+DEFAULT_ZSTD_LEVEL = 3
+# keys per SQLite lookup, below its bound variable limit
+LOOKUP_CHUNK = 500
+
+# artifact table -> text columns stored in the blob store
+BLOB_COLUMNS = {
+    "create_base_documents": ["raw_content"],
+    "create_final_documents": ["raw_content"],
+    "create_base_text_units": ["chunk"],
+    "create_final_text_units": ["text"],
+    "create_base_extracted_entities": ["entity_graph"],
+    "create_summarized_entities": ["entity_graph"],
+    "create_final_community_reports": ["full_content", "full_content_json"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+)
+"""
+
+
+def blob_key(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class BlobStore:
+    """Text values by the SHA-256 of their content, zstd-compressed in a SQLite file."""
+
+    def __init__(self, path, zstd_level: int = DEFAULT_ZSTD_LEVEL):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.codec = pa.Codec("zstd", compression_level=zstd_level)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def keys(self) -> set[str]:
+        with self._connect() as conn:
+            return {key for key, in conn.execute("SELECT key FROM blobs")}
+
+    def _existing(self, conn, keys: list[str]) -> set[str]:
+        existing = set()
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            existing.update(key for key, in conn.execute(
+                f"SELECT key FROM blobs WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return existing
+
+    def get_many(self, keys) -> dict[str, str]:
+        keys = list(keys)
+        values = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                for key, size, data in conn.execute(
+                        f"SELECT key, size, data FROM blobs WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    values[key] = self.codec.decompress(data, decompressed_size=size, asbytes=True).decode("utf-8")
+        return values
+
+    def put_many(self, values: dict[str, str]) -> int:
+        """
+        Store values under their keys, skipping keys already stored.
+
+        :return: The number of new blobs
+        """
+        with self._connect() as conn:
+            stored = self._existing(conn, list(values))
+            rows = []
+            for key, value in values.items():
+                if key in stored:
+                    continue
+                data = value.encode("utf-8")
+                rows.append((key, len(data), self.codec.compress(data, asbytes=True)))
+            conn.executemany("INSERT OR IGNORE INTO blobs (key, size, data) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def retain(self, keys: set[str]) -> int:
+        """
+        Delete every blob whose key is not in keys, and give the space back to the file system.
+
+        :return: The number of blobs deleted
+        """
+        unreferenced = [(key,) for key in self.keys() - keys]
+        if unreferenced:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM blobs WHERE key = ?", unreferenced)
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return len(unreferenced)
+
+
+def blob_columns(schema: pa.Schema) -> list[str]:
+    """The columns of an artifact whose values are blob keys."""
+    metadata = schema.metadata or {}
+    return json.loads(metadata[BLOB_COLUMNS_KEY]) if BLOB_COLUMNS_KEY in metadata else []
+
+
+def _with_blob_columns(table: pa.Table, columns: list[str]) -> pa.Table:
+    metadata = {key: value for key, value in (table.schema.metadata or {}).items() if key != BLOB_COLUMNS_KEY}
+    if columns:
+        metadata[BLOB_COLUMNS_KEY] = json.dumps(columns).encode("utf-8")
+    return table.replace_schema_metadata(metadata)
+
+
+def _write_table(table: pa.Table, path: Path, zstd_level: int):
+    """Write an artifact next to itself and rename it into place, so readers see the old or the new file."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_path, compression="zstd", compression_level=zstd_level)
+    os.replace(tmp_path, path)
+
+
+def read_artifact_table(path, columns: list[str] | None = None) -> pa.Table:
+    """
+    Read an artifact as an Arrow table, with the values of its blob columns read from the blob store.
+
+    :param path: The artifact's Parquet file
+    :param columns: Optional columns to read
+    """
+    path = Path(path)
+    table = pq.read_table(path, columns=columns)
+    compacted = [column for column in blob_columns(pq.read_schema(path)) if column in table.column_names]
+    if not compacted:
+        return _with_blob_columns(table, [])
+    store = BlobStore(path.parent / BLOB_STORE_FILE)
+    for column in compacted:
+        keys = table.column(column).to_pylist()
+        values = store.get_many({key for key in keys if key is not None})
+        missing = {key for key in keys if key is not None} - values.keys()
+        if missing:
+            raise KeyError(f"{len(missing)} blobs of {path.name}:{column} are missing from {store.path}")
+        table = table.set_column(
+            table.column_names.index(column),
+            column,
+            pa.array([values[key] if key is not None else None for key in keys], type=pa.string()),
+        )
+    return _with_blob_columns(table, [])
+
+
+def read_artifact(path, columns: list[str] | None = None) -> pd.DataFrame:
+    """Read an artifact as a DataFrame, with its blob columns resolved."""
+    return read_artifact_table(path, columns).to_pandas()
+
+
+def compact_artifacts(artifacts_dir, zstd_level: int = DEFAULT_ZSTD_LEVEL):
+    """
+    Move the large text columns of an index run's artifacts into the blob store and rewrite
+    every artifact with zstd. Blobs no longer referenced by any artifact are deleted.
+
+    Run once after indexing, before the lexical index and arena are built from the artifacts.
+
+    :param artifacts_dir: Directory holding the pipeline's parquet artifacts
+    :param zstd_level: zstd level for the blobs and the Parquet files
+    """
+    artifacts_dir = Path(artifacts_dir)
+    store = BlobStore(artifacts_dir / BLOB_STORE_FILE, zstd_level)
+    referenced = set()
+    for path in sorted(artifacts_dir.glob("*.parquet")):
+        table = pq.read_table(path)
+        compacted = blob_columns(table.schema)
+        for column in BLOB_COLUMNS.get(path.stem, []):
+            if column in compacted or column not in table.column_names:
+                continue
+            if not pa.types.is_string(table.schema.field(column).type) and \
+                    not pa.types.is_large_string(table.schema.field(column).type):
+                continue
+            values = table.column(column).to_pylist()
+            keys = [blob_key(value) if value is not None else None for value in values]
+            blobs = {key: value for key, value in zip(keys, values) if key is not None}
+            new = store.put_many(blobs)
+            ARTIFACT_BLOBS.labels(status="stored").inc(new)
+            ARTIFACT_BLOBS.labels(status="deduplicated").inc(len(values) - new)
+            table = table.set_column(table.column_names.index(column), column, pa.array(keys, type=pa.string()))
+            compacted.append(column)
+        for column in compacted:
+            referenced.update(key for key in table.column(column).to_pylist() if key is not None)
+        _write_table(_with_blob_columns(table, compacted), path, zstd_level)
+    deleted = store.retain(referenced)
+    log.info("Compacted artifacts in %s: %s blobs referenced, %s deleted", artifacts_dir, len(referenced), deleted)
+
+
+def expand_artifacts(artifacts_dir):
+    """
+    Write the blob columns of compacted artifacts back into the Parquet files.
+
+    graphrag reads the output of skipped workflows from the artifacts directory, so a run
+    that skips workflows needs them as the pipeline wrote them.
+    """
+    for path in sorted(Path(artifacts_dir).glob("*.parquet")):
+        if blob_columns(pq.read_schema(path)):
+            _write_table(read_artifact_table(path), path, DEFAULT_ZSTD_LEVEL)
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ["id", "question", "response", "latency", "prompt_tokens", "completion_time", "llm_calls"]
+
+
+def read_questions(questions_path) -> list[dict]:
+    """
+    Read questions from a JSONL file.
+
+    Each line is an object shaped like requests.jsonl: the id is taken from
+    'request_id' (or 'id') and the question from 'question' (or 'body', then 'title').
+
+    :param questions_path: Path to the JSONL file
+    :return: A list of {'id', 'question'} dictionaries
+    """
+    questions = []
+    with open(questions_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            questions.append({
+                "id": str(item.get("request_id") or item.get("id") or line_number),
+                "question": item.get("question") or item.get("body") or item.get("title"),
+            })
+    return questions
+
+
+def load_completed_ids(output_dir) -> set[str]:
+    """
+    Collect the ids already answered in previous (possibly interrupted) runs.
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.exists():
+        return set()
+    completed = set()
+    for part in sorted(output_dir.glob("part-*.parquet")):
+        completed.update(pd.read_parquet(part, columns=["id"])["id"].astype(str))
+    return completed
+
+
+def load_results(output_dir) -> pd.DataFrame:
+    """
+    Load all result parts written by a batch run into one DataFrame.
+    """
+    parts = sorted(Path(output_dir).glob("part-*.parquet"))
+    if not parts:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+
+
+class _PartWriter:
+    """Writes result rows as numbered Parquet parts, each one atomically."""
+
+    def __init__(self, output_dir, flush_every: int):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+        self.rows = []
+        existing = [int(part.stem.split("-")[1]) for part in self.output_dir.glob("part-*.parquet")]
+        self.next_part = max(existing, default=-1) + 1
+
+    def add(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        part_path = self.output_dir / f"part-{self.next_part:05d}.parquet"
+        tmp_path = part_path.with_suffix(".parquet.tmp")
+        pd.DataFrame(self.rows, columns=RESULT_COLUMNS).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, part_path)
+        self.next_part += 1
+        self.rows = []
+
+
+async def abatch_query(
+        grag,
+        questions_path,
+        output_dir,
+        concurrency: int = 8,
+        flush_every: int = 20,
+        system_prompt=None,
+) -> pd.DataFrame:
+    """
+    Answer every question in a JSONL file through GraphRAG.aquery with bounded concurrency.
+
+    Results are written incrementally as Parquet parts in output_dir. Re-running
+    with the same output_dir skips questions that already have a result, so an
+    interrupted run resumes where it stopped. Failed or empty answers are not
+    written, so they are asked again on the next run.
+
+    :param grag: A GraphRAG instance
+    :param questions_path: JSONL file with the questions
+    :param output_dir: Directory that receives the result parts
+    :param concurrency: Maximum number of queries in flight
+    :param flush_every: Number of results buffered before a part is written
+    :param system_prompt: Optional system prompt passed to every query
+    :return: All results, including those from previous runs
+    """
+    completed = load_completed_ids(output_dir)
+    pending = [q for q in read_questions(questions_path) if q["id"] not in completed]
+    log.info("Batch query: %s already answered, %s pending", len(completed), len(pending))
+
+    writer = _PartWriter(output_dir, flush_every)
+    queue = asyncio.Queue()
+    for question in pending:
+        queue.put_nowait(question)
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start_time = time.time()
+            try:
+                result = await grag.aquery(item["question"], callbacks=[], system_prompt=system_prompt)
+            except Exception:
+                log.exception("Batch query failed for %s", item["id"])
+                continue
+            if not result.response:
+                # the search swallows LLM errors into an empty answer; leave it for the next run
+                log.warning("Batch query got no answer for %s", item["id"])
+                continue
+            writer.add({
+                "id": item["id"],
+                "question": item["question"],
+                "response": result.response if isinstance(result.response, str) else json.dumps(result.response),
+                "latency": result.latency,
+                "prompt_tokens": result.prompt_tokens,
+                "completion_time": result.completion_time,
+                "llm_calls": result.llm_calls,
+            })
+            log.info("Answered %s in %.2fs", item["id"], time.time() - start_time)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(max(concurrency, 1))])
+    finally:
+        writer.flush()
+    return load_results(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with GraphRAG.")
+    parser.add_argument("questions", help="JSONL file, one question object per line")
+    parser.add_argument("output_dir", help="Directory for the Parquet result parts")
+    parser.add_argument("--workspace", default="ragtest")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flush-every", type=int, default=20)
+    parser.add_argument("--system-prompt-file", default=None)
+    args = parser.parse_args()
+
+    from grag_api import GraphRAG
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    system_prompt = Path(args.system_prompt_file).read_text() if args.system_prompt_file else None
+    grag = GraphRAG(workspace=args.workspace)
+    results = asyncio.run(abatch_query(
+        grag,
+        args.questions,
+        args.output_dir,
+        concurrency=args.concurrency,
+        flush_every=args.flush_every,
+        system_prompt=system_prompt,
+    ))
+    print(f"{len(results)} results in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
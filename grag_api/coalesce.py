@@ -0,0 +1,130 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+
+from graphrag.query.llm.base import BaseLLMCallback
+
+log = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a question for de-duplication: case and whitespace do not change the answer."""
+    return " ".join(query.lower().split())
+
+
+class FanOutCallback(BaseLLMCallback):
+    """
+    Forward streamed tokens from one LLM call to every subscribed caller.
+
+    Callers that join late first receive the tokens streamed so far, unless they
+    subscribe with replay=False. Each subscriber's callbacks run on the event loop
+    that subscribed them, so UI callbacks stay on their own session thread.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._subscribers: list[tuple[asyncio.AbstractEventLoop | None, list[BaseLLMCallback]]] = []
+
+    def subscribe(self, callbacks: list[BaseLLMCallback], loop: asyncio.AbstractEventLoop | None = None,
+                  replay: bool = True):
+        with self._lock:
+            if replay:
+                for token in self.response:
+                    self._deliver(loop, callbacks, token)
+            self._subscribers.append((loop, list(callbacks)))
+
+    def on_llm_new_token(self, token: str):
+        with self._lock:
+            super().on_llm_new_token(token)
+            for loop, callbacks in self._subscribers:
+                self._deliver(loop, callbacks, token)
+
+    @staticmethod
+    def _deliver(loop, callbacks, token):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        for callback in callbacks:
+            if loop is None or loop is running_loop:
+                callback.on_llm_new_token(token)
+            else:
+                loop.call_soon_threadsafe(callback.on_llm_new_token, token)
+
+
+class _Flight:
+    def __init__(self):
+        self.fan_out = FanOutCallback()
+        self.future = concurrent.futures.Future()
+
+
+class _LeaderCancelled(Exception):
+    """Set on a flight whose leading caller was cancelled, so its followers run the search again."""
+
+
+class SingleFlight:
+    """
+    Share one in-flight search between concurrent callers with the same key.
+
+    The first caller runs the search; callers arriving while it is in flight
+    subscribe to its token stream and await its result instead of issuing their
+    own embedding and LLM calls. Safe across threads and event loops. If the
+    first caller is cancelled, e.g. because its client went away, the callers
+    waiting on it start the search again, one of them leading it; having already
+    streamed the cancelled search's tokens, they are not replayed the new one's.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+
+    async def run(
+            self,
+            key: Hashable,
+            search: Callable[[BaseLLMCallback], Awaitable],
+            callbacks: list[BaseLLMCallback] | None = None,
+            replay: bool = True,
+    ):
+        """
+        :param key: Identifies identical requests
+        :param search: Runs the search, streaming tokens into the given callback
+        :param callbacks: This caller's token callbacks
+        :param replay: Whether joining an in-flight search first delivers the tokens it streamed so far
+        :return: The (shared) search result
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            flight.fan_out.subscribe(callbacks or [], loop, replay)
+
+        name = key[0] if isinstance(key, tuple) else key
+        if not leader:
+            log.info("Joining in-flight search for %s", name)
+            try:
+                # shielded, so a follower that is cancelled leaves the shared future alone
+                return await asyncio.shield(asyncio.wrap_future(flight.future))
+            except _LeaderCancelled:
+                log.info("Leading search for %s was cancelled, searching again", name)
+                return await self.run(key, search, callbacks, replay=False)
+
+        try:
+            result = await search(flight.fan_out)
+        except BaseException as e:
+            # the flight is unregistered first, so followers that search again start a new one
+            self._land(key, flight)
+            flight.future.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        self._land(key, flight)
+        flight.future.set_result(result)
+        return result
+
+    def _land(self, key: Hashable, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
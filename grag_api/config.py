@@ -10,6 +10,15 @@ DEFAULT_CONFIG = {
     "r2_bucket_name": os.environ.get("R2_BUCKET_NAME"),
     "r2_public_url": os.environ.get("R2_PUBLIC_URL"),
     "openai_api_key": os.environ.get("OPENAI_API_KEY"),
+    # PDF images are downscaled to max_side, recompressed and captioned batch_size per request;
+    # rate-limited and failed requests are retried max_retries times with exponential backoff
+    "image_captions": {
+        "batch_size": 8,
+        "max_side": 768,
+        "jpeg_quality": 80,
+        "max_retries": 4,
+        "retry_delay": 1.0,
+    },
     "encoding_model": "cl100k_base",
     "skip_workflows": [],
     "llm": {
@@ -64,10 +73,32 @@ DEFAULT_CONFIG = {
         "entity_types": ["organization", "person", "geo", "event"],
         "max_gleanings": 1,
     },
+    # small text units are packed into one extraction request of up to pack_tokens, and
+    # a gleaning pass only runs when the first answer looks incomplete
+    "extraction_planner": {
+        "enabled": True,
+        "pack_tokens": 7000,
+        "min_entity_density": 3,
+    },
+    # entity extraction through a work queue that worker processes on any host sharing
+    # the workspace can serve (python -m grag_api.extraction_queue --workspace ...)
+    "extraction_queue": {
+        "enabled": False,
+        "local_workers": 0,
+        "task_size": 16,
+        "lease_seconds": 600,
+        "max_attempts": 3,
+    },
     "summarize_descriptions": {
         "prompt": "prompts/summarize_descriptions.txt",
         "max_length": 500,
     },
+    # descriptions within max_length words are kept as they are; the rest are summarized
+    # batch_size to a call and cached in the workspace by entity and description set
+    "summarize_batches": {
+        "batch_size": 16,
+        "batch_max_tokens": 8000,
+    },
     "claim_extraction": {
         "prompt": "prompts/claim_extraction.txt",
         "description": "Any claims or facts that could be relevant to information discovery.",
@@ -87,25 +118,38 @@ DEFAULT_CONFIG = {
     "umap": {
         "enabled": False,
     },
+    # large text columns of the artifacts are stored once, zstd-compressed, in
+    # output/graph/artifacts/blobs.sqlite and the Parquet files keep their keys
+    "artifact_store": {
+        "enabled": True,
+        "zstd_level": 3,
+    },
     "snapshots": {
         "graphml": False,
         "raw_entities": False,
         "top_level_nodes": False,
     },
+    # rate and charge questions that match parsed tariff table rows are answered from
+    # the top_k_rows matching rows instead of the graph's local search context
+    "table_lookup": {
+        "enabled": True,
+        "top_k_rows": 30,
+    },
     "local_search": {},
     "global_search": {},
 }
 
 
-def load_config(api_key=None):
+def load_config(api_key=None, api_base=None):
     """
-    Load the configuration and optionally replace the API key.
+    Load the configuration and optionally replace the API key and base URL.
 
     Args:
         api_key (str, optional): The API key to use. If None, the default key will be used.
+        api_base (str, optional): An OpenAI-compatible base URL. If None, the OpenAI API is used.
 
     Returns:
-        dict: The configuration dictionary with the API key replaced if provided.
+        dict: The configuration dictionary with the API key and base URL replaced if provided.
     """
     config = copy.deepcopy(DEFAULT_CONFIG)
 
@@ -118,5 +162,8 @@ def load_config(api_key=None):
         # Replace the API key in the embeddings LLM configuration
         config['embeddings']['llm']['api_key'] = api_key
 
+    if api_base is not None:
+        config['llm']['api_base'] = api_base
+        config['embeddings']['llm']['api_base'] = api_base
 
     return config
@@ -0,0 +1,725 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, cast
+
+import pandas as pd
+
+from graphrag.model import Entity, Relationship
+from graphrag.query.context_builder.conversation_history import ConversationHistory
+from graphrag.query.context_builder.entity_extraction import map_query_to_entities
+from graphrag.query.context_builder.local_context import _filter_relationships
+from graphrag.query.context_builder.source_context import count_relationships
+from graphrag.query.structured_search.local_search.mixed_context import LocalSearchMixedContext
+
+from grag_api.lexical import LexicalIndex, is_code_query
+from grag_api.metrics import LEXICAL_SEARCHES
+from grag_api.tariff_tables import TariffStores, is_lookup_query
+from grag_api.tokens import estimate_tokens
+from grag_api.tombstones import DeletedContent
+from grag_api.tracing import span
+
+log = logging.getLogger(__name__)
+
+# relative value of a top-ranked row in each section when packing by relevance per token
+SECTION_WEIGHTS = {
+    "Reports": 1.5,
+    "Entities": 1.0,
+    "Relationships": 0.5,
+    "Tables": 2.0,
+    "Sources": 3.0,
+}
+
+# rank offset of reciprocal rank fusion between entity-ranked and BM25-ranked sources
+RRF_K = 60
+
+# words that signal a question wants many rows back (every carrier, a comparison, a table)
+BROAD_QUERY_TERMS = {
+    "all", "each", "every", "compare", "comparison", "versus", "vs", "list",
+    "table", "carriers", "differences", "difference", "summarize", "overview",
+}
+
+
+class _TracedTextEmbedding:
+    """Wraps the query embedder so the embedding call shows up as its own span."""
+
+    def __init__(self, text_embedder):
+        self.text_embedder = text_embedder
+
+    def embed(self, text: str, **kwargs):
+        with span("query_embedding"):
+            return self.text_embedder.embed(text, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.text_embedder, name)
+
+
+@dataclass
+class ContextCandidate:
+    """A row that may be placed in the context window."""
+
+    section: str
+    id: str
+    record: list[str]
+    tokens: int
+    score: float
+    # a body whose token count is known is only read once the row is packed into the context
+    body_index: int | None = None
+    fetch_body: Callable[[], str] | None = None
+
+    def materialize(self) -> list[str]:
+        """The record, with its deferred body read in."""
+        if self.body_index is not None and self.record[self.body_index] is None:
+            self.record[self.body_index] = self.fetch_body() or ""
+        return self.record
+
+
+def _row_tokens(record: list[str], body_index: int, body_tokens: int | None) -> int:
+    """Token cost of one table row: the precomputed body count plus cheap estimates for the short fields."""
+    tokens = len(record)  # one delimiter per field, plus the trailing newline
+    for index, field in enumerate(record):
+        if index == body_index and body_tokens is not None:
+            tokens += body_tokens
+        else:
+            tokens += estimate_tokens(field)
+    return tokens
+
+
+def _deferred(body_tokens: int | None, obj, attribute: str) -> str | None:
+    """None (read when packed) if the body's token count is known, otherwise the body itself, to be estimated."""
+    return None if body_tokens is not None else getattr(obj, attribute)
+
+
+def _score(section: str, position: int, count: int) -> float:
+    """Relevance of a row from its rank within the section's ordering."""
+    return SECTION_WEIGHTS[section] * (1 - position / max(count, 1))
+
+
+def _header_tokens(section: str, header: list[str], column_delimiter: str = "|") -> int:
+    return estimate_tokens(f"-----{section}-----\n" + column_delimiter.join(header) + "\n")
+
+
+def _pack_records(
+        context_name: str,
+        header: list[str],
+        candidates,
+        max_tokens: int,
+        column_delimiter: str = "|",
+) -> tuple[str, pd.DataFrame, int]:
+    """
+    Add candidates to a context table, in order, until the token budget is reached.
+
+    :return: The context text, the records that made it in, and their token cost
+    """
+    current_context_text = f"-----{context_name}-----" + "\n"
+    current_context_text += column_delimiter.join(header) + "\n"
+    current_tokens = _header_tokens(context_name, header, column_delimiter)
+    all_context_records = []
+
+    for candidate in candidates:
+        if current_tokens + candidate.tokens > max_tokens:
+            break
+        record = candidate.materialize()
+        current_context_text += column_delimiter.join(record) + "\n"
+        all_context_records.append(record)
+        current_tokens += candidate.tokens
+
+    if all_context_records:
+        record_df = pd.DataFrame(all_context_records, columns=cast(Any, header))
+    else:
+        record_df = pd.DataFrame()
+    return current_context_text, record_df, current_tokens
+
+
+def query_complexity(query: str) -> float:
+    """
+    Rough 0..1 estimate of how much context a question needs.
+
+    Short single-fact lookups score low; long, enumerative or comparative
+    questions ("all carriers", "compare", several clauses) score high.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return 0.0
+    complexity = 0.4 * min(len(words) / 40, 1.0)
+    if BROAD_QUERY_TERMS.intersection(words):
+        complexity += 0.3
+    clauses = sum(1 for word in words if word in ("and", "or")) + query.count(",") + max(query.count("?") - 1, 0)
+    complexity += min(0.1 * clauses, 0.3)
+    return min(complexity, 1.0)
+
+
+def context_budget(query: str, min_tokens: int, max_tokens: int) -> int:
+    """Token budget that grows from min_tokens to max_tokens with query complexity."""
+    min_tokens = min(min_tokens, max_tokens)
+    return int(min_tokens + query_complexity(query) * (max_tokens - min_tokens))
+
+
+def select_candidates(
+        candidates: list[ContextCandidate],
+        budget: int,
+) -> tuple[list[ContextCandidate], list[ContextCandidate]]:
+    """
+    Choose the set of candidates with the most relevance that fits the budget.
+
+    Greedy 0/1 knapsack by relevance per token: rows that do not fit are skipped
+    so that smaller, still valuable rows can fill the remaining space.
+
+    :return: The selected and the dropped candidates
+    """
+    selected, dropped = [], []
+    used_tokens = 0
+    for candidate in sorted(candidates, key=lambda c: c.score / max(c.tokens, 1), reverse=True):
+        if candidate.score > 0 and used_tokens + candidate.tokens <= budget:
+            selected.append(candidate)
+            used_tokens += candidate.tokens
+        else:
+            dropped.append(candidate)
+    return selected, dropped
+
+
+def pack_sections(
+        query: str,
+        sections: dict[str, tuple[list[str], list[ContextCandidate]]],
+        min_tokens: int = 2000,
+        max_tokens: int = 8000,
+        community_context_name: str = "Reports",
+        column_delimiter: str = "|",
+) -> tuple[str, dict[str, pd.DataFrame]]:
+    """
+    Select candidates by relevance per token under the query's adaptive budget and pack them
+    into context tables.
+
+    :param sections: Section name -> (table header, candidates in rank order)
+    :return: The context text and the records of each section, plus the "dropped" rows
+    """
+    with span("candidate_selection") as selection_span:
+        # the best-ranked source is kept first if it fits the adaptive budget, and counts
+        # against it; the rest of the budget is filled by relevance per token
+        budget = context_budget(query, min_tokens, max_tokens)
+        header_tokens = sum(
+            _header_tokens(name, header, column_delimiter) for name, (header, _) in sections.items()
+        )
+        pinned = []
+        sources = sections["Sources"][1]
+        if sources and sources[0].tokens + header_tokens <= budget:
+            pinned = [sources[0]]
+        pinned_tokens = sum(candidate.tokens for candidate in pinned)
+        budget = max(budget - pinned_tokens - header_tokens, 0)
+
+        pinned_ids = {(c.section, c.id) for c in pinned}
+        candidates = [
+            candidate
+            for _, section_candidates in sections.values()
+            for candidate in section_candidates
+            if (candidate.section, candidate.id) not in pinned_ids
+        ]
+        selected, dropped = select_candidates(candidates, budget)
+        selected_ids = pinned_ids | {(c.section, c.id) for c in selected}
+        if selection_span is not None:
+            selection_span.attributes.update(budget=budget, kept=len(selected_ids), dropped=len(dropped))
+    log.info(
+        "Adaptive context budget %s (+%s pinned) for query: %s. Kept %s rows, dropped %s.",
+        budget, pinned_tokens, query, len(selected_ids), len(dropped),
+    )
+
+    with span("context_packing"):
+        final_context = []
+        final_context_data = {}
+        for name, (header, section_candidates) in sections.items():
+            kept = [c for c in section_candidates if (c.section, c.id) in selected_ids]
+            context_text, record_df, _ = _pack_records(name, header, kept, max_tokens, column_delimiter)
+            final_context_data[name.lower()] = record_df
+            if record_df.empty:
+                continue
+            if name == community_context_name:
+                context_text = record_df.to_csv(index=False, sep=column_delimiter)
+            final_context.append(context_text)
+
+    final_context_data["dropped"] = pd.DataFrame(
+        [[c.section, c.id, c.tokens, c.score] for c in dropped],
+        columns=["section", "id", "tokens", "score"],
+    )
+    return "\n\n".join(final_context), final_context_data
+
+
+class CustomMixedContext(LocalSearchMixedContext):
+    """
+    Local search context builder that packs the context window by token counts
+    computed at index time instead of re-encoding every candidate on each query.
+
+    Text units use their own `n_tokens`; entities, relationships and community
+    reports look their body counts up by id. Anything without a stored count falls
+    back to a cheap estimate. The assembled prompt is encoded once by the search.
+    Text-unit and report bodies with a known count are only read when their row
+    is packed, so lazily loaded bodies are fetched for the final context alone.
+
+    With `adaptive_budget=True` the fixed section proportions are replaced by a
+    single relevance-per-token selection under a budget that scales with the
+    query, and the rows left out are reported under the "dropped" key.
+
+    `deleted` holds the rows of documents deleted since the last index: their
+    text units, and entities and relationships supported only by them, are left
+    out; rows that lost part of their support are scored down accordingly.
+
+    With a `lexical_index`, sources are ranked by fusing the entity ranking with
+    BM25 over the text units, and a query made up mostly of exact codes (item
+    numbers, classes, SCACs) takes its entities from the matching units instead
+    of embedding the query at all.
+
+    With a `workspace`, rate and charge questions also get the rows of the workspace's
+    tariff tables that match them, as a "Tables" section, read through `table_stores`
+    when the querier shares its open stores.
+    """
+
+    def __init__(
+            self,
+            entity_token_counts: dict[str, int] | None = None,
+            relationship_token_counts: dict[str, int] | None = None,
+            report_token_counts: dict[str, int] | None = None,
+            deleted: DeletedContent | None = None,
+            lexical_index: LexicalIndex | None = None,
+            workspace=None,
+            table_stores: TariffStores | None = None,
+            **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.entity_token_counts = entity_token_counts or {}
+        self.relationship_token_counts = relationship_token_counts or {}
+        self.report_token_counts = report_token_counts or {}
+        self.deleted = deleted or DeletedContent()
+        self.lexical_index = lexical_index
+        self.workspace = workspace
+        self.table_stores = table_stores or TariffStores()
+        self._relationship_list = list(self.relationships.values())
+        if self.text_embedder is not None:
+            self.text_embedder = _TracedTextEmbedding(self.text_embedder)
+
+    def _live_entities(self, entities: list[Entity]) -> list[Entity]:
+        if not self.deleted:
+            return entities
+        return [entity for entity in entities if entity.id not in self.deleted.entity_ids]
+
+    def build_context(
+            self,
+            query: str,
+            conversation_history: ConversationHistory | None = None,
+            adaptive_budget: bool = False,
+            min_tokens: int = 2000,
+            **kwargs,
+    ) -> tuple[str | list[str], dict[str, pd.DataFrame]]:
+        if not adaptive_budget or conversation_history or kwargs.get("return_candidate_context") or self.covariates:
+            return super().build_context(query=query, conversation_history=conversation_history, **kwargs)
+        return self._build_adaptive_context(query, min_tokens=min_tokens, **kwargs)
+
+    def _build_adaptive_context(
+            self,
+            query: str,
+            min_tokens: int = 2000,
+            max_tokens: int = 8000,
+            community_context_name: str = "Reports",
+            column_delimiter: str = "|",
+            **kwargs,
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        sections = self.candidate_sections(query, community_context_name=community_context_name, **kwargs)
+        return pack_sections(query, sections, min_tokens, max_tokens, community_context_name, column_delimiter)
+
+    def candidate_sections(
+            self,
+            query: str,
+            include_entity_names: list[str] | None = None,
+            exclude_entity_names: list[str] | None = None,
+            top_k_mapped_entities: int = 10,
+            top_k_relationships: int = 10,
+            include_community_rank: bool = False,
+            include_entity_rank: bool = False,
+            rank_description: str = "number of relationships",
+            include_relationship_weight: bool = False,
+            relationship_ranking_attribute: str = "rank",
+            use_community_summary: bool = False,
+            min_community_rank: int = 0,
+            community_context_name: str = "Reports",
+            text_embedder=None,
+            top_k_lexical_units: int = 20,
+            top_k_table_rows: int = 10,
+            **kwargs,
+    ) -> dict[str, tuple[list[str], list[ContextCandidate]]]:
+        """
+        The rows that may go into the context for a query, ranked within each section.
+
+        :param text_embedder: Embeds the query instead of this builder's embedder, e.g. to reuse
+                              one embedding across several builders
+        :param top_k_lexical_units: Text units taken from the BM25 index, if there is one
+        :param top_k_table_rows: Tariff table rows offered for a rate or charge question
+        :return: Section name -> (table header, candidates in rank order)
+        """
+        lexical_units = self._lexical_units(query, top_k_lexical_units)
+        lexical_only = bool(lexical_units) and is_code_query(query) and not include_entity_names
+        if lexical_only:
+            # exact codes: the matching units name the entities, no embedding round trip needed
+            LEXICAL_SEARCHES.labels(mode="lexical_only").inc()
+            selected_entities = self._unit_entities(lexical_units, exclude_entity_names or [], top_k_mapped_entities)
+        else:
+            if lexical_units:
+                LEXICAL_SEARCHES.labels(mode="hybrid").inc()
+            with span("vector_search", k=top_k_mapped_entities):
+                selected_entities = map_query_to_entities(
+                    query=query,
+                    text_embedding_vectorstore=self.entity_text_embeddings,
+                    text_embedder=text_embedder or self.text_embedder,
+                    all_entities=list(self.entities.values()),
+                    embedding_vectorstore_key=self.embedding_vectorstore_key,
+                    include_entity_names=include_entity_names or [],
+                    exclude_entity_names=exclude_entity_names or [],
+                    k=top_k_mapped_entities,
+                    oversample_scaler=2,
+                )
+        selected_entities = self._live_entities(selected_entities)
+
+        with span("candidate_ranking"):
+            return {
+                community_context_name: self._report_candidates(
+                    selected_entities, use_community_summary, include_community_rank, min_community_rank
+                ),
+                "Entities": self._entity_candidates(selected_entities, include_entity_rank, rank_description),
+                "Relationships": self._relationship_candidates(
+                    selected_entities, include_relationship_weight, top_k_relationships, relationship_ranking_attribute
+                ),
+                "Tables": self._table_candidates(query, top_k_table_rows),
+                "Sources": self._text_unit_candidates(selected_entities, lexical_units, lexical_only),
+            }
+
+    def _lexical_units(self, query: str, k: int) -> list[str]:
+        """Ids of the live text units that best match the query's terms, best first."""
+        if self.lexical_index is None or k <= 0:
+            return []
+        with span("lexical_search", k=k):
+            return [
+                unit_id for unit_id, _ in self.lexical_index.search(query, k)
+                if unit_id in self.text_units and unit_id not in self.deleted.text_unit_ids
+            ]
+
+    def _unit_entities(self, unit_ids: list[str], exclude_entity_names: list[str], k: int) -> list[Entity]:
+        """The entities of the given text units, in the units' order."""
+        selected, seen = [], set()
+        for unit_id in unit_ids:
+            for entity_id in self.text_units[unit_id].entity_ids or []:
+                entity = self.entities.get(entity_id)
+                if entity is None or entity_id in seen or entity.title in exclude_entity_names:
+                    continue
+                seen.add(entity_id)
+                selected.append(entity)
+                if len(selected) >= k:
+                    return selected
+        return selected
+
+    def _report_candidates(
+            self,
+            selected_entities: list[Entity],
+            use_community_summary: bool = False,
+            include_community_rank: bool = False,
+            min_community_rank: int = 0,
+            context_name: str = "Reports",
+    ) -> tuple[list[str], list[ContextCandidate]]:
+        header = ["id", "title", "summary" if use_community_summary else "content"]
+        if include_community_rank:
+            header.append("rank")
+
+        community_matches = {}
+        for entity in selected_entities:
+            for community_id in entity.community_ids or []:
+                community_matches[community_id] = community_matches.get(community_id, 0) + 1
+
+        # sort communities by number of matched entities and rank
+        selected_reports = [
+            self.community_reports[community_id]
+            for community_id in community_matches
+            if community_id in self.community_reports
+        ]
+        selected_reports = [
+            report for report in selected_reports
+            if report.rank is not None and report.rank >= min_community_rank
+        ]
+        selected_reports.sort(key=lambda x: (community_matches[x.id], x.rank), reverse=True)
+
+        candidates = []
+        for position, report in enumerate(selected_reports):
+            body_tokens = None if use_community_summary else self.report_token_counts.get(report.id)
+            record = [
+                report.short_id or "",
+                report.title,
+                report.summary if use_community_summary else _deferred(body_tokens, report, "full_content"),
+            ]
+            if include_community_rank:
+                record.append(str(report.rank))
+            candidates.append(ContextCandidate(
+                section=context_name,
+                id=report.id,
+                record=record,
+                tokens=_row_tokens(record, 2, body_tokens),
+                score=_score("Reports", position, len(selected_reports)),
+                body_index=2,
+                fetch_body=lambda report=report: report.full_content,
+            ))
+        return header, candidates
+
+    def _text_unit_candidates(
+            self,
+            selected_entities: list[Entity],
+            lexical_units: list[str] | None = None,
+            lexical_only: bool = False,
+    ) -> tuple[list[str], list[ContextCandidate]]:
+        if lexical_only:
+            # the units that matched the codes, not everything their (often generic) entities touch
+            selected_entities = []
+        # rank first by the order of the entities that match a unit, then by the
+        # number of matching relationships the unit has with that entity
+        ranked_units = []
+        seen_unit_ids = set()
+        for index, entity in enumerate(selected_entities):
+            for text_id in entity.text_unit_ids or []:
+                if text_id in seen_unit_ids or text_id not in self.text_units:
+                    continue
+                if text_id in self.deleted.text_unit_ids:
+                    continue
+                seen_unit_ids.add(text_id)
+                unit = self.text_units[text_id]
+                num_relationships = count_relationships(unit, entity, self.relationships)
+                ranked_units.append((index, -num_relationships, unit))
+        ranked_units.sort(key=lambda x: (x[0], x[1]))
+        ranked_units = [unit for _, _, unit in ranked_units]
+        if lexical_units:
+            # reciprocal rank fusion with the BM25 ranking
+            fused = {}
+            for rank, unit in enumerate(ranked_units):
+                fused[unit.id] = fused.get(unit.id, 0.0) + 1 / (RRF_K + rank)
+            for rank, unit_id in enumerate(lexical_units):
+                fused[unit_id] = fused.get(unit_id, 0.0) + 1 / (RRF_K + rank)
+            ranked_units = [self.text_units[unit_id] for unit_id in sorted(fused, key=fused.get, reverse=True)]
+
+        candidates = []
+        for position, unit in enumerate(ranked_units):
+            record = [unit.short_id or "", _deferred(unit.n_tokens, unit, "text")]
+            candidates.append(ContextCandidate(
+                section="Sources",
+                id=unit.id,
+                record=record,
+                tokens=_row_tokens(record, 1, unit.n_tokens),
+                score=_score("Sources", position, len(ranked_units)),
+                body_index=1,
+                fetch_body=lambda unit=unit: unit.text,
+            ))
+        return ["id", "text"], candidates
+
+    def _table_candidates(self, query: str, k: int) -> tuple[list[str], list[ContextCandidate]]:
+        header = ["id", "carrier", "document", "page", "row"]
+        store = self.table_stores.get(self.workspace) if self.workspace is not None else None
+        if store is None or not is_lookup_query(query):
+            return header, []
+        rows = store.lookup(query, k)
+        candidates = []
+        for position, row in enumerate(rows.itertuples()):
+            cells = ", ".join(
+                f"{column}: {value}" for column, value in zip(json.loads(row.columns), json.loads(row.cells)) if value
+            )
+            page = "" if pd.isna(row.page) else str(int(row.page))
+            record = [row.table_id, row.carrier, row.document, page, cells]
+            candidates.append(ContextCandidate(
+                section="Tables",
+                id=f"{row.table_id}:{position}",
+                record=record,
+                tokens=_row_tokens(record, 4, None),
+                score=_score("Tables", position, len(rows)),
+            ))
+        return header, candidates
+
+    def _entity_candidates(
+            self,
+            selected_entities: list[Entity],
+            include_entity_rank: bool = False,
+            rank_description: str = "number of relationships",
+    ) -> tuple[list[str], list[ContextCandidate]]:
+        header = ["id", "entity", "description"]
+        if include_entity_rank:
+            header.append(rank_description)
+
+        candidates = []
+        for position, entity in enumerate(selected_entities):
+            record = [entity.short_id or "", entity.title, entity.description or ""]
+            if include_entity_rank:
+                record.append(str(entity.rank))
+            candidates.append(ContextCandidate(
+                section="Entities",
+                id=entity.id,
+                record=record,
+                tokens=_row_tokens(record, 2, self.entity_token_counts.get(entity.id)),
+                score=(
+                    _score("Entities", position, len(selected_entities))
+                    * self.deleted.support.get(entity.id, 1.0)
+                ),
+            ))
+        return header, candidates
+
+    def _relationship_candidates(
+            self,
+            selected_entities: list[Entity],
+            include_relationship_weight: bool = False,
+            top_k_relationships: int = 10,
+            relationship_ranking_attribute: str = "rank",
+    ) -> tuple[list[str], list[ContextCandidate]]:
+        header = ["id", "source", "target", "description"]
+        if include_relationship_weight:
+            header.append("weight")
+        if len(selected_entities) == 0:
+            return header, []
+
+        selected_relationships: list[Relationship] = _filter_relationships(
+            selected_entities=selected_entities,
+            relationships=self._relationship_list,
+            top_k_relationships=top_k_relationships,
+            relationship_ranking_attribute=relationship_ranking_attribute,
+        )
+        if self.deleted:
+            selected_relationships = [
+                rel for rel in selected_relationships if rel.id not in self.deleted.relationship_ids
+            ]
+        attribute_cols = list(selected_relationships[0].attributes or {}) if selected_relationships else []
+        attribute_cols = [col for col in attribute_cols if col not in header]
+        header.extend(attribute_cols)
+
+        candidates = []
+        for position, rel in enumerate(selected_relationships):
+            record = [rel.short_id or "", rel.source, rel.target, rel.description or ""]
+            if include_relationship_weight:
+                record.append(str(rel.weight if rel.weight else ""))
+            for field in attribute_cols:
+                value = rel.attributes.get(field) if rel.attributes else None
+                record.append(str(value) if value else "")
+            candidates.append(ContextCandidate(
+                section="Relationships",
+                id=rel.id,
+                record=record,
+                tokens=_row_tokens(record, 3, self.relationship_token_counts.get(rel.id)),
+                score=(
+                    _score("Relationships", position, len(selected_relationships))
+                    * self.deleted.support.get(rel.id, 1.0)
+                ),
+            ))
+        return header, candidates
+
+    def _build_community_context(
+            self,
+            selected_entities: list[Entity],
+            max_tokens: int = 4000,
+            use_community_summary: bool = False,
+            column_delimiter: str = "|",
+            include_community_rank: bool = False,
+            min_community_rank: int = 0,
+            return_candidate_context: bool = False,
+            context_name: str = "Reports",
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        if return_candidate_context:
+            return super()._build_community_context(
+                selected_entities=selected_entities,
+                max_tokens=max_tokens,
+                use_community_summary=use_community_summary,
+                column_delimiter=column_delimiter,
+                include_community_rank=include_community_rank,
+                min_community_rank=min_community_rank,
+                return_candidate_context=return_candidate_context,
+                context_name=context_name,
+            )
+        selected_entities = self._live_entities(selected_entities)
+        if len(selected_entities) == 0 or len(self.community_reports) == 0:
+            return "", {context_name.lower(): pd.DataFrame()}
+
+        header, candidates = self._report_candidates(
+            selected_entities, use_community_summary, include_community_rank, min_community_rank, context_name
+        )
+        if not candidates:
+            return "", {context_name.lower(): pd.DataFrame()}
+        _, record_df, _ = _pack_records(context_name, header, candidates, max_tokens, column_delimiter)
+        return record_df.to_csv(index=False, sep=column_delimiter), {context_name.lower(): record_df}
+
+    def _build_text_unit_context(
+            self,
+            selected_entities: list[Entity],
+            max_tokens: int = 8000,
+            return_candidate_context: bool = False,
+            column_delimiter: str = "|",
+            context_name: str = "Sources",
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        if return_candidate_context:
+            return super()._build_text_unit_context(
+                selected_entities=selected_entities,
+                max_tokens=max_tokens,
+                return_candidate_context=return_candidate_context,
+                column_delimiter=column_delimiter,
+                context_name=context_name,
+            )
+        selected_entities = self._live_entities(selected_entities)
+        if len(selected_entities) == 0 or len(self.text_units) == 0:
+            return "", {context_name.lower(): pd.DataFrame()}
+
+        header, candidates = self._text_unit_candidates(selected_entities)
+        context_text, record_df, _ = _pack_records(context_name, header, candidates, max_tokens, column_delimiter)
+        return context_text, {context_name.lower(): record_df}
+
+    def _build_local_context(
+            self,
+            selected_entities: list[Entity],
+            max_tokens: int = 8000,
+            include_entity_rank: bool = False,
+            rank_description: str = "relationship count",
+            include_relationship_weight: bool = False,
+            top_k_relationships: int = 10,
+            relationship_ranking_attribute: str = "rank",
+            return_candidate_context: bool = False,
+            column_delimiter: str = "|",
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        if return_candidate_context or self.covariates:
+            return super()._build_local_context(
+                selected_entities=selected_entities,
+                max_tokens=max_tokens,
+                include_entity_rank=include_entity_rank,
+                rank_description=rank_description,
+                include_relationship_weight=include_relationship_weight,
+                top_k_relationships=top_k_relationships,
+                relationship_ranking_attribute=relationship_ranking_attribute,
+                return_candidate_context=return_candidate_context,
+                column_delimiter=column_delimiter,
+            )
+
+        selected_entities = self._live_entities(selected_entities)
+        entity_context, entity_df, entity_tokens = "", pd.DataFrame(), 0
+        if selected_entities:
+            header, candidates = self._entity_candidates(selected_entities, include_entity_rank, rank_description)
+            entity_context, entity_df, entity_tokens = _pack_records(
+                "Entities", header, candidates, max_tokens, column_delimiter
+            )
+
+        # gradually add entities' relationships to the context until we reach the limit
+        added_entities = []
+        relationship_context = ""
+        relationship_df = pd.DataFrame()
+        for entity in selected_entities:
+            added_entities.append(entity)
+            header, candidates = self._relationship_candidates(
+                added_entities, include_relationship_weight, top_k_relationships, relationship_ranking_attribute
+            )
+            if not candidates:
+                continue
+            context_text, record_df, tokens = _pack_records(
+                "Relationships", header, candidates, max_tokens, column_delimiter
+            )
+            if entity_tokens + tokens > max_tokens:
+                log.info("Reached token limit - reverting to previous context state")
+                break
+            relationship_context = context_text
+            relationship_df = record_df
+
+        final_context_data = {"relationships": relationship_df, "entities": entity_df}
+        for key in final_context_data:
+            final_context_data[key]["in_context"] = True
+        return entity_context + "\n\n" + relationship_context, final_context_data
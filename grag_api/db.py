@@ -1,6 +1,8 @@
+import threading
 from pathlib import Path
 import pandas as pd
-from graphrag.index.utils import gen_md5_hash
+
+from grag_api.metrics import DB_WRITE_SECONDS
 
 class DB:
     """
@@ -14,15 +16,8 @@ class DB:
         :param workspace: The path to the workspace directory
         """
         self.dataset_path = Path("dataset.parquet")
-        self._init()
-
-    def _init(self):
-        """
-        Initialize the database file if it doesn't exist.
-        """
-        if not self.dataset_path.exists():
-            empty_df = pd.DataFrame(columns=["id", "title", "text"])
-            empty_df.to_parquet(self.dataset_path)
+        # writes read, modify and rewrite the whole file, so they must not interleave
+        self._lock = threading.RLock()
 
     def upsert_data(self, doc_data: dict):
         """
@@ -31,34 +26,10 @@ class DB:
         :param doc_data: A dictionary containing 'text', 'title', and optionally 'id' of the document
         :return: The ID of the inserted/updated document
         """
-        df = self.load_data()
-        if 'id' in doc_data and doc_data['id'] is not None:
-            id = doc_data['id']
-        else:
-            id = gen_md5_hash(doc_data, ['text', 'title'])
-
-        new_row = {
-            "id": id,
-            "text": doc_data['text'],
-            "title": doc_data['title']
-        }
-        if id in df['id'].values:
-            df.loc[df['id'] == id] = new_row
-        else:
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df.to_parquet(self.dataset_path, index=False)
-        return id
-
-    def batch_upsert_data(self, doc_data_list: list[dict]):
-        """
-        Insert or update multiple documents in the database.
+        with self._lock:
+            from graphrag.index.utils import gen_md5_hash
 
-        :param doc_data_list: A list of dictionaries, each containing 'text', 'title', and optionally 'id' of a document
-        :return: A list of IDs of the inserted/updated documents
-        """
-        df = self.load_data()
-        new_rows = []
-        for doc_data in doc_data_list:
+            df = self.load_data()
             if 'id' in doc_data and doc_data['id'] is not None:
                 id = doc_data['id']
             else:
@@ -69,19 +40,53 @@ class DB:
                 "text": doc_data['text'],
                 "title": doc_data['title']
             }
-            new_rows.append(new_row)
+            if id in df['id'].values:
+                df.loc[df['id'] == id] = new_row
+            else:
+                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+            with DB_WRITE_SECONDS.labels(operation="upsert").time():
+                df.to_parquet(self.dataset_path, index=False)
+            return id
 
-        new_df = pd.DataFrame(new_rows)
-        df = pd.concat([df, new_df]).drop_duplicates(subset='id', keep='last').reset_index(drop=True)
-        df.to_parquet(self.dataset_path)
-        return [row['id'] for row in new_rows]
+    def batch_upsert_data(self, doc_data_list: list[dict]):
+        """
+        Insert or update multiple documents in the database.
+
+        :param doc_data_list: A list of dictionaries, each containing 'text', 'title', and optionally 'id' of a document
+        :return: A list of IDs of the inserted/updated documents
+        """
+        with self._lock:
+            from graphrag.index.utils import gen_md5_hash
+
+            df = self.load_data()
+            new_rows = []
+            for doc_data in doc_data_list:
+                if 'id' in doc_data and doc_data['id'] is not None:
+                    id = doc_data['id']
+                else:
+                    id = gen_md5_hash(doc_data, ['text', 'title'])
+
+                new_row = {
+                    "id": id,
+                    "text": doc_data['text'],
+                    "title": doc_data['title']
+                }
+                new_rows.append(new_row)
+
+            new_df = pd.DataFrame(new_rows)
+            df = pd.concat([df, new_df]).drop_duplicates(subset='id', keep='last').reset_index(drop=True)
+            with DB_WRITE_SECONDS.labels(operation="batch_upsert").time():
+                df.to_parquet(self.dataset_path)
+            return [row['id'] for row in new_rows]
 
     def load_data(self):
         """
-        Load the entire dataset from the Parquet file.
+        Load the entire dataset from the Parquet file. The file is created by the first write.
 
         :return: A pandas DataFrame containing all the data
         """
+        if not self.dataset_path.exists():
+            return pd.DataFrame(columns=["id", "title", "text"])
         return pd.read_parquet(self.dataset_path)
 
     def delete_data(self, ids: list[str]):
@@ -90,9 +95,11 @@ class DB:
 
         :param ids: A list of document IDs to be deleted
         """
-        df = self.load_data()
-        df = df[~df['id'].isin(ids)]
-        df.to_parquet(self.dataset_path)
+        with self._lock:
+            df = self.load_data()
+            df = df[~df['id'].isin(ids)]
+            with DB_WRITE_SECONDS.labels(operation="delete").time():
+                df.to_parquet(self.dataset_path)
 
     def delete_data_by_title(self, title: str):
         """
@@ -101,11 +108,23 @@ class DB:
         :param title: The title of the documents to be deleted
         :return: The number of documents deleted
         """
+        with self._lock:
+            df = self.load_data()
+            initial_count = len(df)
+            df = df[df['title'] != title]
+            with DB_WRITE_SECONDS.labels(operation="delete").time():
+                df.to_parquet(self.dataset_path)
+            return initial_count - len(df)
+
+    def get_ids_by_title(self, title: str) -> list[str]:
+        """
+        Retrieve the IDs of all documents with the given title.
+
+        :param title: The title of the documents
+        :return: A list of document IDs
+        """
         df = self.load_data()
-        initial_count = len(df)
-        df = df[df['title'] != title]
-        df.to_parquet(self.dataset_path)
-        return initial_count - len(df)
+        return df.loc[df['title'] == title, 'id'].tolist()
 
     def get_data(self, id: str):
         """
@@ -0,0 +1,141 @@
+"""
+A persistent, deduplicating text_embed verb for the index pipeline.
+
+graphrag embeds every description of every run in batches of 16, so a re-index
+pays for all of them again even when few descriptions changed. Vectors are kept
+in a SQLite file in the workspace cache, keyed by a hash of the embedding model
+and the text. A run looks up each distinct text once and sends only the misses,
+packed into as few requests as the token budget allows.
+"""
+import hashlib
+import logging
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from datashaper import TableContainer, VerbCallbacks, VerbInput
+from graphrag.index.cache import NoopPipelineCache, PipelineCache
+from graphrag.index.verbs.text.embed import TextEmbedStrategyType, text_embed
+from graphrag.index.verbs.text.embed.strategies.openai import run as run_openai
+
+from grag_api.metrics import INDEX_EMBEDDINGS
+
+log = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_FILE = "embeddings.sqlite"
+# inputs per embedding request that OpenAI accepts; batches are bounded by batch_max_tokens first
+MAX_BATCH_SIZE = 2048
+# keys per SQLite lookup, below its bound variable limit
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Embedding vectors by hash(model, text), stored as float32 in a SQLite file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys) -> dict[bytes, np.ndarray]:
+        keys = list(keys)
+        vectors = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                vectors.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return vectors
+
+    def put_many(self, vectors: dict[bytes, np.ndarray]):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+async def cached_text_embed(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        cache: PipelineCache,
+        column: str,
+        strategy: dict,
+        workspace="ragtest",
+        cache_base_dir: str = "cache",
+        **kwargs,
+) -> TableContainer:
+    """
+    Drop-in for graphrag's text_embed verb that embeds only texts it has not embedded before.
+
+    Runs that write to an external vector store, or use a strategy other than openai,
+    are passed to graphrag's verb unchanged.
+
+    :param column: The column with the texts to embed
+    :param strategy: graphrag's embedding strategy; its llm.model is part of the cache key
+    :param workspace: The workspace whose cache directory holds the vectors
+    :param cache_base_dir: The cache directory, relative to the workspace (the config's cache.base_dir)
+    """
+    if strategy.get("vector_store") or strategy.get("type") != TextEmbedStrategyType.openai:
+        return await text_embed(input, callbacks, cache, column, strategy, **kwargs)
+
+    output_df = input.get_input()
+    to = kwargs.get("to", f"{column}_embedding")
+    model = (strategy.get("llm") or {}).get("model", "")
+    keys = [embedding_key(model, text) if isinstance(text, str) and text else None for text in output_df[column]]
+    texts = {key: text for key, text in zip(keys, output_df[column]) if key is not None}
+
+    store = EmbeddingCache(Path(workspace) / cache_base_dir / EMBEDDING_CACHE_FILE)
+    vectors = store.get_many(texts)
+    misses = [key for key in texts if key not in vectors]
+    log.info(
+        "Embedding %s: %s texts, %s distinct, %s cached, %s to embed",
+        column, len(keys), len(texts), len(vectors), len(misses),
+    )
+    if misses:
+        args = {**strategy, "batch_size": MAX_BATCH_SIZE}
+        # the vectors are cached here, so graphrag's per-batch JSON cache would only duplicate them
+        result = await run_openai([texts[key] for key in misses], callbacks, NoopPipelineCache(), args)
+        embedded = {
+            key: np.asarray(vector, dtype=np.float32)
+            for key, vector in zip(misses, result.embeddings or [])
+            if vector is not None
+        }
+        store.put_many(embedded)
+        vectors.update(embedded)
+
+    INDEX_EMBEDDINGS.labels(source="cache").inc(len(texts) - len(misses))
+    INDEX_EMBEDDINGS.labels(source="api").inc(len(misses))
+    INDEX_EMBEDDINGS.labels(source="duplicate").inc(sum(key is not None for key in keys) - len(texts))
+    output_df[to] = [vectors[key].tolist() if key in vectors else None for key in keys]
+    return TableContainer(table=output_df)
@@ -0,0 +1,152 @@
+"""
+A compact, in-process vector store for entity description embeddings.
+
+Embeddings are held as one contiguous matrix of unit-normalized codes, int8 with
+a per-row scale (4x smaller than float32) or float16 (2x), plus a row -> entity id
+index. A query scans the codes for k * rerank_factor candidates and re-scores only
+those against the full-precision vectors, which may be a memory-mapped array
+(for example the arena's float32 matrix) so they are paged in on demand rather
+than kept resident. Replaces both the per-Entity Python float lists and the
+LanceDB copy of the same vectors on the query path.
+"""
+from typing import Any
+
+import numpy as np
+
+from graphrag.model.types import TextEmbedder
+from graphrag.vector_stores import BaseVectorStore, VectorStoreDocument, VectorStoreSearchResult
+
+QUANTIZATIONS = ("int8", "float16")
+CHUNK_ROWS = 8192
+
+
+def quantize(vectors: np.ndarray, rows: np.ndarray, quantization: str = "int8", chunk_rows: int = CHUNK_ROWS):
+    """
+    Normalize and quantize the given rows of a (possibly memory-mapped) matrix, a chunk at a time.
+
+    :return: (codes, scales, norms); scales is None for float16
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+    dim = vectors.shape[1]
+    codes = np.empty((len(rows), dim), dtype=np.int8 if quantization == "int8" else np.float16)
+    scales = np.empty(len(rows), dtype=np.float32) if quantization == "int8" else None
+    norms = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = np.asarray(vectors[rows[start:start + chunk_rows]], dtype=np.float32)
+        chunk_norms = np.linalg.norm(chunk, axis=1)
+        chunk_norms[chunk_norms == 0] = 1.0
+        unit = chunk / chunk_norms[:, None]
+        norms[start:start + len(chunk)] = chunk_norms
+        if quantization == "int8":
+            chunk_scales = np.abs(unit).max(axis=1) / 127.0
+            chunk_scales[chunk_scales == 0] = 1.0
+            codes[start:start + len(chunk)] = np.round(unit / chunk_scales[:, None]).astype(np.int8)
+            scales[start:start + len(chunk)] = chunk_scales
+        else:
+            codes[start:start + len(chunk)] = unit.astype(np.float16)
+    return codes, scales, norms
+
+
+def approximate_scores(codes: np.ndarray, scales: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of a unit query against every row of quantized codes, a chunk at a time."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), CHUNK_ROWS):
+        chunk = codes[start:start + CHUNK_ROWS].astype(np.float32) @ query
+        if scales is not None:
+            chunk *= scales[start:start + CHUNK_ROWS]
+        scores[start:start + CHUNK_ROWS] = chunk
+    return scores
+
+
+class QuantizedEmbeddingStore(BaseVectorStore):
+    """BaseVectorStore over quantized codes with exact re-ranking of the top candidates."""
+
+    def __init__(
+            self,
+            ids: list[str],
+            vectors: np.ndarray,
+            rows: np.ndarray | None = None,
+            quantization: str = "int8",
+            rerank_factor: int = 4,
+            collection_name: str = "entity_description_embeddings",
+            **kwargs: Any,
+    ):
+        """
+        :param ids: Entity id of each row of `vectors`
+        :param vectors: Full-precision (n, dim) matrix, kept by reference for re-ranking
+        :param rows: Optional subset of rows to index, e.g. only the loaded entities
+        :param quantization: "int8" or "float16"
+        :param rerank_factor: Candidates re-scored at full precision per requested result
+        """
+        super().__init__(collection_name=collection_name, **kwargs)
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self._build(ids, vectors, rows)
+
+    def _build(self, ids, vectors, rows=None):
+        self.vectors = vectors
+        self.rows = np.arange(len(ids)) if rows is None else np.asarray(rows, dtype=np.int64)
+        self.ids = [ids[row] for row in self.rows]
+        self.codes, self.scales, self.norms = quantize(vectors, self.rows, self.quantization)
+
+    def connect(self, **kwargs: Any) -> None:
+        """Nothing to connect to: the store lives in process memory."""
+
+    def load_documents(self, documents: list[VectorStoreDocument], overwrite: bool = True) -> None:
+        documents = [document for document in documents if document.vector is not None]
+        if not overwrite and len(self.ids):
+            documents = [
+                VectorStoreDocument(id=id, text=None, vector=self.vectors[row].tolist())
+                for id, row in zip(self.ids, self.rows)
+            ] + documents
+        vectors = np.array([document.vector for document in documents], dtype=np.float32)
+        self._build([document.id for document in documents], vectors.reshape(len(documents), -1))
+
+    def filter_by_id(self, include_ids: list[str] | list[int]) -> Any:
+        self.query_filter = set(include_ids) if include_ids else None
+        return self.query_filter
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a unit query against every indexed row, from the codes."""
+        return approximate_scores(self.codes, self.scales, query)
+
+    def similarity_search_by_vector(
+            self, query_embedding: list[float], k: int = 10, **kwargs: Any
+    ) -> list[VectorStoreSearchResult]:
+        if not len(self.ids):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = self.approximate_scores(query)
+        if self.query_filter:
+            allowed = np.fromiter((id in self.query_filter for id in self.ids), dtype=bool, count=len(self.ids))
+            scores[~allowed] = -np.inf
+        n_candidates = min(k * self.rerank_factor, len(scores))
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        candidates = candidates[np.isfinite(scores[candidates])]
+        candidates.sort()  # read the full-precision rows in file order
+
+        exact = np.asarray(self.vectors[self.rows[candidates]], dtype=np.float32) @ query / self.norms[candidates]
+        order = np.argsort(-exact)[:k]
+        return [
+            VectorStoreSearchResult(
+                document=VectorStoreDocument(id=self.ids[candidates[i]], text=None, vector=None),
+                score=float(exact[i]),
+            )
+            for i in order
+        ]
+
+    def similarity_search_by_text(
+            self, text: str, text_embedder: TextEmbedder, k: int = 10, **kwargs: Any
+    ) -> list[VectorStoreSearchResult]:
+        query_embedding = text_embedder(text)
+        if query_embedding:
+            return self.similarity_search_by_vector(query_embedding, k)
+        return []
+
+    def memory_bytes(self) -> int:
+        """Resident size of the index itself; the full-precision vectors are not counted."""
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return self.codes.nbytes + scales + self.norms.nbytes + self.rows.nbytes
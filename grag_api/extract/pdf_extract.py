@@ -1,4 +1,5 @@
 import base64
+import io
 import json
 import os
 import re
@@ -8,8 +9,45 @@ import boto3
 import requests
 import unstructured_client
 from botocore.config import Config as BotoConfig
+from PIL import Image
 from unstructured_client.models import operations, shared
 import logging
+import time
+
+from grag_api.metrics import IMAGE_CAPTION_REQUESTS, IMAGE_CAPTION_SECONDS, IMAGE_CAPTIONS, PDF_PAGES, PDF_SECONDS
+from grag_api.tariff_tables import parse_html_table
+
+CAPTION_MODEL = "gpt-4o-mini"
+CAPTION_PROMPT = "Briefly describe this picture in 20 words or less."
+BATCH_CAPTION_PROMPT = (
+    "Briefly describe each of the {count} pictures below in 20 words or less. "
+    "The pictures are numbered 1 to {count} in the order given. "
+    'Return a JSON object of the form {{"captions": [{{"image": <number>, "description": <description>}}, ...]}} '
+    "with one entry per picture."
+)
+# completion tokens allowed per caption in a batched request
+CAPTION_TOKENS = 60
+FAILED_CAPTION = "Failed to get image description."
+# rate limits and server errors, retried with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 60.0
+# file signatures of the image formats the API accepts, for images Pillow cannot decode
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif",
+}
+
+
+def image_mime_type(image_data: bytes) -> str:
+    """The MIME type of encoded image bytes, from their signature."""
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in IMAGE_SIGNATURES.items():
+        if image_data.startswith(signature):
+            return mime_type
+    return "application/octet-stream"
 
 
 class PDFProcessor:
@@ -33,8 +71,9 @@ class PDFProcessor:
         self.logger = logging.getLogger(__name__)
 
     def run(self, pdf_path):
-        json_elements = self.extract_pdf(pdf_path)
-        return self.process_content(json_elements, pdf_path)
+        with PDF_SECONDS.time():
+            json_elements = self.extract_pdf(pdf_path)
+            return self.process_content(json_elements, pdf_path)
 
     def extract_pdf(self, filename):
         with open(filename, "rb") as f:
@@ -97,38 +136,145 @@ class PDFProcessor:
 
         return f"{sanitized_filename}_{page_number}_{image_number}.png"
 
-    def get_image_description(self, image_data):
+    def prepare_image(self, image_data):
+        """
+        Downscale an image to the captioning size and recompress it as JPEG, so requests carry
+        fewer bytes and image tokens. Images that cannot be decoded are sent as they are.
+
+        :return: (image bytes, their MIME type)
+        """
+        captions_config = self.config.get("image_captions") or {}
+        max_side = captions_config.get("max_side", 768)
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            image.thumbnail((max_side, max_side))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=captions_config.get("jpeg_quality", 80), optimize=True)
+        except (OSError, ValueError):
+            return image_data, image_mime_type(image_data)
+        return output.getvalue(), "image/jpeg"
+
+    def _image_part(self, image_data):
+        image_data, mime_type = self.prepare_image(image_data)
+        encoded = base64.b64encode(image_data).decode('utf-8')
+        return {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded}"}}
+
+    def _chat_completion(self, payload, kind):
+        """
+        Send a chat completion request, retrying rate limits and server errors with exponential
+        backoff, or after the delay the response asks for.
+
+        :return: The last response
+        """
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.config['openai_api_key']}"
         }
+        captions_config = self.config.get("image_captions") or {}
+        max_retries = captions_config.get("max_retries", 4)
+        delay = captions_config.get("retry_delay", 1.0)
+        for attempt in range(max_retries + 1):
+            IMAGE_CAPTION_REQUESTS.labels(kind=kind).inc()
+            with IMAGE_CAPTION_SECONDS.time():
+                response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                return response
+            try:
+                wait = float(response.headers.get("Retry-After", delay))
+            except ValueError:
+                wait = delay
+            wait = min(wait, MAX_RETRY_DELAY)
+            self.logger.warning(
+                f"Image captioning returned {response.status_code}, retrying in {wait:.1f}s "
+                f"({attempt + 1}/{max_retries})"
+            )
+            time.sleep(wait)
+            delay *= 2
+
+    def get_image_description(self, image_data):
         payload = {
-            "model": "gpt-4o-mini",
+            "model": CAPTION_MODEL,
             "messages": [
                 {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": "Briefly describe this picture in 20 words or less."
+                            "text": CAPTION_PROMPT
                         },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64.b64encode(image_data).decode('utf-8')}"
-                            }
-                        }
+                        self._image_part(image_data)
                     ]
                 }
             ],
             "max_tokens": 300
         }
 
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+        response = self._chat_completion(payload, "single")
         if response.status_code == 200:
+            IMAGE_CAPTIONS.labels(status="ok").inc()
             return response.json()['choices'][0]['message']['content']
         else:
-            return "Failed to get image description."
+            IMAGE_CAPTIONS.labels(status="failed").inc()
+            return FAILED_CAPTION
+
+    def get_image_descriptions(self, images):
+        """
+        Caption several images in one request with structured per-image output.
+
+        Images the response leaves out, or all of them if it cannot be parsed, are
+        captioned one by one with get_image_description. If the request itself fails,
+        after its retries, the images get the failed caption rather than one request each.
+        """
+        if len(images) == 1:
+            return [self.get_image_description(images[0])]
+        payload = {
+            "model": CAPTION_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": BATCH_CAPTION_PROMPT.format(count=len(images))},
+                        *(self._image_part(image_data) for image_data in images)
+                    ]
+                }
+            ],
+            "response_format": {"type": "json_object"},
+            "max_tokens": CAPTION_TOKENS * len(images) + 50
+        }
+
+        captions = {}
+        response = self._chat_completion(payload, "batch")
+        if response.status_code == 200:
+            try:
+                content = json.loads(response.json()['choices'][0]['message']['content'])
+                for entry in content.get("captions", []):
+                    description = entry.get("description")
+                    if isinstance(description, str) and description.strip():
+                        captions[int(entry["image"]) - 1] = description.strip()
+            except (KeyError, TypeError, ValueError, AttributeError):
+                self.logger.warning("Could not parse batched image captions, captioning one by one")
+        else:
+            self.logger.warning(f"Batched image captioning failed with status {response.status_code}")
+            IMAGE_CAPTIONS.labels(status="failed").inc(len(images))
+            return [FAILED_CAPTION] * len(images)
+
+        IMAGE_CAPTIONS.labels(status="ok").inc(sum(0 <= index < len(images) for index in captions))
+        return [
+            captions[index] if index in captions else self.get_image_description(image_data)
+            for index, image_data in enumerate(images)
+        ]
+
+    def caption_images(self, images):
+        """Captions for a document's images, requested batch_size at a time."""
+        batch_size = (self.config.get("image_captions") or {}).get("batch_size", 8)
+        if batch_size <= 1:
+            return [self.get_image_description(image_data) for image_data in images]
+        captions = []
+        for start in range(0, len(images), batch_size):
+            captions.extend(self.get_image_descriptions(images[start:start + batch_size]))
+        return captions
 
     def process_content(self, json_elements, pdf_path):
         grouped_data = defaultdict(list)
@@ -138,11 +284,13 @@ class PDFProcessor:
             grouped_data[page_number].append(item)
 
         all_pages = []
+        images = []  # (page index, position in the page content, image bytes, url)
         filename = os.path.basename(pdf_path)
 
         for page_number in sorted(grouped_data.keys()):
             self.logger.info(f"Processing page {page_number} of {filename}")
             page_content = []
+            page_tables = []
             title = f"{filename}_{page_number}"
 
             for item in grouped_data[page_number]:
@@ -153,21 +301,34 @@ class PDFProcessor:
                     img_data = base64.b64decode(item['metadata']['image_base64'])
                     img_filename = self.get_image_filename(filename, page_number)
                     img_url = self.upload_to_r2(img_data, img_filename)
-                    img_description = self.get_image_description(img_data)
-                    page_content.append(f"{img_description}(link: {img_url})")
-                    self.logger.info(f"Image processed and uploaded: {img_url}")
+                    # captioned together with the document's other images below
+                    images.append((len(all_pages), len(page_content), img_data, img_url))
+                    page_content.append(None)
+                    self.logger.info(f"Image uploaded: {img_url}")
                 elif item['type'] == 'Table':
                     self.logger.info(f"Processing table on page {page_number}")
                     markdown_table = self.html_table_to_markdown(item['metadata']['text_as_html'])
                     page_content.append(markdown_table)
+                    page_tables.append(parse_html_table(item['metadata']['text_as_html']))
                     self.logger.info("Table processed and converted to Markdown")
 
             all_pages.append({
                 "id": title,
                 "title": filename,
-                "text": '\n'.join(page_content).strip()
+                "content": page_content,
+                # for the tariff table store; the dataset only keeps id, title and text
+                "tables": page_tables
             })
+            PDF_PAGES.inc()
             self.logger.info(f"Completed processing page {page_number}")
 
+        if images:
+            self.logger.info(f"Captioning {len(images)} images of {filename}")
+        captions = self.caption_images([img_data for _, _, img_data, _ in images])
+        for (page_index, position, _, img_url), img_description in zip(images, captions):
+            all_pages[page_index]["content"][position] = f"{img_description}(link: {img_url})"
+        for page in all_pages:
+            page["text"] = '\n'.join(page.pop("content")).strip()
+
         self.logger.info(f"Finished processing all pages of {filename}")
         return all_pages
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+Packed, adaptively gleaned entity extraction.
+
+Chunks are grouped by document, so every job-profile record and short PDF page
+becomes its own text unit and its own extraction request, and max_gleanings
+adds a continuation request to each whether or not the first answer missed
+anything. The planner packs small units into one request of up to pack_tokens
+and keeps their provenance: each entity is attributed to the units
+of its pack that mention it, each relationship to the units that mention both
+ends. A gleaning pass only runs when the first answer looks incomplete, because
+it was cut off before the completion delimiter or found fewer than
+min_entity_density entities per 1000 tokens of input.
+
+Packs depend only on the contents of the units, not on their order in the
+table: units are ordered by content hash, and a pack starts at a unit whose hash
+picks it as an anchor or when the unit would overflow the pack. Adding or
+removing a document only changes the packs between the anchors around its
+units, so every other pack sends the same prompt as before and is answered from
+graphrag's LLM cache.
+
+A pack's graph is returned on the row of its first unit; the other units of the
+pack get an empty graph, so merge_graphs sees every entity once.
+"""
+import asyncio
+import hashlib
+import logging
+
+import networkx as nx
+import tiktoken
+
+from datashaper import TableContainer, VerbCallbacks, VerbInput
+from graphrag.index.cache import PipelineCache
+from graphrag.index.graph.extractors.graph import GraphExtractor
+from graphrag.index.graph.extractors.graph.prompts import CONTINUE_PROMPT, LOOP_PROMPT
+from graphrag.index.llm import load_llm
+from graphrag.index.verbs.entities.extraction import entity_extract
+from graphrag.index.verbs.entities.extraction.entity_extract import DEFAULT_ENTITY_TYPES
+
+from grag_api.metrics import INDEX_EXTRACTION_REQUESTS
+from grag_api.tokens import count_tokens, estimate_tokens
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PACK_TOKENS = 7000
+DEFAULT_MIN_ENTITY_DENSITY = 3.0
+EMPTY_GRAPHML = "".join(nx.generate_graphml(nx.Graph()))
+
+
+def pack_units(texts: list[str], token_counts: list[int], pack_tokens: int) -> list[list[int]]:
+    """
+    Positions of units packed up to pack_tokens, in content hash order; a unit over the limit is packed alone.
+
+    A unit is an anchor that starts a new pack with probability count / pack_tokens, decided
+    by its own hash, so runs between anchors average pack_tokens whatever the rest of the corpus.
+    """
+    hashes = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+    packs, pack, tokens = [], [], 0
+    for position in sorted(range(len(texts)), key=lambda position: (hashes[position], position)):
+        count = token_counts[position]
+        # the second half of the hash, independent of the first half the units are ordered by
+        anchor = int.from_bytes(hashes[position][16:24], "big") / 2 ** 64 < count / pack_tokens
+        if pack and (anchor or tokens + count > pack_tokens):
+            packs.append(pack)
+            pack, tokens = [], 0
+        pack.append(position)
+        tokens += count
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+class AdaptiveGraphExtractor(GraphExtractor):
+    """graphrag's GraphExtractor, gleaning only when the first answer looks incomplete."""
+
+    def __init__(self, *args, min_entity_density: float = DEFAULT_MIN_ENTITY_DENSITY, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_entity_density = min_entity_density
+
+    def looks_incomplete(self, text: str, results: str, prompt_variables: dict) -> bool:
+        if not results.rstrip().endswith(prompt_variables[self._completion_delimiter_key]):
+            return True
+        entities = results.count(f'"entity"{prompt_variables[self._tuple_delimiter_key]}')
+        return entities < self.min_entity_density * estimate_tokens(text) / 1000
+
+    async def _process_document(self, text: str, prompt_variables: dict[str, str]) -> str:
+        # graphrag's loop, behind the completeness check
+        INDEX_EXTRACTION_REQUESTS.labels(kind="extract").inc()
+        response = await self._llm(self._extraction_prompt, variables={**prompt_variables, self._input_text_key: text})
+        results = response.output or ""
+        if self._max_gleanings and not self.looks_incomplete(text, results, prompt_variables):
+            INDEX_EXTRACTION_REQUESTS.labels(kind="glean_skipped").inc()
+            return results
+        for i in range(self._max_gleanings):
+            # each call continues the conversation of the one before, gleans and loop checks included
+            INDEX_EXTRACTION_REQUESTS.labels(kind="glean").inc()
+            response = await self._llm(CONTINUE_PROMPT, name=f"extract-continuation-{i}", history=response.history)
+            results += response.output or ""
+            if i >= self._max_gleanings - 1:
+                break
+            response = await self._llm(
+                LOOP_PROMPT,
+                name=f"extract-loopcheck-{i}",
+                history=response.history,
+                model_parameters=self._loop_args,
+            )
+            if response.output != "YES":
+                break
+        return results
+
+
+def _attribute(graph: nx.Graph, unit_ids: list[str], texts: list[str]):
+    """Set each node's and edge's source_id to the units of the pack that mention it, or all of them."""
+    lowered = [text.lower() for text in texts]
+    mentions = {}
+    for node, data in graph.nodes(data=True):
+        name = str(node).strip('"').lower()
+        mentions[node] = {position for position, text in enumerate(lowered) if name and name in text}
+        data["source_id"] = ",".join(unit_ids[p] for p in sorted(mentions[node]) or range(len(unit_ids)))
+    for source, target, data in graph.edges(data=True):
+        positions = (mentions[source] & mentions[target]) or (mentions[source] | mentions[target])
+        data["source_id"] = ",".join(unit_ids[p] for p in sorted(positions) or range(len(unit_ids)))
+
+
+def plan_packs(rows: list[tuple[str, str]], strategy: dict, pack_tokens: int = DEFAULT_PACK_TOKENS) -> list[list[int]]:
+    """The packs of (text unit id, text) rows, as positions into rows."""
+    texts = [text.strip() for _, text in rows]
+    encoder = tiktoken.get_encoding(strategy.get("encoding_name") or "cl100k_base")
+    return pack_units(texts, count_tokens(texts, encoder), pack_tokens)
+
+
+async def extract_units(
+        rows: list[tuple[str, str]],
+        entity_types: list[str],
+        callbacks: VerbCallbacks,
+        cache: PipelineCache,
+        strategy: dict,
+        pack_tokens: int = DEFAULT_PACK_TOKENS,
+        min_entity_density: float = DEFAULT_MIN_ENTITY_DENSITY,
+        concurrency: int = 4,
+) -> list[list]:
+    """
+    Extract the entities of text units, packed and adaptively gleaned.
+
+    :param rows: (text unit id, text) pairs
+    :param strategy: graphrag's graph_intelligence extraction strategy
+    :return: [entities, graphml] for each row, in order, as graphrag's run_gi returns them
+    """
+    llm_config = strategy.get("llm") or {}
+    llm = load_llm("entity_extraction", llm_config.get("type"), callbacks, cache, llm_config)
+    extractor = AdaptiveGraphExtractor(
+        llm_invoker=llm,
+        prompt=strategy.get("extraction_prompt"),
+        encoding_model=strategy.get("encoding_name"),
+        max_gleanings=strategy.get("max_gleanings", 0),
+        on_error=lambda e, s, d: callbacks.error("Entity Extraction Error", e, s, d) if callbacks else None,
+        min_entity_density=min_entity_density,
+    )
+    prompt_variables = {
+        "entity_types": entity_types,
+        "tuple_delimiter": strategy.get("tuple_delimiter"),
+        "record_delimiter": strategy.get("record_delimiter"),
+        "completion_delimiter": strategy.get("completion_delimiter"),
+    }
+    texts = [text.strip() for _, text in rows]
+    packs = plan_packs(rows, strategy, pack_tokens)
+    log.info("Extracting %s text units in %s requests", len(rows), len(packs))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def extract_pack(pack: list[int]) -> tuple[list, str]:
+        unit_ids = [rows[position][0] for position in pack]
+        pack_texts = [texts[position] for position in pack]
+        async with semaphore:
+            result = await extractor(["\n\n".join(pack_texts)], prompt_variables)
+        graph = result.output
+        _attribute(graph, unit_ids, pack_texts)
+        entities = [{"name": node, **(data or {})} for node, data in graph.nodes(data=True)]
+        return entities, "".join(nx.generate_graphml(graph))
+
+    results = [[[], EMPTY_GRAPHML] for _ in rows]
+    for pack, (entities, graphml) in zip(packs, await asyncio.gather(*(extract_pack(pack) for pack in packs))):
+        results[pack[0]] = [entities, graphml]
+    return results
+
+
+async def planned_entity_extract(
+        input: VerbInput,
+        cache: PipelineCache,
+        callbacks: VerbCallbacks,
+        column: str,
+        id_column: str,
+        to: str,
+        strategy: dict | None,
+        graph_to: str | None = None,
+        entity_types=DEFAULT_ENTITY_TYPES,
+        pack_tokens: int = DEFAULT_PACK_TOKENS,
+        min_entity_density: float = DEFAULT_MIN_ENTITY_DENSITY,
+        **kwargs,
+) -> TableContainer:
+    """
+    Drop-in for graphrag's entity_extract verb that packs small text units and gleans adaptively.
+
+    Runs with a strategy other than graph_intelligence are passed to graphrag's verb unchanged.
+
+    :param pack_tokens: Text unit tokens sent in one extraction request
+    :param min_entity_density: Entities per 1000 input tokens below which a gleaning pass runs
+    """
+    strategy = strategy or {}
+    if strategy.get("type", "graph_intelligence") != "graph_intelligence":
+        return await entity_extract(
+            input, cache, callbacks, column, id_column, to, strategy, graph_to=graph_to, entity_types=entity_types, **kwargs
+        )
+
+    output = input.get_input()
+    rows = [(str(unit_id), text) for unit_id, text in zip(output[id_column], output[column])]
+    results = await extract_units(
+        rows, entity_types or DEFAULT_ENTITY_TYPES, callbacks, cache, strategy,
+        pack_tokens, min_entity_density, kwargs.get("num_threads", 4),
+    )
+    output[to] = [entities for entities, _ in results]
+    if graph_to is not None:
+        output[graph_to] = [graphml for _, graphml in results]
+    return TableContainer(table=output.reset_index(drop=True))
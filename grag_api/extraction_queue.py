@@ -0,0 +1,471 @@
+"""
+Entity extraction through a durable work queue.
+
+In the standard pipeline the entity_extract verb sends every text unit from one
+process. With the queue enabled, the verb instead splits the units into tasks
+in a SQLite queue in the workspace and waits for them to be done. Any number of
+worker processes, on this host or on others that share the workspace, lease
+tasks, run graphrag's extraction strategy on them and store each unit's
+entities and partial graph. The pipeline process works through tasks too, and
+once every task is done it hands the partial graphs to merge_graphs as usual.
+
+Workers renew the leases of the tasks they hold while they extract them. A lease
+that is not renewed expires, so a task held by a worker that died is picked up
+again, and a worker that lost its lease cannot store or requeue the task. A run
+is keyed by a hash of its inputs, so a restarted index run reuses the tasks
+already done; once a run is merged, the tasks of other runs are deleted. Run
+extra workers with
+
+    python -m grag_api.extraction_queue --workspace ragtest
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+QUEUE_FILE = "extract_queue.sqlite"
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS runs (
+        id TEXT PRIMARY KEY,
+        strategy TEXT NOT NULL,
+        entity_types TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        rows TEXT NOT NULL,
+        status TEXT NOT NULL,
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        results TEXT,
+        error TEXT,
+        UNIQUE (run_id, position)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires)",
+]
+
+
+def run_key(rows: list[tuple[str, str]], strategy: dict, entity_types: list[str]) -> str:
+    """A run id that is the same whenever the same units are extracted the same way."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([strategy, entity_types], sort_keys=True, default=str).encode("utf-8"))
+    for unit_id, text in rows:
+        digest.update(f"{unit_id}\0{text}\0".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def _without_secrets(strategy: dict) -> dict:
+    """The strategy as stored in the queue: workers supply their own API key."""
+    strategy = json.loads(json.dumps(strategy, default=str))
+    strategy.get("llm", {}).pop("api_key", None)
+    return strategy
+
+
+class ExtractionQueue:
+    """Extraction tasks of one workspace, leased to workers through a SQLite file."""
+
+    def __init__(self, workspace, lease_seconds: float = 600.0, max_attempts: int = 3):
+        """
+        :param workspace: The workspace whose queue file is used
+        :param lease_seconds: How long a task of a worker that stopped renewing its lease stays leased
+        :param max_attempts: Leases of a task before it is marked failed
+        """
+        self.path = Path(workspace) / QUEUE_FILE
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        """A connection holding the write lock for the whole block, so claims never race."""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def submit(self, run_id: str, rows: list[tuple[str, str]], strategy: dict, entity_types: list[str],
+               task_size: int = 16, packs: list[list[int]] | None = None) -> int:
+        """
+        Queue a run's text units in tasks of task_size. The finished tasks of a run that was
+        queued before are kept.
+
+        :param rows: (text unit id, text) pairs
+        :param packs: Positions of rows extracted together; a task then holds whole packs, and
+                      at least task_size units unless it is the last
+        :return: The number of tasks in the run
+        """
+        tasks = [rows[start:start + task_size] for start in range(0, len(rows), task_size)]
+        if packs is not None:
+            tasks, task = [], []
+            for pack in packs:
+                task.extend(rows[position] for position in pack)
+                if len(task) >= task_size:
+                    tasks.append(task)
+                    task = []
+            if task:
+                tasks.append(task)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO runs (id, strategy, entity_types, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, json.dumps(_without_secrets(strategy)), json.dumps(list(entity_types)), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (run_id, position, rows, status) VALUES (?, ?, ?, ?)",
+                [(run_id, position, json.dumps(task), QUEUED) for position, task in enumerate(tasks)],
+            )
+            # a new attempt at a run retries the tasks that failed last time
+            conn.execute(
+                "UPDATE tasks SET status = ?, attempts = 0 WHERE run_id = ? AND status = ?", (QUEUED, run_id, FAILED)
+            )
+            return conn.execute("SELECT COUNT(*) FROM tasks WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def claim(self, worker: str, run_id: str | None = None) -> dict | None:
+        """
+        Lease the next queued task, or one whose lease expired.
+
+        :param run_id: Only take tasks of this run
+        :return: The task with its run's strategy and entity types, or None if there is nothing to do
+        """
+        now = time.time()
+        run_filter = "AND tasks.run_id = ?" if run_id else ""
+        with self._transaction() as conn:
+            task = conn.execute(
+                f"""
+                SELECT tasks.id, tasks.run_id, tasks.rows, tasks.attempts, runs.strategy, runs.entity_types
+                FROM tasks JOIN runs ON runs.id = tasks.run_id
+                WHERE (tasks.status = ? OR (tasks.status = ? AND tasks.lease_expires < ?)) {run_filter}
+                ORDER BY tasks.id LIMIT 1
+                """,
+                (QUEUED, LEASED, now, *([run_id] if run_id else [])),
+            ).fetchone()
+            if task is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (LEASED, worker, now + self.lease_seconds, task["id"]),
+            )
+        return {
+            "id": task["id"],
+            "run_id": task["run_id"],
+            "rows": json.loads(task["rows"]),
+            "attempts": task["attempts"] + 1,
+            "strategy": json.loads(task["strategy"]),
+            "entity_types": json.loads(task["entity_types"]),
+        }
+
+    def renew(self, worker: str) -> int:
+        """
+        Extend the leases of the tasks a worker holds.
+
+        :return: The number of leases renewed
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = ?",
+                (time.time() + self.lease_seconds, worker, LEASED),
+            ).rowcount
+
+    def complete(self, task_id: int, worker: str, results: list) -> bool:
+        """
+        Store a task's per-unit [entities, graphml] results.
+
+        :return: False if the worker no longer holds the task's lease, and nothing was stored
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = ?, results = ?, error = NULL, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(results), task_id, worker, LEASED),
+            ).rowcount > 0
+
+    def fail(self, task_id: int, worker: str, attempts: int, error: str) -> bool:
+        """
+        Give a task back to the queue, or mark it failed once it has used up its attempts.
+
+        :return: False if the worker no longer holds the task's lease, and the task was left alone
+        """
+        status = FAILED if attempts >= self.max_attempts else QUEUED
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = ?",
+                (status, error, task_id, worker, LEASED),
+            ).rowcount > 0
+
+    def prune(self, run_id: str) -> int:
+        """
+        Delete the tasks and results of every run but run_id, once run_id has been merged.
+
+        :return: The number of tasks deleted
+        """
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM tasks WHERE run_id != ?", (run_id,)).rowcount
+            conn.execute("DELETE FROM runs WHERE id != ?", (run_id,))
+        return deleted
+
+    def progress(self, run_id: str) -> dict[str, int]:
+        """Tasks of a run in each status."""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM tasks WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def errors(self, run_id: str) -> list[str]:
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT error FROM tasks WHERE run_id = ? AND status = ? ORDER BY position", (run_id, FAILED)
+            ).fetchall()
+        return [row["error"] for row in rows]
+
+    def results(self, run_id: str) -> dict[str, list]:
+        """Text unit id -> [entities, graphml] for every unit of the run's finished tasks."""
+        with self._transaction() as conn:
+            tasks = conn.execute(
+                "SELECT rows, results FROM tasks WHERE run_id = ? AND status = ? ORDER BY position", (run_id, DONE)
+            ).fetchall()
+        results = {}
+        for task in tasks:
+            for (unit_id, _), result in zip(json.loads(task["rows"]), json.loads(task["results"])):
+                results[unit_id] = result
+        return results
+
+
+class ExtractionWorker:
+    """Leases extraction tasks and runs graphrag's extraction strategy on them."""
+
+    def __init__(self, workspace, config=None, queue: ExtractionQueue | None = None, cache=None, callbacks=None,
+                 concurrency: int | None = None, poll_interval: float = 2.0):
+        """
+        :param workspace: The workspace whose queue and LLM cache are used
+        :param config: The configuration dictionary; supplies the API key and request concurrency
+        :param queue: The queue to work on, by default the workspace's
+        :param cache: The pipeline cache, by default the workspace's file cache
+        :param callbacks: Verb callbacks for extraction errors
+        :param concurrency: Units extracted at the same time, by default the LLM's concurrent_requests
+        :param poll_interval: Seconds to wait before looking again when the queue is empty
+        """
+        from datashaper import NoopVerbCallbacks
+        from graphrag.index.cache import JsonPipelineCache
+        from graphrag.index.storage import FilePipelineStorage
+
+        if config is None:
+            from grag_api.config import load_config
+            config = load_config()
+        self.workspace = workspace
+        self.config = config
+        self.queue = queue or ExtractionQueue(workspace)
+        self.cache = cache or JsonPipelineCache(
+            FilePipelineStorage(str(workspace)).child(config.get("cache", {}).get("base_dir", "cache"))
+        )
+        self.callbacks = callbacks or NoopVerbCallbacks()
+        self.concurrency = concurrency or config["llm"].get("concurrent_requests", 8)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def extract(self, task: dict) -> list:
+        from graphrag.index.verbs.entities.extraction.strategies.graph_intelligence import run_gi
+        from graphrag.index.verbs.entities.extraction.strategies.typing import Document
+
+        strategy = task["strategy"]
+        strategy.setdefault("llm", {})["api_key"] = self.config["llm"]["api_key"]
+        packing = strategy.pop("packing", None)
+        if packing is not None:
+            from grag_api.extraction_planner import extract_units
+            return await extract_units(
+                task["rows"], task["entity_types"], self.callbacks, self.cache, strategy,
+                concurrency=self.concurrency, **packing,
+            )
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def extract_unit(unit_id, text):
+            async with semaphore:
+                result = await run_gi(
+                    [Document(text=text, id=unit_id)], task["entity_types"], self.callbacks, self.cache, strategy
+                )
+            return [result.entities, result.graphml_graph]
+
+        return await asyncio.gather(*(extract_unit(unit_id, text) for unit_id, text in task["rows"]))
+
+    async def run(self, run_id: str | None = None, exit_when_idle: bool = False) -> int:
+        """
+        Work through tasks until the queue is empty (if exit_when_idle) or forever.
+
+        :param run_id: Only take tasks of this run
+        :return: The number of tasks this worker completed
+        """
+        completed = 0
+        stopped = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(stopped,), name="extract-lease", daemon=True)
+        renewer.start()
+        try:
+            while True:
+                task = self.queue.claim(self.worker_id, run_id)
+                if task is None:
+                    if exit_when_idle:
+                        return completed
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                try:
+                    results = await self.extract(task)
+                except Exception as e:
+                    log.exception("Extraction task %s failed (attempt %s)", task["id"], task["attempts"])
+                    if not self.queue.fail(task["id"], self.worker_id, task["attempts"], repr(e)):
+                        log.warning("Lease of extraction task %s was lost; leaving it to its new worker", task["id"])
+                    continue
+                if self.queue.complete(task["id"], self.worker_id, results):
+                    completed += 1
+                else:
+                    log.warning("Lease of extraction task %s was lost; discarding its results", task["id"])
+        finally:
+            stopped.set()
+            renewer.join()
+
+    def _renew(self, stopped: threading.Event):
+        """Extend the leases of the tasks this worker holds, until it stops."""
+        while not stopped.wait(self.queue.lease_seconds / 3):
+            self.queue.renew(self.worker_id)
+
+
+def _spawn_workers(workspace, run_id: str, count: int, api_key: str | None) -> list[subprocess.Popen]:
+    env = dict(os.environ)
+    if api_key:
+        # passed through the environment, never on the command line
+        env["OPENAI_API_KEY"] = api_key
+    command = [sys.executable, "-m", "grag_api.extraction_queue", "--workspace", str(workspace),
+               "--run-id", run_id, "--exit-when-idle"]
+    return [subprocess.Popen(command, env=env) for _ in range(count)]
+
+
+async def queued_entity_extract(
+        input,
+        callbacks,
+        column: str,
+        id_column: str,
+        to: str,
+        strategy: dict | None,
+        graph_to: str | None = None,
+        entity_types=None,
+        cache=None,
+        workspace="ragtest",
+        config=None,
+        local_workers: int = 0,
+        task_size: int = 16,
+        lease_seconds: float = 600.0,
+        max_attempts: int = 3,
+        packing: dict | None = None,
+        **kwargs,
+):
+    """
+    The entity_extract verb, run through the workspace's extraction queue.
+
+    Takes the same arguments as graphrag's entity_extract and produces the same columns,
+    so merge_graphs combines the partial graphs exactly as it does in the standard pipeline.
+
+    :param workspace: The workspace the queue lives in
+    :param config: The configuration dictionary, for the API key and request concurrency
+    :param local_workers: Worker processes to start on this host, besides the pipeline process
+    :param task_size: Text units per task
+    :param packing: pack_tokens and min_entity_density for the extraction planner; None extracts unit by unit
+    """
+    from datashaper import Progress, TableContainer
+    from graphrag.index.verbs.entities.extraction.entity_extract import DEFAULT_ENTITY_TYPES
+
+    output = input.get_input()
+    entity_types = entity_types or DEFAULT_ENTITY_TYPES
+    strategy = strategy or {}
+    if packing is not None:
+        # stored with the run, so every worker packs the same way and the run key covers it
+        strategy = {**strategy, "packing": packing}
+    rows = [(str(unit_id), text) for unit_id, text in zip(output[id_column], output[column])]
+    run_id = run_key(rows, _without_secrets(strategy), entity_types)
+
+    queue = ExtractionQueue(workspace, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    packs = None
+    if packing is not None:
+        from grag_api.extraction_planner import DEFAULT_PACK_TOKENS, plan_packs
+        packs = plan_packs(rows, strategy, packing.get("pack_tokens", DEFAULT_PACK_TOKENS))
+    total = queue.submit(run_id, rows, strategy, entity_types, task_size, packs)
+    log.info("Extraction run %s: %s units in %s tasks, %s local workers", run_id, len(rows), total, local_workers)
+    worker = ExtractionWorker(workspace, config=config, queue=queue, cache=cache, callbacks=callbacks)
+    processes = _spawn_workers(workspace, run_id, local_workers, worker.config["llm"]["api_key"])
+    try:
+        await worker.run(run_id, exit_when_idle=True)
+        # tasks leased by other workers finish (or their leases expire and come back to us)
+        while True:
+            progress = queue.progress(run_id)
+            callbacks.progress(Progress(total_items=total, completed_items=progress.get(DONE, 0)))
+            if not progress.get(QUEUED) and not progress.get(LEASED):
+                break
+            await worker.run(run_id, exit_when_idle=True)
+            await asyncio.sleep(worker.poll_interval)
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.wait()
+
+    if queue.progress(run_id).get(FAILED):
+        raise RuntimeError(f"Entity extraction run {run_id} has failed tasks: {queue.errors(run_id)}")
+    results = queue.results(run_id)
+    # runs are keyed by all their inputs, so no later run reuses the tasks of another
+    queue.prune(run_id)
+    output[to] = [results[unit_id][0] for unit_id, _ in rows]
+    if graph_to is not None:
+        output[graph_to] = [results[unit_id][1] for unit_id, _ in rows]
+    return TableContainer(table=output.reset_index(drop=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run entity extraction tasks from a workspace's queue.")
+    parser.add_argument("--workspace", default="ragtest")
+    parser.add_argument("--run-id", default=None, help="Only take tasks of this run")
+    parser.add_argument("--concurrency", type=int, default=None, help="Units extracted at the same time")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop once there is nothing to do")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    worker = ExtractionWorker(args.workspace, concurrency=args.concurrency)
+    completed = asyncio.run(worker.run(args.run_id, exit_when_idle=args.exit_when_idle))
+    log.info("Worker %s completed %s tasks", worker.worker_id, completed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+"""
+Columnar replacements for graphrag's graph verbs and finalization workflows.
+
+graphrag passes the entity graph between workflows as GraphML and rebuilds a
+NetworkX graph from it in every verb that touches it: merge_graphs merges the
+partial graphs attribute dict by attribute dict, cluster_graph parses and
+re-serializes the whole graph once per community level, and create_final_nodes
+and create_final_communities unpack each level into one dict per node or edge
+before joining them with string keys. Here a graph is a pair of DataFrames,
+nodes and edges, read once per verb with the C XML parser and written back with
+vectorized string operations. Merging is a groupby, node degrees and edge
+endpoints are integer arrays, and the final tables are built from integer joins.
+
+GraphML stays the format between workflows, so the artifacts and graphrag's
+other verbs are unchanged. The outputs match graphrag's row for row, including
+the seeded node and edge ids, because rows are kept in the order networkx
+iterates them; tests/test_graph_tables.py checks this on small graphs with
+repeated, self-looping, undeclared and attribute-less nodes and edges.
+"""
+import logging
+import math
+import xml.etree.ElementTree as ET
+from itertools import chain
+from random import Random
+from typing import Any
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from datashaper import TableContainer, VerbCallbacks, VerbInput, progress_iterable
+
+from graphrag.index.utils import gen_uuid
+from graphrag.index.verbs.graph.clustering.cluster_graph import run_layout
+from graphrag.index.verbs.graph.merge.defaults import (
+    DEFAULT_CONCAT_SEPARATOR,
+    DEFAULT_EDGE_OPERATIONS,
+    DEFAULT_NODE_OPERATIONS,
+)
+from graphrag.index.verbs.graph.merge.typing import DetailedAttributeMergeOperation
+
+log = logging.getLogger(__name__)
+
+GRAPHML_NS = "{http://graphml.graphdrawing.org/xmlns}"
+GRAPHML_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+    'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">'
+)
+GRAPHML_TYPES = {"boolean": bool, "int": int, "long": int, "float": float, "double": float, "string": str}
+BOOLEANS = {"true": True, "false": False, "1": True, "0": False}
+# the seed graphrag's apply_clustering draws node and edge ids from, so ids stay the same
+ID_SEED = 0xF001
+
+TEXT_ESCAPES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"))
+ATTRIBUTE_ESCAPES = TEXT_ESCAPES + (('"', "&quot;"), ("\n", "&#10;"), ("\r", "&#13;"), ("\t", "&#09;"))
+
+
+def _read_elements(elements, keys: dict, id_attributes: tuple[str, ...]) -> tuple[list[list], dict[str, dict]]:
+    """The id attributes of each element, and each data key's values by element position."""
+    ids = [[] for _ in id_attributes]
+    data = {}
+    for row, element in enumerate(elements):
+        for column, name in zip(ids, id_attributes):
+            column.append(element.get(name))
+        for item in element:
+            # like networkx, skip yFiles extensions and read empty data elements as ""
+            if item.tag != f"{GRAPHML_NS}data" or len(item):
+                continue
+            name, kind = keys[item.get("key")]
+            text = item.text
+            if text is None:
+                data.setdefault(name, {})[row] = ""
+            else:
+                data.setdefault(name, {})[row] = BOOLEANS[text.lower()] if kind is bool else kind(text)
+    return ids, data
+
+
+def _table(ids: dict[str, list], data: dict[str, dict]) -> pd.DataFrame:
+    """A frame of the id columns and one object column per attribute, missing values as NaN."""
+    length = len(next(iter(ids.values())))
+    columns = dict(ids)
+    for name, values in data.items():
+        column = np.full(length, np.nan, dtype=object)
+        column[list(values)] = list(values.values())
+        columns[name] = column
+    return pd.DataFrame(columns)
+
+
+def _networkx_edge_order(labels: pd.Index, sources, targets) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The order networkx iterates the edges of an undirected graph in, given in insertion order:
+    by the position of their earlier end, then by insertion. The earlier end is reported first.
+
+    :return: (order, source positions, target positions), the positions already in that order
+    """
+    source_positions = labels.get_indexer(sources)
+    target_positions = labels.get_indexer(targets)
+    first = np.minimum(source_positions, target_positions)
+    second = np.maximum(source_positions, target_positions)
+    order = np.argsort(first, kind="stable")
+    return order, first[order], second[order]
+
+
+def _parse_graphml(graphml) -> tuple[list, dict[str, dict], list, list, dict[str, dict]]:
+    """
+    The labels, node attributes, edge ends and edge attributes of an undirected GraphML graph,
+    as networkx would iterate them, in plain lists and dicts by row.
+    """
+    if not isinstance(graphml, str):
+        graphml = "\n".join(nx.generate_graphml(graphml))
+    root = ET.fromstring(graphml)
+    keys = {
+        key.get("id"): (key.get("attr.name"), GRAPHML_TYPES.get(key.get("attr.type"), str))
+        for key in root.iter(f"{GRAPHML_NS}key")
+    }
+    graph = root.find(f"{GRAPHML_NS}graph")
+    (labels,), node_data = _read_elements(graph.iterfind(f"{GRAPHML_NS}node"), keys, ("id",))
+    (sources, targets), edge_data = _read_elements(graph.iterfind(f"{GRAPHML_NS}edge"), keys, ("source", "target"))
+
+    # networkx adds the undeclared ends of edges as nodes
+    declared = set(labels)
+    labels += [label for label in dict.fromkeys(chain.from_iterable(zip(sources, targets))) if label not in declared]
+
+    # by the position of the earlier end, then by insertion, with the earlier end first
+    positions = {label: position for position, label in enumerate(labels)}
+    ends = [sorted((positions[source], positions[target])) for source, target in zip(sources, targets)]
+    order = sorted(range(len(ends)), key=lambda row: ends[row][0])
+    edge_data = {
+        name: {new: values[old] for new, old in enumerate(order) if old in values}
+        for name, values in edge_data.items()
+    }
+    return labels, node_data, [labels[ends[row][0]] for row in order], [labels[ends[row][1]] for row in order], edge_data
+
+
+def read_graphml(graphml) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The nodes and edges of an undirected GraphML graph, as networkx would iterate them.
+
+    Nodes have a label column and edges source and target columns, plus one column
+    per attribute. Values keep the types declared by their keys.
+
+    :param graphml: A GraphML string, or a networkx graph
+    """
+    labels, node_data, sources, targets, edge_data = _parse_graphml(graphml)
+    return _table({"label": labels}, node_data), _table({"source": sources, "target": targets}, edge_data)
+
+
+def read_graphmls(graphmls) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The nodes and edges of many graphs, concatenated in order. Cheaper than concatenating
+    read_graphml's frames for the many small graphs entity extraction emits.
+    """
+    labels, node_data, sources, targets, edge_data = [], {}, [], [], {}
+    for graphml in graphmls:
+        graph_labels, graph_node_data, graph_sources, graph_targets, graph_edge_data = _parse_graphml(graphml)
+        for data, graph_data, offset in ((node_data, graph_node_data, len(labels)), (edge_data, graph_edge_data, len(sources))):
+            for name, values in graph_data.items():
+                data.setdefault(name, {}).update((offset + row, value) for row, value in values.items())
+        labels += graph_labels
+        sources += graph_sources
+        targets += graph_targets
+    return _table({"label": labels}, node_data), _table({"source": sources, "target": targets}, edge_data)
+
+
+def _escape(values: pd.Series, escapes) -> pd.Series:
+    for character, entity in escapes:
+        values = values.str.replace(character, entity, regex=False)
+    return values
+
+
+def _value_type(value) -> str:
+    if isinstance(value, (bool, np.bool_)):
+        return "boolean"
+    if isinstance(value, (int, np.integer)):
+        return "long"
+    if isinstance(value, (float, np.floating)):
+        return "double"
+    return "string"
+
+
+def _graphml_type(values: pd.Series) -> str:
+    if values.dtype.kind == "b":
+        return "boolean"
+    if values.dtype.kind in "iu":
+        return "long"
+    if values.dtype.kind == "f":
+        return "double"
+    kinds = set(values.map(type))
+    if all(issubclass(kind, (bool, np.bool_)) for kind in kinds):
+        return "boolean"
+    if all(issubclass(kind, (int, np.integer)) and not issubclass(kind, bool) for kind in kinds):
+        return "long"
+    if all(issubclass(kind, (float, np.floating)) for kind in kinds):
+        return "double"
+    return "string"
+
+
+def _elements(tag: str, ids: dict[str, pd.Series], table: pd.DataFrame, keys: list[tuple]) -> pd.Series:
+    """One GraphML element per row, as strings."""
+    elements = f"<{tag}"
+    for attribute, values in ids.items():
+        elements = elements + f' {attribute}="' + _escape(values.astype(str), ATTRIBUTE_ESCAPES) + '"'
+    elements = elements + ">"
+    for key, name, graphml_type, rows in keys:
+        values = table[name]
+        present = values.notna() if rows is None else values.index.isin(rows)
+        values = values[present]
+        if graphml_type == "boolean":
+            text = values.map(lambda value: "true" if value else "false")
+        else:
+            text = _escape(values.astype(str), TEXT_ESCAPES) if graphml_type == "string" else values.astype(str)
+        data = pd.Series("", index=table.index, dtype=object)
+        data[present] = f'<data key="{key}">' + text + "</data>"
+        elements = elements + data
+    return elements + f"</{tag}>"
+
+
+def write_graphml(nodes: pd.DataFrame, edges: pd.DataFrame) -> str:
+    """
+    An undirected GraphML graph of the given nodes and edges, in their row order.
+
+    Missing values are left out, which is how networkx reads them back.
+    """
+    keys = {"node": [], "edge": []}
+    declarations = []
+    for scope, table, id_columns in (("node", nodes, ("label",)), ("edge", edges, ("source", "target"))):
+        for name in table.columns:
+            values = table[name]
+            values = values[values.notna()]
+            if name in id_columns or values.empty:
+                continue
+            value_types = values.map(_value_type) if values.dtype == object else None
+            if value_types is None or value_types.nunique() == 1:
+                typed = [(_graphml_type(values), None)]
+            else:
+                # like networkx, one key per type for an attribute whose values differ in type
+                typed = [(graphml_type, value_types.index[value_types == graphml_type])
+                         for graphml_type in value_types.unique()]
+            for graphml_type, rows in typed:
+                key = f"d{len(declarations)}"
+                keys[scope].append((key, name, graphml_type, rows))
+                declarations.append(f'<key id="{key}" for="{scope}" attr.name="{name}" attr.type="{graphml_type}" />')
+    node_elements = _elements("node", {"id": nodes["label"]}, nodes, keys["node"]) if len(nodes) else []
+    edge_elements = (
+        _elements("edge", {"source": edges["source"], "target": edges["target"]}, edges, keys["edge"])
+        if len(edges) else []
+    )
+    return "\n".join([
+        GRAPHML_HEADER,
+        *declarations,
+        '<graph edgedefault="undirected">',
+        *node_elements,
+        *edge_elements,
+        "</graph>",
+        "</graphml>",
+    ])
+
+
+def _merge_operation(value: str | dict[str, Any]) -> DetailedAttributeMergeOperation:
+    if isinstance(value, str):
+        return DetailedAttributeMergeOperation(operation=value)
+    return DetailedAttributeMergeOperation(**value)
+
+
+def _or(values: pd.Series, default) -> pd.Series:
+    """graphrag's `value or default`, with NaN for a missing value."""
+    return values.map(lambda value: value if value == value and value else default)
+
+
+def _merge_column(
+        values: pd.Series, groups: np.ndarray, operation: DetailedAttributeMergeOperation, named: bool = True
+) -> pd.Series:
+    """
+    graphrag's pairwise merge of an attribute, folded over each group of repeated rows.
+
+    The first row of a group is the merge target. graphrag merges a later row's value when
+    the row has the attribute or, for an attribute with its own operation, once the target
+    has it; a row without it merges as a missing value. A group no row is merged into keeps
+    its first value as it is.
+
+    :param values: The attribute of the repeated rows, in merge order
+    :param groups: Each row's group number, numbered in order of first appearance
+    :param named: Whether the attribute has its own operation, rather than the "*" one
+    :return: The merged value of each group
+    """
+    name = str(getattr(operation.operation, "value", operation.operation))
+    values = values.reset_index(drop=True)
+    position = pd.Series(groups).groupby(groups).cumcount().to_numpy()
+    present = values.notna().to_numpy()
+    if named:
+        merged_rows = (position > 0) & (pd.Series(present).groupby(groups).cummax().to_numpy())
+    else:
+        merged_rows = (position > 0) & present
+    first = values[position == 0].to_numpy()
+    any_merged = np.bincount(groups, weights=merged_rows, minlength=len(first)) > 0
+    # the target and the rows merged into it, in order
+    rows = (position == 0) | merged_rows
+    folded_values, folded_groups = values[rows], groups[rows]
+    grouped = lambda series: series.groupby(folded_groups, sort=True)  # noqa E731
+
+    if name == "replace":
+        last = pd.Series(np.arange(len(values))[rows]).groupby(folded_groups, sort=True).max()
+        merged = _or(values.iloc[last.to_numpy()].reset_index(drop=True), "")
+    elif name == "skip":
+        merged = _or(pd.Series(first, dtype=object), "")
+    elif name == "concat":
+        separator = operation.separator or DEFAULT_CONCAT_SEPARATOR
+        merged = grouped(_or(folded_values, "").astype(str)).agg(separator.join)
+        if operation.distinct:
+            merged = merged.map(lambda text: separator.join(sorted(set(text.split(separator)))))
+    elif name == "multiply":
+        merged = grouped(_or(folded_values, 1)).agg(math.prod)
+    elif name in ("sum", "max", "min"):
+        merged = grouped(_or(folded_values, 0)).agg(name)
+    elif name == "average":
+        # ((v1 + v2) / 2 + v3) / 2 ... weighs the i-th of k values by 1 / 2 ** (k - max(i, 1))
+        folded_position = pd.Series(folded_groups).groupby(folded_groups).cumcount().to_numpy()
+        size = np.bincount(folded_groups)[folded_groups]
+        weights = 0.5 ** (size - np.maximum(folded_position, 1))
+        merged = grouped(pd.to_numeric(_or(folded_values, 0)).reset_index(drop=True) * weights).sum()
+    else:
+        raise ValueError(f"Invalid operation {operation.operation}")
+    merged = pd.Series(merged.to_numpy(), dtype=object)
+    return merged.where(any_merged, pd.Series(first, dtype=object))
+
+
+def _merge_rows(table: pd.DataFrame, key: str, operations: dict[str, Any], fixed=()) -> pd.DataFrame:
+    """
+    Merge the rows sharing a key the way graphrag's merge_graphs merges repeated nodes or edges.
+
+    The first row of each key is kept in place; attributes with an operation, or covered
+    by "*", are merged over all its rows in order. Missing values count as empty. As in
+    graphrag, nothing is merged into a first row without attributes.
+    """
+    merged = table.drop_duplicates(key).set_index(key)
+    attributes = [column for column in table.columns if column != key and column not in fixed]
+    # graphrag merges into `attributes or {}`, a new dict when the first has no attributes
+    attributeless = merged.index[merged[attributes].isna().all(axis=1)] if attributes else merged.index
+    repeated = table[table.duplicated(key, keep=False) & ~table[key].isin(attributeless)]
+    if repeated.empty:
+        return merged.reset_index()
+    groups = repeated.groupby(key, sort=False).ngroup().to_numpy()
+    group_keys = repeated[key].drop_duplicates().to_numpy()
+    operations = {name: _merge_operation(value) for name, value in operations.items()}
+    for column in table.columns:
+        operation = operations.get(column, operations.get("*"))
+        if column == key or column in fixed or operation is None:
+            continue
+        values = _merge_column(repeated[column], groups, operation, named=column in operations)
+        merged[column] = merged[column].astype(object)
+        merged.loc[group_keys, column] = values.to_numpy()
+    return merged.reset_index()
+
+
+def merge_graph_tables(
+        graphs: list[tuple[pd.DataFrame, pd.DataFrame]],
+        node_operations: dict[str, Any] = DEFAULT_NODE_OPERATIONS,
+        edge_operations: dict[str, Any] = DEFAULT_EDGE_OPERATIONS,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Merge graphs given as (nodes, edges) into one, as graphrag's merge_graphs does."""
+    if not graphs:
+        return pd.DataFrame({"label": []}), pd.DataFrame({"source": [], "target": []})
+    return _merge_tables(
+        pd.concat([graph_nodes for graph_nodes, _ in graphs], ignore_index=True),
+        pd.concat([graph_edges for _, graph_edges in graphs], ignore_index=True),
+        node_operations,
+        edge_operations,
+    )
+
+
+def _merge_tables(
+        nodes: pd.DataFrame, edges: pd.DataFrame, node_operations: dict[str, Any], edge_operations: dict[str, Any]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Merge the concatenated nodes and edges of several graphs."""
+    nodes = _merge_rows(nodes, "label", node_operations)
+    if edges.empty:
+        return nodes, edges
+    swap = edges["source"] > edges["target"]
+    first = edges["source"].where(~swap, edges["target"])
+    second = edges["target"].where(~swap, edges["source"])
+    edges.insert(0, "_pair", first + "\x00" + second)
+    edges = _merge_rows(edges, "_pair", edge_operations, fixed=("source", "target")).drop(columns="_pair")
+
+    labels = pd.Index(nodes["label"])
+    order, source_positions, target_positions = _networkx_edge_order(labels, edges["source"], edges["target"])
+    edges = edges.iloc[order].reset_index(drop=True)
+    edges["source"] = labels[source_positions]
+    edges["target"] = labels[target_positions]
+    return nodes, edges
+
+
+def merge_graphs(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        column: str,
+        to: str,
+        nodes: dict[str, Any] = DEFAULT_NODE_OPERATIONS,
+        edges: dict[str, Any] = DEFAULT_EDGE_OPERATIONS,
+        **kwargs,
+) -> TableContainer:
+    """Drop-in for graphrag's merge_graphs verb: merges every row's graph into one."""
+    input_df = input.get_input()
+    all_nodes, all_edges = read_graphmls(
+        graphml
+        for graphml in progress_iterable(input_df[column], callbacks.progress, len(input_df))
+        if graphml is not None
+    )
+    merged_nodes, merged_edges = _merge_tables(all_nodes, all_edges, nodes, edges)
+    return TableContainer(table=pd.DataFrame({to: [write_graphml(merged_nodes, merged_edges)]}))
+
+
+def _leiden_input(nodes: pd.DataFrame, edges: pd.DataFrame) -> nx.Graph:
+    """The graph with only what clustering reads, the edge weights."""
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes["label"])
+    weights = edges["weight"] if "weight" in edges.columns else pd.Series(np.nan, index=edges.index)
+    graph.add_edges_from(
+        (source, target, {"weight": weight}) if weight == weight else (source, target)
+        for source, target, weight in zip(edges["source"], edges["target"], weights)
+    )
+    return graph
+
+
+def cluster_graph(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        strategy: dict[str, Any],
+        column: str,
+        to: str,
+        level_to: str | None = None,
+        **kwargs,
+) -> TableContainer:
+    """
+    Drop-in for graphrag's cluster_graph verb: one row per community level with the graph,
+    each node labelled with its community, degree and ids.
+
+    The graph is parsed once and the communities computed once; only the community
+    and level columns differ between the levels' GraphML.
+    """
+    input_df = input.get_input()
+    level_to = level_to or f"{to}_level"
+    rows = []
+    for _, row in progress_iterable(input_df.iterrows(), callbacks.progress, len(input_df)):
+        nodes, edges = read_graphml(row[column])
+        communities = run_layout(strategy, _leiden_input(nodes, edges))
+
+        # the same for every level: graphrag re-seeds the ids per level
+        labels = pd.Index(nodes["label"])
+        positions = np.concatenate([labels.get_indexer(edges["source"]), labels.get_indexer(edges["target"])])
+        random = Random(ID_SEED)
+        node_ids = pd.DataFrame({
+            "degree": np.bincount(positions, minlength=len(nodes)).astype(object),
+            "human_readable_id": np.arange(len(nodes)).astype(object),
+            "id": [gen_uuid(random) for _ in range(len(nodes))],
+        })
+        edges["id"] = [gen_uuid(random) for _ in range(len(edges))]
+        edges["human_readable_id"] = np.arange(len(edges)).astype(object)
+
+        by_level = {}
+        for level, community, members in communities:
+            by_level.setdefault(level, {}).update(dict.fromkeys(members, community))
+        for level in sorted(by_level):
+            cluster = nodes["label"].map(by_level[level])
+            level_nodes = pd.concat([
+                nodes.assign(cluster=cluster, level=pd.Series(level, index=nodes.index, dtype=object).where(cluster.notna())),
+                node_ids,
+            ], axis=1)
+            level_edges = edges.assign(level=level)
+            rows.append({**row.to_dict(), level_to: level, to: write_graphml(level_nodes, level_edges)})
+    output = pd.DataFrame(rows, columns=[*input_df.columns, *(c for c in (level_to, to) if c not in input_df.columns)])
+    return TableContainer(table=output)
+
+
+def unpack_tables(
+        input_df: pd.DataFrame,
+        column: str,
+        unpack_type: str,
+        copy: list[str] | None = None,
+        embeddings_column: str = "embeddings",
+) -> pd.DataFrame:
+    """The nodes or edges of every row's graph, with the row's copy columns, as graphrag's unpack_graph."""
+    copy = [name for name in (["level"] if copy is None else copy) if name in input_df.columns]
+    has_embeddings = embeddings_column in input_df.columns
+    tables = []
+    for _, row in input_df.iterrows():
+        nodes, edges = read_graphml(row[column])
+        if unpack_type == "nodes":
+            table = nodes
+            embeddings = row[embeddings_column] if has_embeddings else {}
+            table["graph_embedding"] = [embeddings.get(label) for label in table["label"]]
+        elif unpack_type == "edges":
+            table = edges
+        else:
+            raise ValueError(f"Unknown type {unpack_type}")
+        # the graph's own attributes win over the copied ones
+        for position, name in enumerate(copy):
+            values = table.pop(name).where(lambda values: values.notna(), row[name]) if name in table else row[name]
+            table.insert(position, name, values)
+        tables.append(table)
+    if not tables:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True).infer_objects()
+
+
+def unpack_graph(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        column: str,
+        type: str,  # noqa A002
+        copy: list[str] | None = None,
+        embeddings_column: str = "embeddings",
+        **kwargs,
+) -> TableContainer:
+    """Drop-in for graphrag's unpack_graph verb."""
+    return TableContainer(table=unpack_tables(input.get_input(), column, type, copy, embeddings_column))
+
+
+def create_final_nodes_table(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        column: str = "clustered_graph",
+        level_for_node_positions: int = 0,
+        **kwargs,
+) -> TableContainer:
+    """
+    graphrag's create_final_nodes workflow with the zero layout in one step: every node of every
+    level, sized by its degree, positioned at the origin via its node at the positions level.
+    """
+    nodes = unpack_tables(input.get_input(), column, "nodes")
+    if nodes.empty:
+        return TableContainer(table=nodes)
+    nodes.insert(nodes.columns.get_loc("graph_embedding"), "size", nodes["degree"] if "degree" in nodes else 0)
+    positions = pd.DataFrame({
+        "top_level_node_id": nodes.loc[nodes["level"] == level_for_node_positions, "id"].astype(str),
+        "x": 0,
+        "y": 0,
+    })
+    nodes = nodes.merge(positions, left_on="id", right_on="top_level_node_id")
+    return TableContainer(table=nodes.rename(columns={"label": "title", "cluster": "community"}))
+
+
+def _level_communities(level, nodes: pd.DataFrame, edges: pd.DataFrame) -> pd.DataFrame:
+    """
+    The communities of one level, with the distinct ids of the edges touching their nodes and
+    their nodes' source ids, in the order graphrag's joins produce them.
+    """
+    labels = pd.Index(nodes["label"])
+    source_positions = labels.get_indexer(edges["source"])
+    target_positions = labels.get_indexer(edges["target"])
+    # graphrag joins nodes to edges by source, then by target: node order, then edge order
+    by_source = np.argsort(source_positions, kind="stable")
+    by_target = np.argsort(target_positions, kind="stable")
+    node_rows = np.concatenate([source_positions[by_source], target_positions[by_target]])
+    edge_rows = np.concatenate([by_source, by_target])
+
+    clusters = nodes["cluster"].to_numpy(dtype=object) if "cluster" in nodes else np.full(len(nodes), np.nan, object)
+    source_ids = nodes["source_id"].to_numpy(dtype=object) if "source_id" in nodes else np.full(len(nodes), np.nan, object)
+    pairs = pd.DataFrame({
+        "cluster": clusters[node_rows],
+        "relationship": edges["id"].to_numpy(dtype=object)[edge_rows],
+        "text_unit": source_ids[node_rows],
+    }).dropna(subset=["cluster"])
+
+    relationship_ids = pairs.drop_duplicates(["cluster", "relationship"]).groupby("cluster", sort=False)["relationship"]
+    text_unit_ids = pairs.drop_duplicates(["cluster", "text_unit"]).groupby("cluster", sort=False)["text_unit"]
+    communities = pd.DataFrame({"id": pd.unique(pd.Series(clusters).dropna())})
+    communities = communities.merge(
+        pd.DataFrame({"relationship_ids": relationship_ids.agg(list), "text_unit_ids": text_unit_ids.agg(list)}),
+        left_on="id",
+        right_index=True,
+    )
+    communities.insert(1, "title", "Community " + communities["id"].astype(str))
+    communities.insert(2, "level", level)
+    communities.insert(3, "raw_community", communities["id"])
+    return communities
+
+
+def create_final_communities_table(
+        input: VerbInput,
+        callbacks: VerbCallbacks,
+        column: str = "clustered_graph",
+        **kwargs,
+) -> TableContainer:
+    """graphrag's create_final_communities workflow in one step, joining each level's nodes and edges by position."""
+    communities = []
+    for _, row in input.get_input().iterrows():
+        nodes, edges = read_graphml(row[column])
+        communities.append(_level_communities(row["level"], nodes, edges))
+    columns = ["id", "title", "level", "raw_community", "relationship_ids", "text_unit_ids"]
+    if not communities:
+        return TableContainer(table=pd.DataFrame(columns=columns))
+    return TableContainer(table=pd.concat(communities, ignore_index=True)[columns])
+
+
+GRAPH_VERBS = {
+    "merge_graphs": merge_graphs,
+    "cluster_graph": cluster_graph,
+    "unpack_graph": unpack_graph,
+    "create_final_nodes_table": create_final_nodes_table,
+    "create_final_communities_table": create_final_communities_table,
+}
+
+
+def use_columnar_workflows(workflows: list) -> None:
+    """
+    Replace the steps of create_final_nodes and create_final_communities in a pipeline's
+    workflow references with the single-step versions above. create_final_nodes keeps its
+    own steps when it lays the graph out with UMAP or snapshots the top-level nodes.
+    """
+    for workflow in workflows:
+        config = workflow.config or {}
+        if workflow.name == "create_final_nodes":
+            if config.get("layout_graph_enabled", True) or config.get("snapshot_top_level_nodes", False):
+                continue
+            workflow.steps = [{
+                "verb": "create_final_nodes_table",
+                "args": {"level_for_node_positions": config.get("level_for_node_positions", 0)},
+                "input": {"source": "workflow:create_base_entity_graph"},
+            }]
+        elif workflow.name == "create_final_communities":
+            workflow.steps = [{
+                "verb": "create_final_communities_table",
+                "input": {"source": "workflow:create_base_entity_graph"},
+            }]
@@ -1,7 +1,7 @@
 import time
+from functools import partial
 from pathlib import Path
 import yaml
-import pandas as pd
 from graphrag.config import create_graphrag_config
 from graphrag.index import PipelineConfig, create_pipeline_config
 from graphrag.index.graph.extractors.claims.prompts import CLAIM_EXTRACTION_PROMPT
@@ -10,6 +10,19 @@ from graphrag.index.graph.extractors.graph.prompts import GRAPH_EXTRACTION_PROMP
 from graphrag.index.graph.extractors.summarize.prompts import SUMMARIZE_PROMPT
 from graphrag.index.progress import NullProgressReporter
 from graphrag.index.run import run_pipeline_with_config
+from graphrag.index.verbs.entities.extraction import entity_extract
+
+from grag_api.arena import ARENA_DIR, publish_arena
+from grag_api.artifact_store import compact_artifacts, expand_artifacts
+from grag_api.embedding_cache import cached_text_embed
+from grag_api.extraction_planner import planned_entity_extract
+from grag_api.extraction_queue import queued_entity_extract
+from grag_api.graph_tables import GRAPH_VERBS, use_columnar_workflows
+from grag_api.lexical import build_lexical_index
+from grag_api.query import ARENA_COLUMNS, LAZY_BODIES, build_entity_vector_store
+from grag_api.summarize import batched_summarize_descriptions
+from grag_api.text_store import remove_text_stores
+from grag_api.tokens import add_token_counts
 
 
 class GraphRAGIndexer:
@@ -17,7 +30,6 @@ class GraphRAGIndexer:
         self.workspace = workspace
         self.config = config
         self.reporter = NullProgressReporter()
-        self.dataset_path = Path(self.workspace) / "dataset.parquet"
         self.index_file_path = Path(self.workspace) / "_index"
         self._check_and_init()
 
@@ -28,19 +40,22 @@ class GraphRAGIndexer:
             self._init()
         else:
             self.reporter.info("Found existing workspace.")
-            root = Path(self.workspace)
-            settings_yaml = root / "settings.yaml"
-            with settings_yaml.open("w") as file:
-                yaml.dump(self.config, file, default_flow_style=False, sort_keys=False)
+            self._write_settings()
+
+    def _write_settings(self):
+        """Write settings.yaml for the pipeline, leaving the file untouched if it already matches."""
+        settings_yaml = Path(self.workspace) / "settings.yaml"
+        settings = yaml.dump(self.config, default_flow_style=False, sort_keys=False)
+        if settings_yaml.exists() and settings_yaml.read_text() == settings:
+            return
+        settings_yaml.write_text(settings)
 
     def _init(self):
         self.reporter.info(f"Initializing project at {self.workspace}")
         root = Path(self.workspace)
         root.mkdir(parents=True, exist_ok=True)
 
-        settings_yaml = root / "settings.yaml"
-        with settings_yaml.open("w") as file:
-            yaml.dump(self.config, file, default_flow_style=False, sort_keys=False)
+        self._write_settings()
 
         prompts_dir = root / "prompts"
         prompts_dir.mkdir(parents=True, exist_ok=True)
@@ -58,16 +73,28 @@ class GraphRAGIndexer:
                 with file_path.open("wb") as file:
                     file.write(content.encode(encoding="utf-8", errors="strict"))
 
-        if not self.dataset_path.exists():
-            empty_df = pd.DataFrame(columns=["id", "text", "title"])
-            empty_df.to_parquet(self.dataset_path)
-
-    def _update_index(self):
-        timestamp = str(int(time.time()))
+    def _update_index(self, timestamp=None):
+        timestamp = timestamp or str(int(time.time()))
         with self.index_file_path.open("w") as f:
             f.write(timestamp)
         self.reporter.info(f"Updated index timestamp: {timestamp}")
 
+    def _entity_extract_verb(self):
+        """
+        The entity_extract verb for this run. Verbs are registered process-wide, so graphrag's
+        own is passed explicitly when the queue and planner are off, in case an earlier run replaced it.
+        """
+        queue_config = dict(self.config.get("extraction_queue") or {})
+        planner_config = dict(self.config.get("extraction_planner") or {})
+        packing = planner_config if planner_config.pop("enabled", False) else None
+        if queue_config.pop("enabled", False):
+            return partial(
+                queued_entity_extract, workspace=self.workspace, config=self.config, packing=packing, **queue_config
+            )
+        if packing is not None:
+            return partial(planned_entity_extract, **packing)
+        return entity_extract
+
     async def run(self, dataset):
         await self._ainsert(dataset)
 
@@ -84,16 +111,46 @@ class GraphRAGIndexer:
 
         pipeline_config.storage.base_dir = str(output_dir / "artifacts")
         pipeline_config.reporting.base_dir = str(output_dir / "reports")
-
+        use_columnar_workflows(pipeline_config.workflows)
+        artifact_config = dict(self.config.get("artifact_store") or {})
+        compact = artifact_config.pop("enabled", False)
+        if self.config.get("skip_workflows"):
+            # skipped workflows' outputs are read back from the artifacts by the pipeline
+            expand_artifacts(output_dir / "artifacts")
+
+        cache_base_dir = (self.config.get("cache") or {}).get("base_dir", "cache")
         async for output in run_pipeline_with_config(
                 pipeline_config,
                 dataset=dataset,
                 run_id="graph",
                 progress_reporter=self.reporter,
+                additional_verbs={
+                    **GRAPH_VERBS,
+                    "entity_extract": self._entity_extract_verb(),
+                    "text_embed": partial(cached_text_embed, workspace=self.workspace, cache_base_dir=cache_base_dir),
+                    "summarize_descriptions": partial(
+                        batched_summarize_descriptions,
+                        workspace=self.workspace,
+                        cache_base_dir=cache_base_dir,
+                        **(self.config.get("summarize_batches") or {}),
+                    ),
+                },
         ):
             if output.errors:
                 self.reporter.error(f"{output.workflow}: {output.errors}")
             else:
                 self.reporter.success(output.workflow)
-        self._update_index()
+        add_token_counts(output_dir / "artifacts", self.config['encoding_model'])
+        if compact:
+            compact_artifacts(output_dir / "artifacts", **artifact_config)
+        build_lexical_index(output_dir / "artifacts")
+        # the arena carries the text bodies, so IPC sidecars would only duplicate them
+        remove_text_stores(output_dir / "artifacts", LAZY_BODIES)
+        # publish the shared arena before bumping _index, so queriers that see the new
+        # timestamp always find its generation
+        timestamp = str(int(time.time()))
+        publish_arena(
+            output_dir / "artifacts", Path(self.workspace) / ARENA_DIR, timestamp, ARENA_COLUMNS, build_entity_vector_store
+        )
+        self._update_index(timestamp)
         self.reporter.success("All workflows completed successfully.")
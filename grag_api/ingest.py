@@ -0,0 +1,345 @@
+"""
+Background ingestion of uploaded PDFs.
+
+Uploads are saved and recorded as jobs in a SQLite queue in the workspace, so
+they survive restarts, and the caller returns immediately. A pool of worker
+threads partitions and captions files in parallel (the work is dominated by
+Unstructured and OpenAI calls, so threads overlap it well), and a single
+committer thread writes finished files to the dataset in batches, so 30 uploads
+cost a handful of Parquet rewrites instead of 30. Each job's status, page count
+and error are kept in the queue for the UI.
+
+Several server processes may share a workspace's queue. A job is claimed under
+SQLite's write lock and leased to the claiming process, which renews the lease
+while it works on the job; only a job whose lease expired, or whose process on
+this host has exited, is taken over by another process.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from grag_api.metrics import DOCUMENTS_UPSERTED, INGEST_JOBS, INGEST_QUEUE_DEPTH
+
+log = logging.getLogger(__name__)
+
+QUEUE_FILE = "ingest_queue.sqlite"
+UPLOAD_DIR = "uploads"
+
+QUEUED = "queued"
+PROCESSING = "processing"
+COMMITTING = "committing"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, PROCESSING, COMMITTING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pages INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    worker TEXT,
+    lease_expires REAL
+)
+"""
+# columns added after the first release, added to existing queue files on open
+LEASE_COLUMNS = {"worker": "TEXT", "lease_expires": "REAL"}
+
+
+def _process_exited(worker: str) -> bool:
+    """Whether the process a worker id names ran on this host and is gone."""
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class IngestionQueue:
+    """A persistent queue of PDF files, processed by a worker pool and committed in batches."""
+
+    def __init__(
+            self,
+            workspace,
+            db,
+            pdf_processor,
+            workers: int = 4,
+            batch_size: int = 8,
+            commit_interval: float = 5.0,
+            upload_dir=UPLOAD_DIR,
+            on_commit=None,
+            lease_seconds: float = 300.0,
+    ):
+        """
+        :param workspace: The workspace whose queue file is used
+        :param db: The DB finished files are written to
+        :param pdf_processor: Converts a PDF path to dataset rows, shared by the workers
+        :param workers: Files processed in parallel
+        :param batch_size: Files written to the dataset per commit, at most
+        :param commit_interval: Seconds a finished file may wait for others to share its commit
+        :param upload_dir: Where submitted file bytes are saved
+        :param on_commit: Called with the rows of each batch once they are in the dataset
+        :param lease_seconds: How long a job of a process that stopped renewing it stays claimed
+        """
+        self.path = Path(workspace) / QUEUE_FILE
+        self.db = db
+        self.pdf_processor = pdf_processor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.upload_dir = Path(upload_dir)
+        self.on_commit = on_commit
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._finished = []  # (job id, filename, rows) waiting for the committer
+        self._commit_ready = threading.Condition(threading.Lock())
+        self._threads = []
+        self._stopping = False
+        self._stopped = threading.Event()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in LEASE_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        INGEST_QUEUE_DEPTH.set_function(self.depth)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """A connection holding the write lock for the whole block, so claims never race."""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _set_status(self, job_ids, status: str, pages: int | None = None, error: str | None = None):
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE jobs SET status = ?, pages = COALESCE(?, pages), error = ?, updated_at = ?, "
+                "lease_expires = CASE WHEN ? IN (?, ?) THEN lease_expires END WHERE id = ?",
+                [(status, pages, error, time.time(), status, PROCESSING, COMMITTING, job_id) for job_id in job_ids],
+            )
+        INGEST_JOBS.labels(status=status).inc(len(job_ids))
+
+    def start(self):
+        """Start the workers and the committer. Safe to call repeatedly."""
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads.append(threading.Thread(target=self._commit, name="ingest-committer", daemon=True))
+            self._threads.append(threading.Thread(target=self._renew, name="ingest-lease", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Let the workers finish their current file and commit what is done."""
+        with self._lock:
+            self._stopping = True
+            self._work_ready.notify_all()
+        self._stopped.set()
+        with self._commit_ready:
+            self._commit_ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, filename: str, data: bytes, retry: bool = False) -> int | None:
+        """
+        Save an uploaded file and queue it.
+
+        :param filename: The file's name, which becomes its dataset title
+        :param data: The file's bytes
+        :param retry: Queue the file again if its last job failed; otherwise such a file is skipped,
+                      so a file left in an uploader is not retried on every rerun
+        :return: The job id, or None if the file is already in the dataset, in the queue, or failed
+        """
+        if filename in self.db.get_all_titles():
+            return None
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        path = self.upload_dir / filename
+        tmp_path = self.upload_dir / f".{filename}.{uuid.uuid4().hex}.tmp"
+        tmp_path.write_bytes(data)
+        try:
+            with self._transaction() as conn:
+                last = conn.execute(
+                    "SELECT status FROM jobs WHERE filename = ? ORDER BY id DESC LIMIT 1", (filename,)
+                ).fetchone()
+                if last is not None and (last["status"] in ACTIVE_STATUSES or (last["status"] == FAILED and not retry)):
+                    return None
+                # moved into place under the queue's lock, so a job never sees a half-written file
+                os.replace(tmp_path, path)
+                now = time.time()
+                job_id = conn.execute(
+                    "INSERT INTO jobs (filename, path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (filename, str(path), QUEUED, now, now),
+                ).lastrowid
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        INGEST_JOBS.labels(status=QUEUED).inc()
+        with self._lock:
+            self._work_ready.notify()
+        return job_id
+
+    def failed_files(self) -> set[str]:
+        """The files whose last job failed, which submit only queues again with retry=True."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT filename FROM jobs WHERE id IN (SELECT MAX(id) FROM jobs GROUP BY filename) AND status = ?",
+                (FAILED,),
+            ).fetchall()
+        return {row["filename"] for row in rows}
+
+    def _claim_next(self):
+        """Lease the oldest queued job, or one whose owner stopped renewing its lease or exited."""
+        now = time.time()
+        with self._transaction() as conn:
+            jobs = conn.execute(
+                "SELECT id, filename, path, status, worker, lease_expires FROM jobs "
+                "WHERE status IN (?, ?, ?) ORDER BY id",
+                (QUEUED, PROCESSING, COMMITTING),
+            ).fetchall()
+            for job in jobs:
+                if job["status"] != QUEUED and job["worker"] == self.worker_id:
+                    continue
+                if job["status"] != QUEUED and (job["lease_expires"] or 0) >= now and not (
+                        job["worker"] and _process_exited(job["worker"])):
+                    continue
+                if job["status"] != QUEUED:
+                    log.info("Taking over %s from %s", job["filename"], job["worker"])
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (PROCESSING, self.worker_id, now + self.lease_seconds, now, job["id"]),
+                )
+                return job
+        return None
+
+    def _claim(self):
+        """Take the next job, waiting for one; None once stopping."""
+        with self._lock:
+            while not self._stopping:
+                job = self._claim_next()
+                if job is not None:
+                    return job
+                # also wake up now and then for jobs queued by another process, or leases that expired
+                self._work_ready.wait(timeout=5.0)
+        return None
+
+    def _renew(self):
+        """Extend the leases of the jobs this process holds, until it stops."""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._transaction() as conn:
+                conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE worker = ? AND status IN (?, ?)",
+                    (time.time() + self.lease_seconds, self.worker_id, PROCESSING, COMMITTING),
+                )
+
+    def _work(self):
+        while (job := self._claim()) is not None:
+            INGEST_JOBS.labels(status=PROCESSING).inc()
+            log.info("Ingesting %s", job["filename"])
+            try:
+                rows = self.pdf_processor.run(job["path"])
+            except Exception as e:
+                log.exception("Ingesting %s failed", job["filename"])
+                self._set_status([job["id"]], FAILED, error=repr(e))
+                continue
+            self._set_status([job["id"]], COMMITTING, pages=len(rows))
+            with self._commit_ready:
+                self._finished.append((job["id"], job["filename"], rows))
+                self._commit_ready.notify()
+
+    def _commit(self):
+        while True:
+            with self._commit_ready:
+                while not self._finished and not self._stopping:
+                    self._commit_ready.wait()
+                # give files finishing around the same time a chance to share the commit
+                deadline = time.monotonic() + self.commit_interval
+                while len(self._finished) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._commit_ready.wait(remaining)
+                batch, self._finished = self._finished[:self.batch_size], self._finished[self.batch_size:]
+                if not batch and self._stopping:
+                    return
+            if batch:
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        job_ids = [job_id for job_id, _, _ in batch]
+        rows = [row for _, _, file_rows in batch for row in file_rows]
+        try:
+            self.db.batch_upsert_data(rows)
+        except Exception as e:
+            log.exception("Committing %s ingested files failed", len(batch))
+            self._set_status(job_ids, FAILED, error=repr(e))
+            return
+        DOCUMENTS_UPSERTED.labels(source="pdf").inc(len(rows))
+        if self.on_commit is not None:
+            try:
+                self.on_commit(rows)
+            except Exception:
+                # the rows are in the dataset; only what on_commit derives from them is missing
+                log.exception("Post-commit step for %s ingested files failed", len(batch))
+        self._set_status(job_ids, DONE)
+        log.info("Committed %s files (%s pages) to the dataset", len(batch), len(rows))
+
+    def jobs(self, limit: int = 200) -> list[dict]:
+        """The most recent jobs, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, filename, status, pages, error, created_at, updated_at FROM jobs "
+                "ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def depth(self) -> int:
+        """Jobs not yet committed."""
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                ACTIVE_STATUSES,
+            ).fetchone()[0]
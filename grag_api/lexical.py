@@ -0,0 +1,201 @@
+"""
+A BM25 inverted index over text units, for exact tariff terms.
+
+Item numbers, accessorial codes, NMFC classes and SCACs carry little meaning
+for an embedding model, but they match exactly in a lexical index. The index is
+built once per index run from create_final_text_units and stored next to it as
+a compressed .npz file; queriers only read that file, and build the index in
+memory when it is missing or stale. Postings are kept in CSR form: one int32 array of unit
+rows and one uint16 array of term frequencies, sliced per term through an
+offsets array, so a query touches only the postings of its own terms.
+"""
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from grag_api.artifact_store import read_artifact
+
+# keeps codes such as "175.5", "nmfc-100" and "50/55" as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+# carrier SCACs and accessorial codes are written as short upper-case words
+CODE_PATTERN = re.compile(r"\b[A-Z]{2,5}\b|\S*\d\S*")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "much", "of", "on", "or", "so", "that", "the", "there", "this", "to",
+    "what", "when", "where", "which", "who", "why", "with",
+}
+
+# a query whose content words are at least this share exact codes skips the embedding search
+LEXICAL_ONLY_RATIO = 0.5
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def is_code_query(query: str, ratio: float = LEXICAL_ONLY_RATIO) -> bool:
+    """
+    Whether a query is dominated by exact codes, e.g. "item 233" or "ODFL class 85", so
+    lexical matching alone can answer it.
+    """
+    content = [token for token in tokenize(query) if token not in STOPWORDS]
+    if not content:
+        return False
+    codes = {match.lower() for match in CODE_PATTERN.findall(query)}
+    n_codes = sum(1 for token in content if token in codes or any(c.isdigit() for c in token))
+    return n_codes > 0 and n_codes / len(content) >= ratio
+
+
+class LexicalIndex:
+    """BM25 over the text of each text unit."""
+
+    def __init__(
+            self,
+            ids: list[str],
+            terms: list[str],
+            offsets: np.ndarray,
+            postings: np.ndarray,
+            frequencies: np.ndarray,
+            lengths: np.ndarray,
+    ):
+        """
+        :param ids: Text unit id of each row
+        :param terms: The vocabulary; term i's postings are offsets[i]:offsets[i + 1]
+        :param postings: Rows containing each term
+        :param frequencies: Occurrences of the term in each posting's row
+        :param lengths: Tokens in each row
+        """
+        self.ids = ids
+        self.terms = {term: index for index, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, ids, texts) -> "LexicalIndex":
+        rows, term_ids, counts, lengths = [], [], [], []
+        vocabulary = {}
+        for row, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                rows.append(row)
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+        terms = sorted(vocabulary, key=vocabulary.get)
+        rows = np.asarray(rows, dtype=np.int32)
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        return cls(
+            [str(id) for id in ids],
+            terms,
+            offsets,
+            rows[order],
+            np.minimum(np.asarray(counts, dtype=np.int64)[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            np.asarray(lengths, dtype=np.int32),
+        )
+
+    def save(self, path):
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            ids=np.frombuffer("\n".join(self.ids).encode("utf-8"), dtype=np.uint8),
+            terms=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            lengths=self.lengths,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> "LexicalIndex":
+        with np.load(path) as data:
+            ids = data["ids"].tobytes().decode("utf-8")
+            terms = data["terms"].tobytes().decode("utf-8")
+            return cls(
+                ids.split("\n") if ids else [],
+                terms.split("\n") if terms else [],
+                data["offsets"],
+                data["postings"],
+                data["frequencies"],
+                data["lengths"],
+            )
+
+    @classmethod
+    def from_parquet(cls, parquet_path, id_column: str = "id", text_column: str = "text", path=None) -> "LexicalIndex":
+        """
+        Open the index for a text unit artifact, or, if the indexer has not saved a current one,
+        build it in memory. Writes nothing.
+
+        :param parquet_path: The artifact with the text column
+        :param path: Where the index is kept, by default next to the artifact
+        """
+        parquet_path = Path(parquet_path)
+        path = Path(path or default_index_path(parquet_path))
+        if path.exists() and path.stat().st_mtime >= parquet_path.stat().st_mtime:
+            return cls.load(path)
+        df = read_artifact(parquet_path, columns=[id_column, text_column])
+        return cls.build(df[id_column], df[text_column])
+
+    def search(self, query: str, k: int = 20) -> list[tuple[str, float]]:
+        """
+        The k text units that best match the query's terms.
+
+        :return: (text unit id, BM25 score) pairs, best first
+        """
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        n = len(self.ids)
+        for term in set(tokenize(query)):
+            index = self.terms.get(term)
+            if index is None:
+                continue
+            start, end = self.offsets[index], self.offsets[index + 1]
+            rows = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(np.float32)
+            idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / (self.average_length or 1.0))
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+    def memory_bytes(self) -> int:
+        arrays = (self.offsets, self.postings, self.frequencies, self.lengths)
+        return sum(array.nbytes for array in arrays) + sum(len(term) + 80 for term in self.terms)
+
+
+def default_index_path(parquet_path) -> Path:
+    parquet_path = Path(parquet_path)
+    return parquet_path.with_name(f"{parquet_path.stem}.bm25.npz")
+
+
+def build_lexical_index(artifacts_dir, table: str = "create_final_text_units") -> LexicalIndex | None:
+    """
+    Build the text unit BM25 index after an index run, so queriers do not have to.
+
+    :param artifacts_dir: Directory holding the pipeline's parquet artifacts
+    """
+    parquet_path = Path(artifacts_dir) / f"{table}.parquet"
+    if not parquet_path.exists():
+        return None
+    df = read_artifact(parquet_path, columns=["id", "text"])
+    index = LexicalIndex.build(df["id"], df["text"])
+    index.save(default_index_path(parquet_path))
+    return index
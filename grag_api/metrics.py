@@ -0,0 +1,365 @@
+"""
+In-process metrics for the query and ingestion paths, exposed in the Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock per
+series, so recording costs a dictionary lookup and an addition and can stay on in
+the hot path. Metrics are module-level, like prometheus_client's, and register
+themselves in REGISTRY; `start_metrics_server` serves REGISTRY on /metrics.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values, extra: dict | None = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _unlabelled(self):
+        return self._children[()]
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self) -> float:
+        return self._value
+
+    def samples(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count. Name it with a _total suffix."""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+    def value(self) -> float:
+        return self._unlabelled().value()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Compute the value at scrape time instead of recording it."""
+        self._function = function
+
+    def samples(self, name, labelnames, key):
+        value = self._value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                log.exception("Gauge %s callback failed", name)
+                return []
+            if value is None:
+                return []
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled().dec(amount)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labelnames, key):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self._buckets) + [math.inf], counts):
+            cumulative += count
+            labels = _format_labels(labelnames, key, {"le": _format_value(bound)})
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed, cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+
+# query path
+QUERIES = Counter("grag_queries_total", "Queries answered by GraphRAGQuerier.", ("status",))
+QUERY_SECONDS = Histogram("grag_query_duration_seconds", "End-to-end query time.")
+QUERY_FIRST_TOKEN_SECONDS = Histogram("grag_query_first_token_seconds", "Time from query start to the first answer token.")
+QUERY_ROUTES = Counter("grag_query_routes_total", "Queries by retrieval path: the graph or tariff table rows.", ("path",))
+QUERIES_COALESCED = Counter("grag_queries_coalesced_total", "Queries answered by joining an identical in-flight search.")
+INDEX_RELOADS = Counter("grag_index_reloads_total", "Times the querier reloaded a new index generation.")
+INDEX_AGE_SECONDS = Gauge(
+    "grag_index_age_seconds", "Seconds since the loaded index generation was written.", ("workspace",)
+)
+POOL_ENGINES = Gauge("grag_pool_engines", "Workspaces with a querier loaded in the engine pool.")
+POOL_MEMORY_BYTES = Gauge("grag_pool_memory_bytes", "Estimated memory held by the engine pool's queriers.")
+POOL_EVICTIONS = Counter("grag_pool_evictions_total", "Queriers evicted from the engine pool.")
+LEXICAL_SEARCHES = Counter(
+    "grag_lexical_searches_total", "Context builds that used the BM25 text unit index, by mode.", ("mode",)
+)
+SHARDS_QUERIED = Histogram(
+    "grag_shards_queried", "Shards a sharded query built its context from.", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+CONTEXT_BUILD_SECONDS = Histogram("grag_search_context_build_seconds", "Time spent building the search context.")
+LLM_PROMPT_TOKENS = Counter("grag_llm_prompt_tokens_total", "Prompt tokens sent to the chat model.")
+LLM_COMPLETION_TOKENS = Counter("grag_llm_completion_tokens_total", "Completion tokens received from the chat model.")
+LLM_RETRIES = Counter("grag_llm_retries_total", "OpenAI requests retried by the client.")
+
+# ingestion path
+DOCUMENTS_UPSERTED = Counter("grag_documents_upserted_total", "Documents written to the dataset.", ("source",))
+INDEX_RUNS = Counter("grag_index_runs_total", "Indexing runs.", ("status",))
+INDEX_SECONDS = Histogram(
+    "grag_index_duration_seconds", "Indexing run time.", buckets=(10, 30, 60, 300, 600, 1800, 3600, 7200, 14400)
+)
+INDEX_EMBEDDINGS = Counter(
+    "grag_index_embeddings_total", "Texts embedded by index runs, by where the vector came from.", ("source",)
+)
+INDEX_EXTRACTION_REQUESTS = Counter(
+    "grag_index_extraction_requests_total", "Entity extraction requests, and gleaning passes skipped.", ("kind",)
+)
+INDEX_SUMMARIES = Counter(
+    "grag_index_summaries_total", "Descriptions summarized by index runs, by how the summary was made.", ("source",)
+)
+INDEX_SUMMARY_CALLS = Counter("grag_index_summary_llm_calls_total", "LLM calls made to summarize descriptions.", ("kind",))
+ARTIFACT_BLOBS = Counter(
+    "grag_index_artifact_blobs_total", "Artifact text values moved to the blob store, new or already stored.", ("status",)
+)
+PDF_PAGES = Counter("grag_pdf_pages_total", "PDF pages converted to text.")
+PDF_SECONDS = Histogram(
+    "grag_pdf_duration_seconds", "Time to extract and process one PDF.", buckets=(1, 5, 10, 30, 60, 120, 300, 600)
+)
+IMAGE_CAPTIONS = Counter("grag_image_captions_total", "Image captions requested.", ("status",))
+IMAGE_CAPTION_SECONDS = Histogram("grag_image_caption_seconds", "Time of one image captioning request.")
+IMAGE_CAPTION_REQUESTS = Counter(
+    "grag_image_caption_requests_total", "Image captioning requests, single or batched.", ("kind",)
+)
+INGEST_JOBS = Counter("grag_ingest_jobs_total", "Ingestion queue jobs entering each status.", ("status",))
+INGEST_QUEUE_DEPTH = Gauge("grag_ingest_queue_depth", "Uploaded files not yet committed to the dataset.")
+DB_WRITE_SECONDS = Histogram(
+    "grag_db_write_seconds", "Time to write the dataset Parquet file.", ("operation",)
+)
+
+
+class _RetryCountingLog(logging.LoggerAdapter):
+    """
+    Stands in for the openai client's module logger and counts the 'Retrying request'
+    lines it logs before each retry, whether or not the logger lets INFO records through.
+    """
+
+    def log(self, level, msg, *args, **kwargs):
+        if isinstance(msg, str) and msg.startswith("Retrying request"):
+            LLM_RETRIES.inc()
+        super().log(level, msg, *args, **kwargs)
+
+
+def count_openai_retries():
+    """
+    Start counting openai client retries into LLM_RETRIES. Safe to call repeatedly.
+
+    The 'openai._base_client' logger keeps its own level and handlers, so counting
+    retries adds no log output.
+    """
+    from openai import _base_client
+
+    if not isinstance(_base_client.log, _RetryCountingLog):
+        _base_client.log = _RetryCountingLog(_base_client.log, {})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = 9464, host: str = "0.0.0.0"):
+    """
+    Serve REGISTRY at http://host:port/metrics from a daemon thread.
+
+    Only the first call starts a server, so it is safe from code that runs on every
+    Streamlit rerun.
+
+    :param port: The port to listen on
+    :param host: The interface to bind
+    :return: The running server
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            log.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return _server
@@ -0,0 +1,115 @@
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from graphrag.query.structured_search.local_search.system_prompt import LOCAL_SEARCH_SYSTEM_PROMPT
+
+from grag_api.metrics import POOL_ENGINES, POOL_EVICTIONS, POOL_MEMORY_BYTES
+from grag_api.query import GraphRAGQuerier, create_clients
+
+log = logging.getLogger(__name__)
+
+
+class EnginePool:
+    """
+    Query many workspaces from one process within a memory budget.
+
+    A GraphRAGQuerier is created the first time its workspace is queried and
+    shares one set of LLM, embedding and tokenizer clients with every other
+    querier in the pool. Queriers are kept in least-recently-used order; once the
+    estimated memory of the loaded ones exceeds the budget (or there are more than
+    max_engines), the coldest are dropped and reload on their next query.
+    Queries already running on an evicted querier finish normally.
+    """
+
+    def __init__(
+            self,
+            config,
+            memory_budget_bytes: int = 4 * 1024 ** 3,
+            max_engines: int | None = None,
+            querier_factory=GraphRAGQuerier,
+    ):
+        """
+        :param config: The configuration dictionary shared by all workspaces
+        :param memory_budget_bytes: Estimated memory the loaded queriers may hold in total
+        :param max_engines: Optional cap on the number of loaded queriers
+        :param querier_factory: Creates a querier from (workspace, config=..., clients=...)
+        """
+        self.config = config
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_engines = max_engines
+        self.querier_factory = querier_factory
+        self._clients = None
+        self._engines: OrderedDict[str, GraphRAGQuerier] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def clients(self):
+        """The (llm, token_encoder, text_embedder) shared by every querier, created on first use."""
+        with self._lock:
+            if self._clients is None:
+                self._clients = create_clients(self.config)
+            return self._clients
+
+    def get(self, workspace) -> GraphRAGQuerier:
+        """
+        Return the querier for a workspace, creating it if needed, and mark it most recently used.
+        """
+        key = str(Path(workspace))
+        clients = self.clients
+        with self._lock:
+            querier = self._engines.get(key)
+            if querier is None:
+                log.info("Engine pool: creating querier for %s", key)
+                querier = self.querier_factory(key, config=self.config, clients=clients)
+                # each workspace keeps its vectors next to its own index
+                querier.lancedb_uri = str(Path(key) / "lancedb")
+                self._engines[key] = querier
+            self._engines.move_to_end(key)
+            return querier
+
+    async def query(self, workspace, question, callbacks=None, system_prompt=LOCAL_SEARCH_SYSTEM_PROMPT):
+        querier = self.get(workspace)
+        try:
+            return await querier.query(question, callbacks=callbacks or [], system_prompt=system_prompt)
+        finally:
+            # the querier's size is only known once its index is loaded
+            self._enforce_budget(keep=str(Path(workspace)))
+
+    def evict(self, workspace) -> bool:
+        with self._lock:
+            querier = self._engines.pop(str(Path(workspace)), None)
+            self._update_gauges()
+        return querier is not None
+
+    def memory_bytes(self) -> int:
+        return sum(querier.memory_bytes for querier in self._engines.values())
+
+    def _enforce_budget(self, keep: str | None = None):
+        with self._lock:
+            for key in list(self._engines):
+                over_memory = self.memory_bytes() > self.memory_budget_bytes
+                over_count = self.max_engines is not None and len(self._engines) > self.max_engines
+                if not (over_memory or over_count):
+                    break
+                if key == keep:
+                    continue
+                querier = self._engines.pop(key)
+                self.evictions += 1
+                POOL_EVICTIONS.inc()
+                log.info("Engine pool: evicted %s (~%s MB)", key, querier.memory_bytes // 2 ** 20)
+            self._update_gauges()
+
+    def _update_gauges(self):
+        POOL_ENGINES.set(len(self._engines))
+        POOL_MEMORY_BYTES.set(self.memory_bytes())
+
+    def stats(self) -> list[dict]:
+        """The loaded workspaces, coldest first, with their estimated memory."""
+        with self._lock:
+            return [
+                {"workspace": key, "memory_bytes": querier.memory_bytes, "index": querier.last_loaded_timestamp}
+                for key, querier in self._engines.items()
+            ]
@@ -1,75 +1,343 @@
+import dataclasses
+import logging
+import time
+import weakref
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from graphrag.query import indexer_adapters, llm
 import tiktoken
 from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
 from graphrag.query.llm.oai.chat_openai import ChatOpenAI
 from graphrag.query.llm.oai.embedding import OpenAIEmbedding
 from graphrag.query.input.loaders import dfs
-from graphrag.query.structured_search.local_search.mixed_context import LocalSearchMixedContext
+from grag_api.arena import ARENA_DIR, EMBEDDING_COLUMN, open_arena
+from grag_api.coalesce import SingleFlight, normalize_query
+from grag_api.context import CustomMixedContext
+from grag_api.embedding_store import QuantizedEmbeddingStore
+from grag_api.lexical import LexicalIndex
+from grag_api.metrics import (
+    INDEX_AGE_SECONDS,
+    INDEX_RELOADS,
+    QUERIES,
+    QUERIES_COALESCED,
+    QUERY_FIRST_TOKEN_SECONDS,
+    QUERY_ROUTES,
+    QUERY_SECONDS,
+    count_openai_retries,
+)
 from grag_api.search import CustomSearch
+from grag_api.tariff_tables import TariffContextBuilder, TariffStores, is_lookup_query
+from grag_api.text_store import LazyCommunityReport, LazyTextUnit, TextStore, with_lazy_bodies
+from grag_api.tombstones import Tombstones, deleted_content, indexed_document_ids
+from grag_api.tokens import TOKEN_COUNT_COLUMN, count_tokens, ensure_token_counts, token_count_map
+from grag_api.tracing import Trace, span
 from graphrag.query.structured_search.local_search.system_prompt import LOCAL_SEARCH_SYSTEM_PROMPT
 from graphrag.vector_stores import LanceDBVectorStore
 
+log = logging.getLogger(__name__)
+
+COMMUNITY_REPORT_TABLE = "create_final_community_reports"
+ENTITY_TABLE = "create_final_nodes"
+ENTITY_EMBEDDING_TABLE = "create_final_entities"
+RELATIONSHIP_TABLE = "create_final_relationships"
+TEXT_UNIT_TABLE = "create_final_text_units"
+DOCUMENT_TABLE = "create_final_documents"
+COMMUNITY_LEVEL = 2
+LANCEDB_URI = "lancedb"
+ENTITY_COLLECTION = "entity_description_embeddings"
+# entity embeddings are searched in a compact in-process store ("int8" or "float16");
+# None keeps them as float lists on each Entity and searches them through LanceDB
+EMBEDDING_QUANTIZATION = "int8"
+QUERY_TABLES = (ENTITY_TABLE, ENTITY_EMBEDDING_TABLE, COMMUNITY_REPORT_TABLE, RELATIONSHIP_TABLE, TEXT_UNIT_TABLE)
+# the columns the indexer_adapters read from each table; graph embeddings, layout
+# positions and the like are never loaded
+QUERY_COLUMNS = {
+    ENTITY_TABLE: ["title", "degree", "community", "level"],
+    ENTITY_EMBEDDING_TABLE: [
+        "id", "name", "type", "description", "human_readable_id", "text_unit_ids", EMBEDDING_COLUMN,
+        TOKEN_COUNT_COLUMN,
+    ],
+    COMMUNITY_REPORT_TABLE: ["community", "level", "title", "summary", "rank", TOKEN_COUNT_COLUMN],
+    RELATIONSHIP_TABLE: [
+        "id", "human_readable_id", "source", "target", "description", "weight", "rank", "text_unit_ids",
+        TOKEN_COUNT_COLUMN,
+    ],
+    TEXT_UNIT_TABLE: ["id", "document_ids", "entity_ids", "relationship_ids", TOKEN_COUNT_COLUMN],
+}
+# bodies left on disk and read by id when they go into a context: table -> (id column, body column)
+LAZY_BODIES = {
+    TEXT_UNIT_TABLE: ("id", "text"),
+    COMMUNITY_REPORT_TABLE: ("community", "full_content"),
+}
+# the columns published to the shared arena: what the adapters read plus the lazy bodies
+ARENA_COLUMNS = {
+    table: columns + [c for c in LAZY_BODIES.get(table, ()) if c not in columns]
+    for table, columns in QUERY_COLUMNS.items()
+}
+
+LOCAL_CONTEXT_PARAMS = {
+    "text_unit_prop": 0.5,
+    "community_prop": 0.1,
+    "conversation_history_max_turns": 5,
+    "conversation_history_user_turns_only": True,
+    "top_k_mapped_entities": 10,
+    "top_k_relationships": 10,
+    # text units matched by BM25 on exact terms, fused with the entity-ranked ones
+    "top_k_lexical_units": 20,
+    "include_entity_rank": True,
+    "include_relationship_weight": True,
+    "include_community_rank": False,
+    "return_candidate_context": False,
+    "embedding_vectorstore_key": EntityVectorStoreKey.ID,
+    "max_tokens": 12_000,
+    # pack by relevance per token under a budget that grows with query complexity,
+    # instead of always filling max_tokens with the fixed proportions above
+    "adaptive_budget": True,
+    "min_tokens": 2_000,
+}
+
+LLM_PARAMS = {
+    "max_tokens": 2_000,
+    "temperature": 0.0,
+}
+
+
+def create_clients(config):
+    """
+    Create the chat model, tokenizer and embedding clients described by a config.
+
+    :param config: The configuration dictionary
+    :return: A (llm, token_encoder, text_embedder) tuple
+    """
+    count_openai_retries()
+    llm_instance = ChatOpenAI(
+        api_key=config['llm']['api_key'],
+        api_base=config['llm'].get('api_base'),
+        model=config['llm']['model'],
+        api_type=llm.oai.typing.OpenaiApiType.OpenAI,
+        max_retries=20,
+    )
+
+    token_encoder = tiktoken.get_encoding(config['encoding_model'])
+
+    text_embedder = OpenAIEmbedding(
+        api_key=config['llm']['api_key'],
+        api_base=config['embeddings']['llm'].get('api_base'),
+        api_type=llm.oai.typing.OpenaiApiType.OpenAI,
+        model=config['embeddings']['llm']['model'],
+        deployment_name=config['embeddings']['llm']['model'],
+        max_retries=20,
+    )
+
+    return llm_instance, token_encoder, text_embedder
+
+
+def build_entity_vector_store(tables: dict[str, pd.DataFrame], db_uri: str) -> LanceDBVectorStore:
+    """
+    Load the entity description embeddings into a LanceDB collection at db_uri.
+
+    :param tables: The query artifact tables
+    :param db_uri: Where the LanceDB database lives
+    :return: The connected vector store
+    """
+    entities = indexer_adapters.read_indexer_entities(
+        tables[ENTITY_TABLE], tables[ENTITY_EMBEDDING_TABLE], COMMUNITY_LEVEL
+    )
+    description_embedding_store = LanceDBVectorStore(collection_name=ENTITY_COLLECTION)
+    description_embedding_store.connect(db_uri=db_uri)
+    dfs.store_entity_semantic_embeddings(entities=entities, vectorstore=description_embedding_store)
+    return description_embedding_store
+
+
+def _placeholder_bodies(df: pd.DataFrame, store: TextStore, id_column: str, token_encoder) -> pd.DataFrame:
+    """
+    Give the adapters empty bodies to read, taking token counts from the store when the artifact has none.
+    """
+    df = df.assign(**{store.body_column: ""})
+    if TOKEN_COUNT_COLUMN not in df.columns or df[TOKEN_COUNT_COLUMN].isna().any():
+        df[TOKEN_COUNT_COLUMN] = count_tokens((store.get(id) for id in df[id_column].astype(str)), token_encoder)
+    return df
+
 
 class GraphRAGQuerier:
-    def __init__(self, workspace="ragtest", config=None):
+    def __init__(self, workspace="ragtest", config=None, clients=None):
+        """
+        :param workspace: The workspace whose index is queried
+        :param config: The configuration dictionary
+        :param clients: Optional (llm, token_encoder, text_embedder) shared with other queriers
+        """
         self.workspace = workspace
         self.config = config
+        self.clients = clients
         self.api_key = self.config['llm']['api_key']
         self.index_file_path = Path(self.workspace) / "_index"
         self.last_loaded_timestamp = None
+        # a weak reference, so the gauge does not keep an evicted querier's data alive
+        index_age = weakref.WeakMethod(self.index_age)
+        INDEX_AGE_SECONDS.labels(workspace=str(workspace)).set_function(
+            lambda: index_age()() if index_age() is not None else None
+        )
+        self.memory_bytes = 0
         self.entities = None
         self.reports = None
         self.relationships = None
         self.text_units = None
+        self.text_stores = {}
+        self.lexical_index = None
+        self.entity_token_counts = None
+        self.relationship_token_counts = None
+        self.report_token_counts = None
         self.search_engine = None
+        self.table_search = None
+        self.table_stores = TariffStores()
+        self.tombstones = Tombstones(self.workspace)
+        self.documents = None
+        self.inflight = SingleFlight()
+        self.lancedb_uri = LANCEDB_URI
+        self.arena_root = Path(self.workspace) / ARENA_DIR
+        self.arena = None
+        self.embedding_quantization = EMBEDDING_QUANTIZATION
+        self.entity_vectors = None
+
+    def read_artifacts(self) -> dict[str, pd.DataFrame]:
+        """
+        Read the columns the adapters use from each artifact, and open the text bodies as TextStores.
+        """
+        input_dir = Path(self.workspace) / "output" / "graph" / "artifacts"
+        self.text_stores = {
+            table: TextStore.from_parquet(input_dir / f"{table}.parquet", id_column, body_column)
+            for table, (id_column, body_column) in LAZY_BODIES.items()
+        }
+        tables = {}
+        for table in QUERY_TABLES:
+            path = input_dir / f"{table}.parquet"
+            available = set(pq.read_schema(path).names)
+            tables[table] = pd.read_parquet(path, columns=[c for c in QUERY_COLUMNS[table] if c in available])
+        return tables
+
+    def convert_artifacts(self, tables: dict[str, pd.DataFrame]):
+        entity_df = tables[ENTITY_TABLE]
+        entity_embedding_df = tables[ENTITY_EMBEDDING_TABLE]
+        report_df = tables[COMMUNITY_REPORT_TABLE]
+        relationship_df = tables[RELATIONSHIP_TABLE]
+        text_unit_df = tables[TEXT_UNIT_TABLE]
+
+        if self.embedding_quantization and EMBEDDING_COLUMN in entity_embedding_df.columns:
+            # one float32 matrix for the embedding store instead of a float list on every Entity
+            embedded = entity_embedding_df[entity_embedding_df[EMBEDDING_COLUMN].notna()]
+            self.entity_vectors = (
+                embedded["id"].tolist(),
+                np.stack(embedded[EMBEDDING_COLUMN].to_numpy()).astype(np.float32, copy=False),
+            )
+            entity_embedding_df = entity_embedding_df.drop(columns=[EMBEDDING_COLUMN])
+
+        # token counts are stored by the indexer; older artifacts are counted once here
+        token_encoder = tiktoken.get_encoding(self.config['encoding_model'])
+        text_stores = {
+            table: store for table, store in self.text_stores.items()
+            if LAZY_BODIES[table][1] not in tables[table].columns
+        }
+        if TEXT_UNIT_TABLE in text_stores:
+            text_unit_df = _placeholder_bodies(
+                text_unit_df, text_stores[TEXT_UNIT_TABLE], LAZY_BODIES[TEXT_UNIT_TABLE][0], token_encoder
+            )
+        if COMMUNITY_REPORT_TABLE in text_stores:
+            report_df = _placeholder_bodies(
+                report_df, text_stores[COMMUNITY_REPORT_TABLE], LAZY_BODIES[COMMUNITY_REPORT_TABLE][0], token_encoder
+            )
+        entity_embedding_df = ensure_token_counts(entity_embedding_df, "description", token_encoder)
+        report_df = ensure_token_counts(report_df, "full_content", token_encoder)
+        relationship_df = ensure_token_counts(relationship_df, "description", token_encoder)
+        text_unit_df = ensure_token_counts(text_unit_df, "text", token_encoder)
+        self.entity_token_counts = token_count_map(entity_embedding_df, "id")
+        self.report_token_counts = token_count_map(report_df, "community")
+        self.relationship_token_counts = token_count_map(relationship_df, "id")
 
-    def load_data(self):
-        INPUT_DIR = Path(self.workspace) / "output" / "graph" / "artifacts"
-        COMMUNITY_REPORT_TABLE = "create_final_community_reports"
-        ENTITY_TABLE = "create_final_nodes"
-        ENTITY_EMBEDDING_TABLE = "create_final_entities"
-        RELATIONSHIP_TABLE = "create_final_relationships"
-        TEXT_UNIT_TABLE = "create_final_text_units"
-        COMMUNITY_LEVEL = 2
-
-        entity_df = pd.read_parquet(f"{INPUT_DIR}/{ENTITY_TABLE}.parquet")
-        entity_embedding_df = pd.read_parquet(f"{INPUT_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet")
-        report_df = pd.read_parquet(f"{INPUT_DIR}/{COMMUNITY_REPORT_TABLE}.parquet")
-        relationship_df = pd.read_parquet(f"{INPUT_DIR}/{RELATIONSHIP_TABLE}.parquet")
-        text_unit_df = pd.read_parquet(f"{INPUT_DIR}/{TEXT_UNIT_TABLE}.parquet")
+        # approximate: the loaded model objects hold roughly what the source tables do
+        self.memory_bytes = sum(
+            int(df.memory_usage(deep=True).sum())
+            for df in (entity_df, entity_embedding_df, report_df, relationship_df, text_unit_df)
+        )
+        if self.lexical_index is not None:
+            self.memory_bytes += self.lexical_index.memory_bytes()
+        if self.entity_vectors is not None and self.entity_vectors[1].flags.owndata:
+            self.memory_bytes += self.entity_vectors[1].nbytes
 
         self.entities = indexer_adapters.read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
         self.reports = indexer_adapters.read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
         self.relationships = indexer_adapters.read_indexer_relationships(relationship_df)
         self.text_units = indexer_adapters.read_indexer_text_units(text_unit_df)
+        if COMMUNITY_REPORT_TABLE in text_stores:
+            self.reports = with_lazy_bodies(self.reports, LazyCommunityReport, text_stores[COMMUNITY_REPORT_TABLE])
+        if TEXT_UNIT_TABLE in text_stores:
+            self.text_units = with_lazy_bodies(self.text_units, LazyTextUnit, text_stores[TEXT_UNIT_TABLE])
 
-    def setup_llm_and_embeddings(self):
-        llm_instance = ChatOpenAI(
-            api_key=self.api_key,
-            model=self.config['llm']['model'],
-            api_type=llm.oai.typing.OpenaiApiType.OpenAI,
-            max_retries=20,
-        )
+    def load_data(self, generation=None):
+        """
+        Load the query tables, from the memory-mapped arena when this generation was published
+        to one, otherwise from the Parquet artifacts. Only the columns the adapters use are
+        read; text-unit and report bodies stay on disk in a TextStore.
+        """
+        self.arena = open_arena(self.arena_root, generation) if generation else None
+        self.entity_vectors = None
+        self.documents = None
+        self.lexical_index = self.load_lexical_index()
+        if self.arena is None:
+            self.convert_artifacts(self.read_artifacts())
+            return
 
-        token_encoder = tiktoken.get_encoding("cl100k_base")
+        log.info("Loading index generation %s from the shared arena", generation)
+        self.text_stores = {
+            table: TextStore(self.arena.tables[table], id_column, body_column)
+            for table, (id_column, body_column) in LAZY_BODIES.items()
+        }
+        if self.embedding_quantization:
+            # re-rank straight from the mapped float32 matrix
+            self.entity_vectors = self.arena.embedding_matrix(ENTITY_EMBEDDING_TABLE)
+        if self.embedding_quantization and self.entity_vectors is None:
+            self.convert_artifacts(self.arena.to_pandas(QUERY_COLUMNS, exclude_columns=()))
+        else:
+            self.convert_artifacts(self.arena.to_pandas(QUERY_COLUMNS))
 
-        text_embedder = OpenAIEmbedding(
-            api_key=self.api_key,
-            api_type=llm.oai.typing.OpenaiApiType.OpenAI,
-            model=self.config['embeddings']['llm']['model'],
-            deployment_name=self.config['embeddings']['llm']['model'],
-            max_retries=20,
-        )
+    def load_lexical_index(self) -> LexicalIndex | None:
+        """The BM25 index over the text units, built in memory if the indexer did not save it."""
+        path = Path(self.workspace) / "output" / "graph" / "artifacts" / f"{TEXT_UNIT_TABLE}.parquet"
+        if not path.exists():
+            return None
+        return LexicalIndex.from_parquet(path)
+
+    def index_age(self) -> float | None:
+        """Seconds since the loaded index generation was written, or None before the first load."""
+        if self.last_loaded_timestamp is None:
+            return None
+        return time.time() - float(self.last_loaded_timestamp)
 
-        return llm_instance, token_encoder, text_embedder
+    def setup_llm_and_embeddings(self):
+        if self.clients is not None:
+            return self.clients
+        return create_clients(self.config)
 
     def setup_vector_store(self):
-        LANCEDB_URI = "lancedb"
-        description_embedding_store = LanceDBVectorStore(
-            collection_name="entity_description_embeddings")
-        description_embedding_store.connect(db_uri=LANCEDB_URI)
+        if self.entity_vectors is not None:
+            ids, vectors = self.entity_vectors
+            loaded = {entity.id for entity in self.entities}
+            rows = np.array([row for row, id in enumerate(ids) if id in loaded], dtype=np.int64)
+            embedding_store = QuantizedEmbeddingStore(
+                ids, vectors, rows=rows, quantization=self.embedding_quantization, collection_name=ENTITY_COLLECTION
+            )
+            self.memory_bytes += embedding_store.memory_bytes()
+            return embedding_store
+
+        description_embedding_store = LanceDBVectorStore(collection_name=ENTITY_COLLECTION)
+        if self.arena is not None:
+            # the arena ships its generation's vector store; open it rather than rebuilding it
+            description_embedding_store.connect(db_uri=self.arena.lancedb_uri)
+            description_embedding_store.load_documents([], overwrite=False)
+            return description_embedding_store
+
+        description_embedding_store.connect(db_uri=self.lancedb_uri)
 
         dfs.store_entity_semantic_embeddings(
             entities=self.entities,
@@ -79,7 +347,10 @@ class GraphRAGQuerier:
         return description_embedding_store
 
     def setup_local_search(self, llm_instance, token_encoder, text_embedder, description_embedding_store):
-        context_builder_instance = LocalSearchMixedContext(
+        context_builder_instance = CustomMixedContext(
+            entity_token_counts=self.entity_token_counts,
+            relationship_token_counts=self.relationship_token_counts,
+            report_token_counts=self.report_token_counts,
             community_reports=self.reports,
             text_units=self.text_units,
             entities=self.entities,
@@ -88,57 +359,145 @@ class GraphRAGQuerier:
             embedding_vectorstore_key=EntityVectorStoreKey.ID,
             text_embedder=text_embedder,
             token_encoder=token_encoder,
+            lexical_index=self.lexical_index,
+            workspace=self.workspace if (self.config.get("table_lookup") or {}).get("enabled", False) else None,
+            table_stores=self.table_stores,
         )
 
-        local_context_params = {
-            "text_unit_prop": 0.5,
-            "community_prop": 0.1,
-            "conversation_history_max_turns": 5,
-            "conversation_history_user_turns_only": True,
-            "top_k_mapped_entities": 10,
-            "top_k_relationships": 10,
-            "include_entity_rank": True,
-            "include_relationship_weight": True,
-            "include_community_rank": False,
-            "return_candidate_context": False,
-            "embedding_vectorstore_key": EntityVectorStoreKey.ID,
-            "max_tokens": 12_000,
-        }
-
-        llm_params = {
-            "max_tokens": 2_000,
-            "temperature": 0.0,
-        }
-
         return CustomSearch(
             llm=llm_instance,
             context_builder=context_builder_instance,
             token_encoder=token_encoder,
-            llm_params=llm_params,
-            context_builder_params=local_context_params,
+            llm_params=LLM_PARAMS,
+            context_builder_params=LOCAL_CONTEXT_PARAMS,
+            response_type='Single Paragraph',
+        )
+
+    def setup_table_search(self, llm_instance, token_encoder):
+        """The search engine for the table lookup path, or None when it is disabled."""
+        lookup_config = self.config.get("table_lookup") or {}
+        if not lookup_config.get("enabled", False):
+            return None
+        return CustomSearch(
+            llm=llm_instance,
+            context_builder=TariffContextBuilder(self.workspace, self.table_stores),
+            token_encoder=token_encoder,
+            llm_params=LLM_PARAMS,
+            context_builder_params={"top_k_rows": lookup_config.get("top_k_rows", 30)},
             response_type='Single Paragraph',
         )
 
+    def table_lookup_engine(self, question) -> CustomSearch | None:
+        """The table lookup engine if the question asks for a rate or charge that stored table rows answer."""
+        if self.table_search is None or not is_lookup_query(question):
+            return None
+        store = self.table_stores.get(self.workspace)
+        top_k_rows = self.table_search.context_builder_params["top_k_rows"]
+        if store is None or store.answering_rows(question, top_k_rows).empty:
+            return None
+        return self.table_search
+
+    def read_documents(self) -> pd.DataFrame:
+        """The id and title of every indexed document, read the first time a tombstone needs them."""
+        if self.documents is None:
+            path = Path(self.workspace) / "output" / "graph" / "artifacts" / f"{DOCUMENT_TABLE}.parquet"
+            self.documents = (
+                pd.read_parquet(path, columns=["id", "title"]) if path.exists()
+                else pd.DataFrame(columns=["id", "title"])
+            )
+        return self.documents
+
+    def apply_tombstones(self):
+        """Hide the rows of documents deleted since the index was built from the search engine's context."""
+        context_builder = self.search_engine.context_builder
+        tombstones = self.tombstones.documents
+        context_builder.deleted = deleted_content(
+            indexed_document_ids(tombstones, self.read_documents()) if tombstones else set(),
+            context_builder.text_units,
+            context_builder.entities,
+            context_builder.relationships,
+        )
+        if context_builder.deleted:
+            log.info(
+                "Tombstones hide %s text units, %s entities and %s relationships",
+                len(context_builder.deleted.text_unit_ids),
+                len(context_builder.deleted.entity_ids),
+                len(context_builder.deleted.relationship_ids),
+            )
+
     def check_and_reload_data(self):
         if self.index_file_path.exists():
             with self.index_file_path.open("r") as f:
                 current_timestamp = f.read().strip()
             if current_timestamp != self.last_loaded_timestamp:
-                self.load_data()
+                self.load_data(current_timestamp)
                 self.last_loaded_timestamp = current_timestamp
                 return True
         return False
 
-    async def query(self, question, callbacks=[], system_prompt=LOCAL_SEARCH_SYSTEM_PROMPT):
-        data_reloaded = self.check_and_reload_data()
+    def ensure_engine(self) -> CustomSearch:
+        """Load a new index generation if one was published, and return the search engine for it."""
+        with span("reload_check") as reload_span:
+            data_reloaded = self.check_and_reload_data()
+            tombstones_changed = self.tombstones.refresh()
+            if reload_span is not None:
+                reload_span.attributes["reloaded"] = data_reloaded
+        if data_reloaded:
+            INDEX_RELOADS.inc()
         if data_reloaded or self.search_engine is None:
-            llm_instance, token_encoder, text_embedder = self.setup_llm_and_embeddings()
-            description_embedding_store = self.setup_vector_store()
-            self.search_engine = self.setup_local_search(
-                llm_instance, token_encoder, text_embedder, description_embedding_store
-            )
+            with span("engine_setup"):
+                llm_instance, token_encoder, text_embedder = self.setup_llm_and_embeddings()
+                description_embedding_store = self.setup_vector_store()
+                self.search_engine = self.setup_local_search(
+                    llm_instance, token_encoder, text_embedder, description_embedding_store
+                )
+                self.table_search = self.setup_table_search(llm_instance, token_encoder)
+                self.apply_tombstones()
+        elif tombstones_changed:
+            self.apply_tombstones()
+        return self.search_engine
+
+    async def query(self, question, callbacks=[], system_prompt=LOCAL_SEARCH_SYSTEM_PROMPT):
+        start_time = time.perf_counter()
+        try:
+            result = await self._query(question, callbacks, system_prompt)
+        except Exception:
+            QUERIES.labels(status="error").inc()
+            raise
+        # CustomSearch.asearch reports LLM failures as an empty response
+        QUERIES.labels(status="ok" if result.response else "error").inc()
+        QUERY_SECONDS.observe(time.perf_counter() - start_time)
+        if result.latency is not None:
+            QUERY_FIRST_TOKEN_SECONDS.observe(result.latency)
+        return result
+
+    async def _query(self, question, callbacks, system_prompt):
+        trace = Trace("query", question=question)
+        with trace.activate():
+            search_engine = self.ensure_engine()
+            # rate and charge lookups that tariff table rows answer skip the graph
+            with span("table_route") as route_span:
+                table_search = self.table_lookup_engine(question)
+                if route_span is not None:
+                    route_span.attributes["table_lookup"] = table_search is not None
+            QUERY_ROUTES.labels(path="graph" if table_search is None else "table").inc()
+            search_engine = table_search or search_engine
 
-        self.search_engine.callbacks = callbacks
-        self.search_engine.system_prompt = system_prompt
-        result = await self.search_engine.asearch(question)
+            # identical questions asked concurrently against the same index share one search
+            key = (normalize_query(question), system_prompt, self.last_loaded_timestamp)
+            with span("single_flight") as search_span:
+                result = await self.inflight.run(
+                    key,
+                    lambda fan_out: search_engine.asearch(question, callbacks=[fan_out], system_prompt=system_prompt),
+                    callbacks,
+                )
+                if result.trace is not trace:
+                    # a coalesced follower: the stages were traced by the leading query
+                    search_span.attributes["coalesced"] = True
+                    QUERIES_COALESCED.inc()
+                    if result.trace is not None:
+                        search_span.attributes["leader_trace_id"] = result.trace.trace_id
+        trace.end()
+        if result.trace is not trace:
+            result = dataclasses.replace(result, trace=trace)
         return result
@@ -0,0 +1,347 @@
+"""
+Query routing over a sharded index.
+
+A ShardCatalog keeps the entity embeddings of every shard as one matrix of int8 codes.
+A question is embedded once and matched against the catalog; the shards that
+own the closest entities, plus any shard the question names, are queried. Each
+chosen shard's querier ranks its own candidate rows in parallel, and the rows
+are merged, scored by how strongly the router matched their shard, and packed
+into one context under the usual adaptive budget. Query cost therefore grows
+with the shards a question touches rather than with the whole corpus.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from graphrag.query.context_builder.builders import LocalContextBuilder
+from graphrag.query.context_builder.conversation_history import ConversationHistory
+from graphrag.query.structured_search.local_search.system_prompt import LOCAL_SEARCH_SYSTEM_PROMPT
+
+from grag_api.arena import EMBEDDING_COLUMN
+from grag_api.context import BROAD_QUERY_TERMS, ContextCandidate, pack_sections
+from grag_api.embedding_store import approximate_scores, quantize
+from grag_api.metrics import QUERIES, QUERY_FIRST_TOKEN_SECONDS, QUERY_ROUTES, QUERY_SECONDS, SHARDS_QUERIED
+from grag_api.pool import EnginePool
+from grag_api.query import EMBEDDING_QUANTIZATION, ENTITY_EMBEDDING_TABLE, LLM_PARAMS, LOCAL_CONTEXT_PARAMS
+from grag_api.search import CustomSearch
+from grag_api.shards import list_shards, shard_workspace
+from grag_api.tariff_tables import TariffContextBuilder, TariffStores, is_lookup_query
+from grag_api.tokens import estimate_tokens
+from grag_api.tracing import Trace, span
+
+log = logging.getLogger(__name__)
+
+# shards a focused question is answered from, at most; broad questions may use every shard
+MAX_SHARDS = 4
+# catalog entities whose shards vote on the route
+ROUTE_K = 50
+# a shard is only queried if its vote is at least this share of the best shard's
+MIN_SHARD_SHARE = 0.2
+
+
+class _QueryEmbedding:
+    """An embedder that returns a precomputed vector for the query it was made for."""
+
+    def __init__(self, text_embedder, query: str, vector: list[float]):
+        self.text_embedder = text_embedder
+        self.query = query
+        self.vector = vector
+
+    def embed(self, text: str, **kwargs):
+        if text == self.query:
+            return self.vector
+        return self.text_embedder.embed(text, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.text_embedder, name)
+
+
+class ShardCatalog:
+    """
+    Quantized entity embeddings of every shard of a workspace, to route queries by.
+
+    Only the codes are kept: routing needs approximate similarities, not a re-ranked top k.
+    """
+
+    def __init__(self, workspace, quantization: str = EMBEDDING_QUANTIZATION or "int8"):
+        self.workspace = workspace
+        self.quantization = quantization
+        self.shards: list[str] = []
+        self.codes = None
+        self.scales = None
+        self.owners = np.empty(0, dtype=np.int32)
+        self._generations = None
+        self._lock = threading.Lock()
+        # words that appear in exactly one shard's key -> that shard
+        self._names: dict[str, str] = {}
+
+    def _read_generations(self) -> dict[str, str]:
+        return {
+            key: (shard_workspace(self.workspace, key) / "_index").read_text().strip()
+            for key in list_shards(self.workspace)
+        }
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the catalog if a shard was added, removed or re-indexed since the last call.
+
+        :return: True if the catalog was rebuilt
+        """
+        generations = self._read_generations()
+        if generations == self._generations:
+            return False
+        with self._lock:
+            if generations == self._generations:
+                return False
+            codes, scales, owners = [], [], []
+            for shard, key in enumerate(generations):
+                artifacts = shard_workspace(self.workspace, key) / "output" / "graph" / "artifacts"
+                path = artifacts / f"{ENTITY_EMBEDDING_TABLE}.parquet"
+                if not path.exists():
+                    continue
+                embeddings = pd.read_parquet(path, columns=[EMBEDDING_COLUMN])[EMBEDDING_COLUMN].dropna()
+                if embeddings.empty:
+                    continue
+                vectors = np.stack(embeddings.to_numpy()).astype(np.float32)
+                shard_codes, shard_scales, _ = quantize(vectors, np.arange(len(vectors)), self.quantization)
+                codes.append(shard_codes)
+                scales.append(shard_scales)
+                owners.append(np.full(len(vectors), shard, dtype=np.int32))
+
+            self.shards = list(generations)
+            self.codes = np.concatenate(codes) if codes else None
+            self.scales = np.concatenate(scales) if codes and scales[0] is not None else None
+            self.owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int32)
+            self._names = self._distinctive_words(self.shards)
+            self._generations = generations
+        log.info("Shard catalog: %s shards, %s entities", len(self.shards), len(self.owners))
+        return True
+
+    @staticmethod
+    def _distinctive_words(keys: list[str]) -> dict[str, str]:
+        shards_by_word = {}
+        for key in keys:
+            for word in set(key.split("-")):
+                if len(word) >= 4 and not word.isdigit():
+                    shards_by_word.setdefault(word, set()).add(key)
+        return {word: next(iter(shards)) for word, shards in shards_by_word.items() if len(shards) == 1}
+
+    def mentioned(self, query: str) -> set[str]:
+        """The shards named in the query, by a word of their key that no other shard shares."""
+        return {self._names[word] for word in re.findall(r"[a-z0-9]+", query.lower()) if word in self._names}
+
+    def votes(self, query_vector: list[float], k: int = ROUTE_K) -> dict[str, float]:
+        """Summed similarity of the k catalog entities closest to the query, per shard."""
+        if self.codes is None:
+            return {}
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = approximate_scores(self.codes, self.scales, query)
+        k = min(k, len(scores))
+        votes = {}
+        for row in np.argpartition(-scores, k - 1)[:k]:
+            key = self.shards[self.owners[row]]
+            votes[key] = votes.get(key, 0.0) + max(float(scores[row]), 0.0)
+        return votes
+
+
+class ShardedContext(LocalContextBuilder):
+    """
+    Builds a local search context from the shards a query is routed to.
+
+    Each shard's CustomMixedContext ranks its own candidates in a worker thread,
+    reusing the one query embedding; candidate ids are prefixed with their shard
+    and scores scaled by the shard's routing weight before the sections are
+    merged and packed together.
+    """
+
+    def __init__(
+            self,
+            workspace,
+            catalog: ShardCatalog,
+            pool: EnginePool,
+            text_embedder,
+            max_shards: int = MAX_SHARDS,
+            route_k: int = ROUTE_K,
+            max_workers: int = 8,
+    ):
+        self.workspace = workspace
+        self.catalog = catalog
+        self.pool = pool
+        self.text_embedder = text_embedder
+        self.max_shards = max_shards
+        self.route_k = route_k
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="shard-context")
+        # one engine load per shard at a time
+        self._shard_locks: dict[str, threading.Lock] = {}
+
+    def route(self, query: str, query_vector: list[float]) -> dict[str, float]:
+        """
+        Choose the shards to query, with a weight in (0, 1] for each.
+
+        Shards named in the question are used alone unless the question is broad;
+        otherwise the shards whose entities are closest to the question are used,
+        up to max_shards, or all of them for a broad question.
+        """
+        mentioned = self.catalog.mentioned(query)
+        broad = bool(set(re.findall(r"[a-z]+", query.lower())) & BROAD_QUERY_TERMS)
+        weights = {key: 1.0 for key in mentioned}
+        if mentioned and not broad:
+            return weights
+        votes = self.catalog.votes(query_vector, self.route_k)
+        best = max(votes.values(), default=0.0)
+        limit = len(self.catalog.shards) if broad else self.max_shards
+        for key in sorted(votes, key=votes.get, reverse=True):
+            share = votes[key] / best if best else 0.0
+            if len(weights) >= limit or (share < MIN_SHARD_SHARE and not broad):
+                break
+            weights.setdefault(key, max(share, MIN_SHARD_SHARE))
+        return weights
+
+    def _shard_sections(self, key: str, query: str, text_embedder, kwargs: dict):
+        with span("shard_context", shard=key):
+            querier = self.pool.get(shard_workspace(self.workspace, key))
+            with self._shard_locks.setdefault(key, threading.Lock()):
+                search_engine = querier.ensure_engine()
+            return search_engine.context_builder.candidate_sections(query, text_embedder=text_embedder, **kwargs)
+
+    def build_context(
+            self,
+            query: str,
+            conversation_history: ConversationHistory | None = None,
+            min_tokens: int = 2000,
+            max_tokens: int = 8000,
+            community_context_name: str = "Reports",
+            column_delimiter: str = "|",
+            **kwargs,
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        with span("shard_routing") as routing_span:
+            self.catalog.refresh()
+            with span("query_embedding"):
+                query_vector = self.text_embedder.embed(query)
+            weights = self.route(query, query_vector)
+            if routing_span is not None:
+                routing_span.attributes["shards"] = sorted(weights)
+        SHARDS_QUERIED.observe(len(weights))
+        log.info("Routing query to shards %s: %s", sorted(weights), query)
+
+        text_embedder = _QueryEmbedding(self.text_embedder, query, query_vector)
+        kwargs["community_context_name"] = community_context_name
+        futures = {
+            # a copied context per task keeps the shard spans under this query's trace
+            key: self.executor.submit(
+                contextvars.copy_context().run, self._shard_sections, key, query, text_embedder, kwargs
+            )
+            for key in weights
+        }
+
+        sections: dict[str, tuple[list[str], list[ContextCandidate]]] = {}
+        for key, future in futures.items():
+            try:
+                shard_sections = future.result()
+            except Exception:
+                log.exception("Building context from shard %s failed", key)
+                continue
+            for name, (header, candidates) in shard_sections.items():
+                merged = sections.setdefault(name, (header, []))[1]
+                for candidate in candidates:
+                    candidate.id = f"{key}:{candidate.id}"
+                    candidate.record[0] = f"{key}:{candidate.record[0]}"
+                    candidate.tokens += estimate_tokens(key) + 1
+                    candidate.score *= weights[key]
+                    merged.append(candidate)
+        if not sections:
+            return "", {}
+        for _, candidates in sections.values():
+            candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+        return pack_sections(query, sections, min_tokens, max_tokens, community_context_name, column_delimiter)
+
+
+class ShardRouter:
+    """Answers questions from the shards of a workspace, through an EnginePool of shard queriers."""
+
+    def __init__(self, workspace="ragtest", config=None, pool: EnginePool | None = None, max_shards: int = MAX_SHARDS):
+        """
+        :param workspace: The workspace whose shards are queried
+        :param config: The configuration dictionary
+        :param pool: Holds the shard queriers within a memory budget; one is created if not given
+        :param max_shards: Shards a focused question is answered from, at most
+        """
+        self.workspace = workspace
+        self.config = config
+        self.pool = pool or EnginePool(config)
+        self.catalog = ShardCatalog(workspace)
+        self.max_shards = max_shards
+        self.search_engine = None
+        self.table_stores = TariffStores()
+
+    def setup_search(self) -> CustomSearch:
+        if self.search_engine is None:
+            llm_instance, token_encoder, text_embedder = self.pool.clients
+            context_builder = ShardedContext(
+                self.workspace, self.catalog, self.pool, text_embedder, max_shards=self.max_shards
+            )
+            self.search_engine = CustomSearch(
+                llm=llm_instance,
+                context_builder=context_builder,
+                token_encoder=token_encoder,
+                llm_params=LLM_PARAMS,
+                context_builder_params=LOCAL_CONTEXT_PARAMS,
+                response_type='Single Paragraph',
+            )
+        return self.search_engine
+
+    def table_lookup_engine(self, question) -> CustomSearch | None:
+        """A table lookup engine over the shards whose tariff table rows answer the question, if any do."""
+        lookup_config = (self.config or {}).get("table_lookup") or {}
+        if not lookup_config.get("enabled", False) or not is_lookup_query(question):
+            return None
+        top_k_rows = lookup_config.get("top_k_rows", 30)
+        answering = []
+        for key in list_shards(self.workspace):
+            store = self.table_stores.get(shard_workspace(self.workspace, key))
+            if store is not None and not store.answering_rows(question, top_k_rows).empty:
+                answering.append(shard_workspace(self.workspace, key))
+        if not answering:
+            return None
+        llm_instance, token_encoder, _ = self.pool.clients
+        return CustomSearch(
+            llm=llm_instance,
+            context_builder=TariffContextBuilder(answering, self.table_stores),
+            token_encoder=token_encoder,
+            llm_params=LLM_PARAMS,
+            context_builder_params={"top_k_rows": top_k_rows},
+            response_type='Single Paragraph',
+        )
+
+    async def query(self, question, callbacks=[], system_prompt=LOCAL_SEARCH_SYSTEM_PROMPT):
+        start_time = time.perf_counter()
+        trace = Trace("query", question=question, sharded=True)
+        try:
+            with trace.activate():
+                # rate and charge lookups that the shards' tariff table rows answer skip the graph
+                with span("table_route") as route_span:
+                    table_search = self.table_lookup_engine(question)
+                    if route_span is not None:
+                        route_span.attributes["table_lookup"] = table_search is not None
+                QUERY_ROUTES.labels(path="graph" if table_search is None else "table").inc()
+                search_engine = table_search or self.setup_search()
+                result = await search_engine.asearch(question, callbacks=callbacks, system_prompt=system_prompt)
+            trace.end()
+        except Exception:
+            QUERIES.labels(status="error").inc()
+            raise
+        finally:
+            # shard queriers are only sized once loaded
+            self.pool._enforce_budget()
+        QUERIES.labels(status="ok" if result.response else "error").inc()
+        QUERY_SECONDS.observe(time.perf_counter() - start_time)
+        if result.latency is not None:
+            QUERY_FIRST_TOKEN_SECONDS.observe(result.latency)
+        return result
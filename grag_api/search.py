@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 from collections.abc import AsyncGenerator
@@ -16,6 +17,9 @@ from typing import Any
 
 import pandas as pd
 
+from grag_api.metrics import CONTEXT_BUILD_SECONDS, LLM_COMPLETION_TOKENS, LLM_PROMPT_TOKENS
+from grag_api.tracing import Span, Trace, ensure_trace, span
+
 DEFAULT_LLM_PARAMS = {
     "max_tokens": 1500,
     "temperature": 0.0,
@@ -34,6 +38,7 @@ class SearchResult:
     llm_calls: int
     prompt_tokens: int
     latency: float
+    trace: Trace | None = None
 
 class FirstCharCallback(BaseLLMCallback):
     def __init__(self):
@@ -43,6 +48,14 @@ class FirstCharCallback(BaseLLMCallback):
         if self.first_char_time is None:
             self.first_char_time = time.time()
 
+
+def _record_first_token(trace: Trace, llm_span: Span | None, first_char_callback: FirstCharCallback):
+    """Add the wait for the first streamed token as a child of the LLM span."""
+    if llm_span is not None and first_char_callback.first_char_time:
+        trace.add_span(
+            "llm_first_token", llm_span.start_ns, int(first_char_callback.first_char_time * 1e9), parent=llm_span
+        )
+
 class CustomSearch(BaseSearch):
     """Search orchestration for local search mode."""
 
@@ -72,139 +85,191 @@ class CustomSearch(BaseSearch):
             self,
             query: str,
             conversation_history: ConversationHistory | None = None,
+            callbacks: list[BaseLLMCallback] | None = None,
+            system_prompt: str | None = None,
             **kwargs,
     ) -> SearchResult:
         start_time = time.time()
         search_prompt = ""
+        callbacks = self.callbacks if callbacks is None else callbacks
+        system_prompt = system_prompt or self.system_prompt
 
-        context_text, context_records = self.context_builder.build_context(
-            query=query,
-            conversation_history=conversation_history,
-            **kwargs,
-            **self.context_builder_params,
-        )
-        log.info("GENERATE ANSWER: %s. QUERY: %s", start_time, query)
-        try:
-            search_prompt = self.system_prompt.format(
-                context_data=context_text, response_type=self.response_type
-            )
-
-            search_messages = [
-                {"role": "system", "content": search_prompt},
-                {"role": "user", "content": query},
-            ]
-
-            first_char_callback = FirstCharCallback()
-            response = await self.acall_llm(search_messages, [first_char_callback] + self.callbacks, self.llm_params)
-
-            return SearchResult(
-                response=response,
-                context_data=context_records,
-                context_text=context_text,
-                completion_time=time.time() - start_time,
-                llm_calls=1,
-                prompt_tokens=num_tokens(search_prompt, self.token_encoder),
-                latency=first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None
-            )
-
-        except Exception:
-            log.exception("Exception in _asearch")
-            return SearchResult(
-                response="",
-                context_data=context_records,
-                context_text=context_text,
-                completion_time=time.time() - start_time,
-                llm_calls=1,
-                prompt_tokens=num_tokens(search_prompt, self.token_encoder),
-                latency=None
-            )
+        with ensure_trace("search", query=query) as trace:
+            # context building makes a blocking embedding call; keep it off the event loop
+            with span("build_context"), CONTEXT_BUILD_SECONDS.time():
+                context_text, context_records = await asyncio.to_thread(
+                    self.context_builder.build_context,
+                    query=query,
+                    conversation_history=conversation_history,
+                    **kwargs,
+                    **self.context_builder_params,
+                )
+            log.info("GENERATE ANSWER: %s. QUERY: %s", start_time, query)
+            try:
+                with span("prompt_assembly"):
+                    search_prompt = system_prompt.format(
+                        context_data=context_text, response_type=self.response_type
+                    )
+
+                    search_messages = [
+                        {"role": "system", "content": search_prompt},
+                        {"role": "user", "content": query},
+                    ]
+
+                first_char_callback = FirstCharCallback()
+                with span("llm_generate") as llm_span:
+                    response = await self.acall_llm(search_messages, [first_char_callback] + callbacks, self.llm_params)
+                _record_first_token(trace, llm_span, first_char_callback)
+
+                with span("token_counting"):
+                    prompt_tokens = num_tokens(search_prompt, self.token_encoder)
+                    LLM_PROMPT_TOKENS.inc(prompt_tokens)
+                    LLM_COMPLETION_TOKENS.inc(num_tokens(response, self.token_encoder))
+
+                return SearchResult(
+                    response=response,
+                    context_data=context_records,
+                    context_text=context_text,
+                    completion_time=time.time() - start_time,
+                    llm_calls=1,
+                    prompt_tokens=prompt_tokens,
+                    latency=first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None,
+                    trace=trace,
+                )
+
+            except Exception:
+                log.exception("Exception in _asearch")
+                return SearchResult(
+                    response="",
+                    context_data=context_records,
+                    context_text=context_text,
+                    completion_time=time.time() - start_time,
+                    llm_calls=1,
+                    prompt_tokens=num_tokens(search_prompt, self.token_encoder),
+                    latency=None,
+                    trace=trace,
+                )
 
     async def astream_search(
             self,
             query: str,
             conversation_history: ConversationHistory | None = None,
+            callbacks: list[BaseLLMCallback] | None = None,
+            system_prompt: str | None = None,
     ) -> AsyncGenerator:
         start_time = time.time()
+        callbacks = self.callbacks if callbacks is None else callbacks
+        system_prompt = system_prompt or self.system_prompt
 
-        context_text, context_records = self.context_builder.build_context(
-            query=query,
-            conversation_history=conversation_history,
-            **self.context_builder_params,
-        )
-        log.info("GENERATE ANSWER: %s. QUERY: %s", start_time, query)
-        search_prompt = self.system_prompt.format(
-            context_data=context_text, response_type=self.response_type
-        )
-        search_messages = [
-            {"role": "system", "content": search_prompt},
-            {"role": "user", "content": query},
-        ]
+        # spans are recorded explicitly after the first yield, so the trace is
+        # not left active in the consumer's context while it iterates
+        trace = Trace("stream_search", query=query)
+        with trace.activate():
+            with span("build_context"), CONTEXT_BUILD_SECONDS.time():
+                context_text, context_records = await asyncio.to_thread(
+                    self.context_builder.build_context,
+                    query=query,
+                    conversation_history=conversation_history,
+                    **self.context_builder_params,
+                )
+            log.info("GENERATE ANSWER: %s. QUERY: %s", start_time, query)
+            with span("prompt_assembly"):
+                search_prompt = system_prompt.format(
+                    context_data=context_text, response_type=self.response_type
+                )
+                search_messages = [
+                    {"role": "system", "content": search_prompt},
+                    {"role": "user", "content": query},
+                ]
 
         yield context_records
         first_char_callback = FirstCharCallback()
+        llm_start = time.time_ns()
         async for response in self.llm.agenerate(
                 messages=search_messages,
                 streaming=True,
-                callbacks=[first_char_callback] + self.callbacks,
+                callbacks=[first_char_callback] + callbacks,
                 **self.llm_params,
         ):
             yield response
+        llm_span = trace.add_span("llm_generate", llm_start, time.time_ns())
+        _record_first_token(trace, llm_span, first_char_callback)
+        trace.end()
 
-        yield {"latency": first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None}
+        yield {
+            "latency": first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None,
+            "trace": trace,
+        }
 
     def search(
             self,
             query: str,
             conversation_history: ConversationHistory | None = None,
+            callbacks: list[BaseLLMCallback] | None = None,
+            system_prompt: str | None = None,
             **kwargs,
     ) -> SearchResult:
         start_time = time.time()
         search_prompt = ""
-        context_text, context_records = self.context_builder.build_context(
-            query=query,
-            conversation_history=conversation_history,
-            **kwargs,
-            **self.context_builder_params,
-        )
-        log.info("GENERATE ANSWER: %d. QUERY: %s", start_time, query)
-        try:
-            search_prompt = self.system_prompt.format(
-                context_data=context_text, response_type=self.response_type
-            )
-
-            search_messages = [
-                {"role": "system", "content": search_prompt},
-                {"role": "user", "content": query},
-            ]
-
-            first_char_callback = FirstCharCallback()
-            response = self.call_llm(
-                search_messages,
-                [first_char_callback] + self.callbacks,
-                self.llm_params
-            )
-
-            return SearchResult(
-                response=response,
-                context_data=context_records,
-                context_text=context_text,
-                completion_time=time.time() - start_time,
-                llm_calls=1,
-                prompt_tokens=num_tokens(search_prompt, self.token_encoder),
-                latency=first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None
-            )
-
-        except Exception:
-            log.exception("Exception in _map_response_single_batch")
-            return SearchResult(
-                response="",
-                context_data=context_records,
-                context_text=context_text,
-                completion_time=time.time() - start_time,
-                llm_calls=1,
-                prompt_tokens=num_tokens(search_prompt, self.token_encoder),
-                latency=None
-            )
+        callbacks = self.callbacks if callbacks is None else callbacks
+        system_prompt = system_prompt or self.system_prompt
+        with ensure_trace("search", query=query) as trace:
+            with span("build_context"), CONTEXT_BUILD_SECONDS.time():
+                context_text, context_records = self.context_builder.build_context(
+                    query=query,
+                    conversation_history=conversation_history,
+                    **kwargs,
+                    **self.context_builder_params,
+                )
+            log.info("GENERATE ANSWER: %d. QUERY: %s", start_time, query)
+            try:
+                with span("prompt_assembly"):
+                    search_prompt = system_prompt.format(
+                        context_data=context_text, response_type=self.response_type
+                    )
+
+                    search_messages = [
+                        {"role": "system", "content": search_prompt},
+                        {"role": "user", "content": query},
+                    ]
+
+                first_char_callback = FirstCharCallback()
+                with span("llm_generate") as llm_span:
+                    response = self.call_llm(
+                        search_messages,
+                        [first_char_callback] + callbacks,
+                        self.llm_params
+                    )
+                _record_first_token(trace, llm_span, first_char_callback)
+
+                with span("token_counting"):
+                    prompt_tokens = num_tokens(search_prompt, self.token_encoder)
+                    LLM_PROMPT_TOKENS.inc(prompt_tokens)
+                    LLM_COMPLETION_TOKENS.inc(num_tokens(response, self.token_encoder))
+
+                return SearchResult(
+                    response=response,
+                    context_data=context_records,
+                    context_text=context_text,
+                    completion_time=time.time() - start_time,
+                    llm_calls=1,
+                    prompt_tokens=prompt_tokens,
+                    latency=first_char_callback.first_char_time - start_time if first_char_callback.first_char_time else None,
+                    trace=trace,
+                )
+
+            except Exception:
+                log.exception("Exception in _map_response_single_batch")
+                return SearchResult(
+                    response="",
+                    context_data=context_records,
+                    context_text=context_text,
+                    completion_time=time.time() - start_time,
+                    llm_calls=1,
+                    prompt_tokens=num_tokens(search_prompt, self.token_encoder),
+                    latency=None,
+                    trace=trace,
+                )
 
     async def acall_llm(self, search_messages, callbacks, params):
         return await self.llm.agenerate(
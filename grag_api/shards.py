@@ -0,0 +1,140 @@
+"""
+An index split into one shard per document collection.
+
+Each collection, by default the rows sharing a file title, is indexed into its
+own sub-workspace under <workspace>/shards/<key>, with its own artifacts, arena,
+_index timestamp and tombstones, so it can be queried by an ordinary
+GraphRAGQuerier. Re-indexing only rebuilds the shards whose rows changed since
+their last run, and drops the shards whose rows are all gone.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from grag_api.tombstones import Tombstones
+
+log = logging.getLogger(__name__)
+
+SHARD_DIR = "shards"
+SHARD_STATE_FILE = "shards.json"
+
+
+def shard_key(title) -> str:
+    """The shard a dataset row belongs to: a slug of its title without the file extension."""
+    stem = Path(str(title or "")).stem
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "untitled"
+
+
+def shard_workspace(workspace, key: str) -> Path:
+    return Path(workspace) / SHARD_DIR / key
+
+
+def list_shards(workspace) -> list[str]:
+    """Keys of the shards that have been indexed at least once."""
+    root = Path(workspace) / SHARD_DIR
+    if not root.exists():
+        return []
+    return sorted(path.name for path in root.iterdir() if (path / "_index").exists())
+
+
+def content_hash(rows: pd.DataFrame) -> str:
+    """A hash of a shard's rows that changes whenever a row is added, removed or edited."""
+    rows = rows.sort_values("id")
+    hashes = pd.util.hash_pandas_object(rows[["id", "text", "title"]].astype(str), index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+class ShardedIndexer:
+    """Index each collection of a dataset into its own shard, rebuilding only what changed."""
+
+    def __init__(self, workspace="ragtest", config=None, shard_by=shard_key, concurrency: int = 1):
+        """
+        :param workspace: The workspace the shards live under
+        :param config: The configuration dictionary
+        :param shard_by: Maps a row's title to its shard key
+        :param concurrency: Shards indexed at the same time; each run makes its own LLM calls
+        """
+        self.workspace = workspace
+        self.config = config
+        self.shard_by = shard_by
+        self.concurrency = concurrency
+        self.state_path = Path(workspace) / SHARD_DIR / SHARD_STATE_FILE
+
+    def _read_state(self) -> dict[str, str]:
+        if not self.state_path.exists():
+            return {}
+        return json.loads(self.state_path.read_text())
+
+    def _write_state(self, state: dict[str, str]):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(f".{self.state_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.state_path)
+
+    def plan(self, dataset: pd.DataFrame) -> dict[str, pd.DataFrame]:
+        """Split the dataset into shards."""
+        keys = dataset["title"].map(self.shard_by)
+        return {key: rows.reset_index(drop=True) for key, rows in dataset.groupby(keys, sort=True)}
+
+    async def _index_shard(self, key: str, rows: pd.DataFrame):
+        from grag_api.index import GraphRAGIndexer
+
+        workspace = shard_workspace(self.workspace, key)
+        log.info("Indexing shard %s (%s rows)", key, len(rows))
+        await GraphRAGIndexer(str(workspace), config=self.config).run(rows)
+        Tombstones(workspace).purge(rows["id"])
+
+    async def run(self, dataset: pd.DataFrame) -> list[str]:
+        """
+        Index the shards whose rows changed and remove the shards no longer in the dataset.
+
+        A shard that fails to index does not stop the others, and stale shards are removed
+        either way; the failures are raised afterwards, as an ExceptionGroup if several failed.
+
+        :return: The keys of the shards that were indexed
+        """
+        state = self._read_state()
+        shards = self.plan(dataset)
+        hashes = {key: content_hash(rows) for key, rows in shards.items()}
+        changed = [
+            key for key in shards
+            if state.get(key) != hashes[key] or not (shard_workspace(self.workspace, key) / "_index").exists()
+        ]
+        log.info("Sharded index: %s shards, %s changed", len(shards), len(changed))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def index(key):
+            async with semaphore:
+                await self._index_shard(key, shards[key])
+            # recorded per shard, so a failed run keeps the shards that did finish
+            state[key] = hashes[key]
+            self._write_state(state)
+
+        results = await asyncio.gather(*(index(key) for key in changed), return_exceptions=True)
+        errors = {key: result for key, result in zip(changed, results) if isinstance(result, BaseException)}
+        for key, error in errors.items():
+            log.error("Indexing shard %s failed", key, exc_info=error)
+
+        for key in sorted(set(state) - set(shards)):
+            log.info("Removing shard %s", key)
+            shutil.rmtree(shard_workspace(self.workspace, key), ignore_errors=True)
+            del state[key]
+            self._write_state(state)
+
+        # a cancelled run is not a shard failure
+        for error in errors.values():
+            if not isinstance(error, Exception):
+                raise error
+        if len(errors) == 1:
+            raise next(iter(errors.values()))
+        if errors:
+            raise ExceptionGroup(f"Indexing {len(errors)} shards failed: {', '.join(errors)}", list(errors.values()))
+        return changed
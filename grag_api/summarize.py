@@ -0,0 +1,284 @@
+"""
+A selective, cached and batched summarize_descriptions verb for the index pipeline.
+
+graphrag makes one LLM call for every node and edge with more than one
+description, however short the descriptions are and whether or not the same
+set was summarized in the last run. Here a merged description that already fits
+within max_length words is kept as it is, summaries are stored in a SQLite file
+in the workspace cache keyed by a hash of the prompt, the entity and its
+description set, and the remaining jobs are sent many to a call. The batch
+prompt is the configured summarize prompt's instructions, followed by the jobs
+as JSON; a prompt without a -Data- section to split them from is used one job
+at a time. Jobs the model leaves out of its answer go through graphrag's
+one-at-a-time strategy.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from datashaper import TableContainer, VerbCallbacks, VerbInput
+from graphrag.index.cache import NoopPipelineCache, PipelineCache
+from graphrag.index.graph.extractors.summarize.prompts import SUMMARIZE_PROMPT
+from graphrag.index.llm import load_llm
+from graphrag.index.verbs.entities.summarize import summarize_descriptions
+from graphrag.index.verbs.entities.summarize.strategies.graph_intelligence import run as run_graph_intelligence
+
+from grag_api.graph_tables import read_graphml, write_graphml
+from grag_api.metrics import INDEX_SUMMARIES, INDEX_SUMMARY_CALLS
+from grag_api.tokens import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+SUMMARY_CACHE_FILE = "summaries.sqlite"
+DEFAULT_MAX_LENGTH = 500
+# keys per SQLite lookup, below its bound variable limit
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    key BLOB PRIMARY KEY,
+    summary TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+# marks where a summarize prompt's instructions end and its data begins
+DATA_SECTION = "-Data-"
+# follows the configured prompt's instructions in a batch prompt
+BATCH_INSTRUCTIONS = """
+
+The data below holds several jobs. Each job gives one or two entities, and a list of descriptions. Follow the instructions above for each job separately.
+Limit each job's description to {max_length} words.
+Return a JSON object of the form {{"summaries": [{{"id": <job id>, "description": <summary>}}, ...]}} with one entry per job.
+
+#######
+-Data-
+Jobs: """
+
+
+def summary_key(model: str, prompt: str, max_length: int, name, descriptions: list[str]) -> bytes:
+    return hashlib.sha256(json.dumps([model, prompt, max_length, name, descriptions]).encode("utf-8")).digest()
+
+
+def batch_instructions(summarize_prompt: str, max_length: int) -> str | None:
+    """
+    A batch prompt up to its jobs: the instructions of a summarize prompt, to be applied to each job.
+
+    :return: None if the prompt has no data section to separate its instructions from
+    """
+    instructions, marker, _ = summarize_prompt.partition(DATA_SECTION)
+    instructions = instructions.rstrip().rstrip("#").rstrip()
+    if not marker or not instructions:
+        return None
+    try:
+        return instructions.format(max_length=max_length) + BATCH_INSTRUCTIONS.format(max_length=max_length)
+    except (IndexError, KeyError, ValueError):
+        # the instructions refer to a job's data, so they cannot be shared by a batch
+        return None
+
+
+class SummaryCache:
+    """Description summaries by hash(model, prompt, max length, entity, descriptions), stored in a SQLite file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys) -> dict[bytes, str]:
+        keys = list(keys)
+        summaries = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                summaries.update(conn.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        return summaries
+
+    def put_many(self, summaries: dict[bytes, str]):
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO summaries (key, summary) VALUES (?, ?)", summaries.items())
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+
+def _descriptions(values: pd.Series) -> list[list[str]]:
+    """Each merged description split into its distinct parts, as graphrag splits them."""
+    return [sorted(set(value.split("\n"))) if isinstance(value, str) else [""] for value in values]
+
+
+def _batches(jobs: list[dict], batch_size: int, batch_max_tokens: int) -> list[list[dict]]:
+    """Jobs in order, packed into batches of at most batch_size jobs and about batch_max_tokens of input."""
+    batches, batch, tokens = [], [], 0
+    for job in jobs:
+        job_tokens = sum(estimate_tokens(description) for description in job["descriptions"])
+        if batch and (len(batch) >= batch_size or tokens + job_tokens > batch_max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(job)
+        tokens += job_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _summarize_batch(llm, batch: list[dict], instructions: str) -> dict[int, str]:
+    """Summaries by job id, for the jobs the model answered."""
+    jobs = [{"id": job["id"], "entities": job["name"], "descriptions": job["descriptions"]} for job in batch]
+    prompt = instructions + json.dumps(jobs, ensure_ascii=False) + "\n#######\nOutput:"
+    INDEX_SUMMARY_CALLS.labels(kind="batch").inc()
+    result = await llm(prompt, json=True, name="summarize_batch")
+    answer = result.json if result.json is not None else json.loads(result.output or "{}")
+    summaries = {}
+    for entry in answer.get("summaries", []) if isinstance(answer, dict) else []:
+        if isinstance(entry, dict) and isinstance(entry.get("description"), str) and entry["description"].strip():
+            summaries[entry.get("id")] = entry["description"].strip()
+    return summaries
+
+
+async def batched_summarize_descriptions(
+        input: VerbInput,
+        cache: PipelineCache,
+        callbacks: VerbCallbacks,
+        column: str,
+        to: str,
+        strategy: dict | None = None,
+        workspace="ragtest",
+        cache_base_dir: str = "cache",
+        batch_size: int = 16,
+        batch_max_tokens: int = 8000,
+        **kwargs,
+) -> TableContainer:
+    """
+    Drop-in for graphrag's summarize_descriptions verb that only asks the LLM for what it must.
+
+    Runs with a strategy other than graph_intelligence are passed to graphrag's verb unchanged.
+
+    :param column: The column with each row's GraphML graph
+    :param strategy: graphrag's summarization strategy; its summarize_prompt, max_summary_length and llm.model
+                     are part of the cache key
+    :param workspace: The workspace whose cache directory holds the summaries
+    :param cache_base_dir: The cache directory, relative to the workspace (the config's cache.base_dir)
+    :param batch_size: Summarization jobs sent in one LLM call
+    :param batch_max_tokens: Estimated description tokens sent in one LLM call
+    """
+    strategy = strategy or {}
+    if strategy.get("type", "graph_intelligence") != "graph_intelligence":
+        return await summarize_descriptions(input, cache, callbacks, column, to, strategy, **kwargs)
+
+    output = input.get_input()
+    llm_config = strategy.get("llm") or {}
+    model = llm_config.get("model", "")
+    max_length = strategy.get("max_summary_length") or DEFAULT_MAX_LENGTH
+    summarize_prompt = strategy.get("summarize_prompt") or SUMMARIZE_PROMPT
+    instructions = batch_instructions(summarize_prompt, max_length)
+
+    graphs = [read_graphml(graphml) if graphml is not None else None for graphml in output[column]]
+    # one job per node and edge, in graph order, with the frame and row its summary goes to
+    jobs = []
+    for graph in graphs:
+        if graph is None:
+            continue
+        nodes, edges = graph
+        for table, names in ((nodes, nodes["label"]), (edges, zip(edges["source"], edges["target"]))):
+            values = table["description"] if "description" in table else pd.Series([None] * len(table))
+            for row, (name, descriptions) in enumerate(zip(names, _descriptions(values))):
+                name = list(name) if isinstance(name, tuple) else name
+                jobs.append({"table": table, "row": row, "name": name, "descriptions": descriptions})
+
+    summaries = {}
+    pending = []
+    for job in jobs:
+        descriptions = job["descriptions"]
+        if len(descriptions) == 1 or len(" ".join(descriptions).split()) <= max_length:
+            summaries[id(job)] = " ".join(description for description in descriptions if description)
+        else:
+            job["key"] = summary_key(model, summarize_prompt, max_length, job["name"], descriptions)
+            pending.append(job)
+    INDEX_SUMMARIES.labels(source="short").inc(len(jobs) - len(pending))
+
+    store = SummaryCache(Path(workspace) / cache_base_dir / SUMMARY_CACHE_FILE)
+    cached = store.get_many({job["key"] for job in pending})
+    misses = []
+    for job in pending:
+        if job["key"] in cached:
+            summaries[id(job)] = cached[job["key"]]
+        else:
+            misses.append(job)
+    INDEX_SUMMARIES.labels(source="cache").inc(len(pending) - len(misses))
+
+    # repeated description sets are summarized once
+    distinct = list({job["key"]: job for job in misses}.values())
+    log.info(
+        "Summarizing %s: %s descriptions, %s within %s words, %s cached, %s to summarize",
+        column, len(jobs), len(jobs) - len(pending), max_length, len(pending) - len(misses), len(distinct),
+    )
+    if distinct:
+        # summaries are cached here, so graphrag's per-prompt JSON cache would only duplicate them
+        llm = load_llm("summarize_descriptions", llm_config.get("type"), callbacks, NoopPipelineCache(), llm_config,
+                       chat_only=True)
+        semaphore = asyncio.Semaphore(kwargs.get("num_threads", 4))
+        for position, job in enumerate(distinct):
+            job["id"] = position
+
+        async def summarize_one(job) -> str:
+            INDEX_SUMMARY_CALLS.labels(kind="single").inc()
+            name = tuple(job["name"]) if isinstance(job["name"], list) else job["name"]
+            result = await run_graph_intelligence(name, job["descriptions"], callbacks, NoopPipelineCache(), strategy)
+            return result.description
+
+        async def summarize(batch) -> dict[bytes, str]:
+            async with semaphore:
+                answered = {}
+                if instructions is not None:
+                    try:
+                        answered = await _summarize_batch(llm, batch, instructions)
+                    except Exception:
+                        log.exception("Batched summarization of %s jobs failed, summarizing them one by one",
+                                      len(batch))
+                left_out = [job for job in batch if job["id"] not in answered]
+                single = await asyncio.gather(*(summarize_one(job) for job in left_out))
+            INDEX_SUMMARIES.labels(source="llm").inc(len(batch) - len(left_out))
+            INDEX_SUMMARIES.labels(source="single").inc(len(left_out))
+            results = {job["key"]: answered[job["id"]] for job in batch if job["id"] in answered}
+            results.update((job["key"], summary) for job, summary in zip(left_out, single) if summary)
+            return results
+
+        summarized = {}
+        if instructions is None:
+            log.info("The summarize prompt has no %s section, summarizing one job at a time", DATA_SECTION)
+            batch_size = 1
+        for results in await asyncio.gather(*(
+                summarize(batch) for batch in _batches(distinct, batch_size, batch_max_tokens)
+        )):
+            summarized.update(results)
+        store.put_many(summarized)
+        for job in misses:
+            summaries[id(job)] = summarized.get(job["key"], "")
+
+    for job in jobs:
+        table = job["table"]
+        if "description" not in table:
+            table["description"] = pd.Series([None] * len(table), dtype=object)
+        table.iat[job["row"], table.columns.get_loc("description")] = summaries[id(job)]
+    output[to] = [write_graphml(*graph) if graph is not None else None for graph in graphs]
+    return TableContainer(table=output)
@@ -0,0 +1,364 @@
+"""
+A structured store for the tables of tariff PDFs, with a lookup path that skips the graph.
+
+PDFProcessor flattens each table into CSV-like text for the graph, where it is
+extracted as opaque chunks and comes back whole inside 12k-token prompts. The
+same tables are also parsed into typed rows and kept in <workspace>/tariff_tables.sqlite
+with their document, page and carrier: one row per table row with its cells,
+one row per cell with its parsed number, and an FTS5 index over the row text.
+Rate and charge questions whose specific terms (codes, numbers, column names)
+are all covered by the rows that match them are answered from those rows,
+filtered to the carriers the question names, so the prompt carries a few table
+rows instead of the whole local search context. Other lookups keep the graph
+context and get the matching rows as one more section of it.
+"""
+import html
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from graphrag.query.context_builder.builders import LocalContextBuilder
+from graphrag.query.context_builder.conversation_history import ConversationHistory
+
+from grag_api.lexical import STOPWORDS, tokenize
+
+TABLE_STORE_FILE = "tariff_tables.sqlite"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS tariff_tables (
+        id TEXT PRIMARY KEY,
+        document TEXT NOT NULL,
+        page_id TEXT NOT NULL,
+        page INTEGER,
+        carrier TEXT NOT NULL,
+        columns TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tariff_rows (
+        id INTEGER PRIMARY KEY,
+        table_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        cells TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tariff_cells (
+        row_id INTEGER NOT NULL,
+        column_name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        number REAL
+    )
+    """,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tariff_rows_fts USING fts5(text)",
+    "CREATE INDEX IF NOT EXISTS tariff_tables_document ON tariff_tables (document)",
+    "CREATE INDEX IF NOT EXISTS tariff_tables_page ON tariff_tables (page_id)",
+    "CREATE INDEX IF NOT EXISTS tariff_rows_table ON tariff_rows (table_id)",
+    "CREATE INDEX IF NOT EXISTS tariff_cells_row ON tariff_cells (row_id)",
+]
+
+# words that make a question a rate or charge lookup; words any tariff question uses
+# ("tariff", "per", "cost", "minimum") do not
+LOOKUP_TERMS = {
+    "rate", "rates", "charge", "charges", "charged", "fee", "fees", "surcharge", "surcharges", "cwt",
+    "accessorial", "accessorials",
+}
+# words of a file name that say what kind of document it is, not whose
+TITLE_WORDS = {"tariff", "tariffs", "rules", "rule", "rates", "rate", "accessorial", "accessorials", "freight", "pdf"}
+NUMBER_PATTERN = re.compile(r"^\(?-?[$€£]?\s*-?\d[\d,]*(?:\.\d+)?\s*%?\)?$")
+
+
+def parse_number(text: str) -> float | None:
+    """The number a cell holds, e.g. "$1,234.50" -> 1234.5 and "15%" -> 15.0, or None."""
+    text = text.strip()
+    if not text or not NUMBER_PATTERN.match(text):
+        return None
+    negative = text.startswith("(") or "-" in text
+    value = float(re.sub(r"[^\d.]", "", text) or "nan")
+    return -value if negative else value
+
+
+def _cell_text(cell: str) -> str:
+    return re.sub(r"\s+", " ", html.unescape(re.sub(r"<[^>]+>", " ", cell))).strip()
+
+
+def parse_html_table(table_html: str) -> dict:
+    """
+    The columns and rows of an HTML table. The first row is the header; unnamed and repeated
+    column names are numbered, and rows are padded or cut to the header's width.
+
+    :return: {"columns": [...], "rows": [[...], ...]}
+    """
+    rows = [
+        [_cell_text(cell) for cell in re.findall(r'<t[hd].*?>(.*?)</t[hd]>', row, re.DOTALL)]
+        for row in re.findall(r'<tr.*?>(.*?)</tr>', table_html, re.DOTALL)
+    ]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return {"columns": [], "rows": []}
+    columns, seen = [], {}
+    for position, name in enumerate(rows[0]):
+        name = name or f"column {position + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        columns.append(name if seen[name] == 1 else f"{name} {seen[name]}")
+    width = len(columns)
+    return {"columns": columns, "rows": [(row + [""] * width)[:width] for row in rows[1:]]}
+
+
+def carrier_from_title(title: str) -> str:
+    """The carrier a tariff file belongs to, taken from its name: "Roadrunner_Rules_Tariff.pdf" -> "roadrunner"."""
+    words = [word for word in re.split(r"[^a-z0-9]+", Path(title).stem.lower()) if word]
+    named = [word for word in words if word not in TITLE_WORDS and not word.isdigit()]
+    return (named or words or [""])[0]
+
+
+def is_lookup_query(question: str) -> bool:
+    """Whether a question asks for a rate or charge, which table rows can answer."""
+    return any(token in LOOKUP_TERMS for token in tokenize(question))
+
+
+def specific_terms(question: str, carriers: set[str]) -> set[str]:
+    """The words of a question that say which rows it wants: not stopwords, lookup words or carrier names."""
+    return {
+        token for token in tokenize(question)
+        if token not in STOPWORDS and token not in LOOKUP_TERMS and token not in carriers
+    }
+
+
+def _match_expression(terms: list[str]) -> str:
+    """An FTS5 query matching any of the terms; a code such as "175.5" is matched as a phrase."""
+    phrases = {" ".join(re.findall(r"\w+", term)) for term in terms}
+    return " OR ".join(f'"{phrase}"' for phrase in sorted(phrases) if phrase)
+
+
+class TariffTableStore:
+    """Parsed tariff tables of a workspace, in a SQLite file."""
+
+    def __init__(self, path, create: bool = True):
+        """
+        :param path: The SQLite file
+        :param create: Create the file and its tables if missing; False for a file known to exist
+        """
+        self.path = Path(path)
+        self._carriers = None
+        if create:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+
+    @classmethod
+    def for_workspace(cls, workspace) -> "TariffTableStore":
+        return cls(Path(workspace) / TABLE_STORE_FILE)
+
+    @classmethod
+    def open_existing(cls, workspace) -> "TariffTableStore | None":
+        """The workspace's store, or None if no tables were ever stored, without creating or altering the file."""
+        path = Path(workspace) / TABLE_STORE_FILE
+        return cls(path, create=False) if path.exists() else None
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_pages(self, pages: list[dict]):
+        """
+        Store the tables of dataset rows from PDFProcessor, replacing any stored for the same pages.
+
+        :param pages: Rows with id, title and the "tables" PDFProcessor parsed on the page
+        """
+        pages = [page for page in pages if page.get("tables")]
+        if not pages:
+            return
+        self.delete_pages([page["id"] for page in pages])
+        with self._connect() as conn:
+            for page in pages:
+                page_number = page["id"].rsplit("_", 1)[-1]
+                carrier = carrier_from_title(page["title"])
+                for position, table in enumerate(page["tables"]):
+                    table_id = f"{page['id']}#{position + 1}"
+                    conn.execute(
+                        "INSERT INTO tariff_tables (id, document, page_id, page, carrier, columns) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (table_id, page["title"], page["id"], int(page_number) if page_number.isdigit() else None,
+                         carrier, json.dumps(table["columns"])),
+                    )
+                    for row_position, cells in enumerate(table["rows"]):
+                        row_id = conn.execute(
+                            "INSERT INTO tariff_rows (table_id, position, cells) VALUES (?, ?, ?)",
+                            (table_id, row_position, json.dumps(cells)),
+                        ).lastrowid
+                        conn.executemany(
+                            "INSERT INTO tariff_cells (row_id, column_name, value, number) VALUES (?, ?, ?, ?)",
+                            [(row_id, column, value, parse_number(value)) for column, value in zip(table["columns"], cells)],
+                        )
+                        text = " ".join([carrier, *(f"{column} {value}" for column, value in zip(table["columns"], cells))])
+                        conn.execute("INSERT INTO tariff_rows_fts (rowid, text) VALUES (?, ?)", (row_id, text))
+
+    def _delete(self, conn, where: str, values: list[str]):
+        tables = [row["id"] for row in conn.execute(
+            f"SELECT id FROM tariff_tables WHERE {where} IN ({','.join('?' * len(values))})", values
+        )]
+        if not tables:
+            return
+        placeholders = ",".join("?" * len(tables))
+        rows = [row["id"] for row in conn.execute(f"SELECT id FROM tariff_rows WHERE table_id IN ({placeholders})", tables)]
+        conn.executemany("DELETE FROM tariff_rows_fts WHERE rowid = ?", [(row,) for row in rows])
+        conn.executemany("DELETE FROM tariff_cells WHERE row_id = ?", [(row,) for row in rows])
+        conn.execute(f"DELETE FROM tariff_rows WHERE table_id IN ({placeholders})", tables)
+        conn.execute(f"DELETE FROM tariff_tables WHERE id IN ({placeholders})", tables)
+
+    def delete_pages(self, page_ids):
+        page_ids = list(page_ids)
+        if page_ids:
+            with self._connect() as conn:
+                self._delete(conn, "page_id", page_ids)
+
+    def delete_documents(self, titles):
+        titles = list(titles)
+        if titles:
+            with self._connect() as conn:
+                self._delete(conn, "document", titles)
+
+    def carriers(self) -> set[str]:
+        """The carriers with stored tables, read again only after the file changed."""
+        stat = self.path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self._carriers is None or self._carriers[0] != version:
+            with self._connect() as conn:
+                carriers = {row["carrier"] for row in conn.execute("SELECT DISTINCT carrier FROM tariff_tables")}
+            self._carriers = (version, carriers)
+        return self._carriers[1]
+
+    def lookup(self, question: str, k: int = 30) -> pd.DataFrame:
+        """
+        The table rows that best match a question's terms, from the carriers it names (or all).
+
+        :return: One row per table row, best first, with table_id, carrier, document, page, columns and cells
+        """
+        tokens = [token for token in tokenize(question) if token not in STOPWORDS]
+        carriers = self.carriers()
+        named = sorted({token for token in tokens if token in carriers})
+        terms = [token for token in tokens if token not in carriers and token not in LOOKUP_TERMS]
+        # with only generic words left, the lookup words themselves say what to match
+        expression = _match_expression(terms or [token for token in tokens if token in LOOKUP_TERMS])
+        columns = ["table_id", "carrier", "document", "page", "columns", "cells", "score"]
+        if not expression:
+            return pd.DataFrame(columns=columns)
+        carrier_filter = f"AND t.carrier IN ({','.join('?' * len(named))})" if named else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT r.table_id, t.carrier, t.document, t.page, t.columns, r.cells, bm25(tariff_rows_fts) AS score
+                FROM tariff_rows_fts
+                JOIN tariff_rows r ON r.id = tariff_rows_fts.rowid
+                JOIN tariff_tables t ON t.id = r.table_id
+                WHERE tariff_rows_fts MATCH ? {carrier_filter}
+                ORDER BY score, r.table_id, r.position
+                LIMIT ?
+                """,
+                (expression, *named, k),
+            ).fetchall()
+        return pd.DataFrame([dict(row) for row in rows], columns=columns)
+
+    def answering_rows(self, question: str, k: int = 30) -> pd.DataFrame:
+        """
+        The rows matching a question, if together they cover every specific term of it; otherwise
+        none, since the question also asks about something the tables do not hold.
+        """
+        rows = self.lookup(question, k)
+        terms = specific_terms(question, self.carriers())
+        if rows.empty or not terms:
+            return rows.iloc[:0]
+        covered = set()
+        for _, row in rows.iterrows():
+            covered.update(tokenize(" ".join([row["carrier"], *json.loads(row["columns"]), *json.loads(row["cells"])])))
+        return rows if terms <= covered else rows.iloc[:0]
+
+
+class TariffStores:
+    """The table stores a querier reads, each opened once, when its file first exists."""
+
+    def __init__(self):
+        self._stores: dict[Path, TariffTableStore] = {}
+
+    def get(self, workspace) -> TariffTableStore | None:
+        """The workspace's store, or None if no tables were ever stored."""
+        path = Path(workspace) / TABLE_STORE_FILE
+        store = self._stores.get(path)
+        if store is None:
+            store = TariffTableStore.open_existing(workspace)
+            if store is None:
+                return None
+            self._stores[path] = store
+        return store if path.exists() else None
+
+
+def lookup_rows(workspaces, question: str, k: int = 30, answering: bool = False,
+                stores: TariffStores | None = None) -> pd.DataFrame:
+    """
+    The best matching rows across the table stores of several workspaces, e.g. the shards of a workspace.
+
+    :param answering: Only take rows from stores whose rows cover the question, see answering_rows
+    :param stores: The open stores to read, by default opened for this call
+    """
+    stores = stores or TariffStores()
+    frames = []
+    for workspace in workspaces:
+        store = stores.get(workspace)
+        if store is None:
+            continue
+        rows = store.answering_rows(question, k) if answering else store.lookup(question, k)
+        if not rows.empty:
+            frames.append(rows)
+    if not frames:
+        return pd.DataFrame(columns=["table_id", "carrier", "document", "page", "columns", "cells", "score"])
+    # bm25() scores are lower for better matches
+    return pd.concat(frames, ignore_index=True).sort_values("score", kind="stable").head(k).reset_index(drop=True)
+
+
+def render_rows(rows: pd.DataFrame) -> str:
+    """Matching rows as one |-delimited table per source table, headed by its carrier, document and page."""
+    sections = []
+    for table_id, table_rows in rows.groupby("table_id", sort=False):
+        first = table_rows.iloc[0]
+        columns = json.loads(first["columns"])
+        lines = [
+            f"-----Table {table_id} (carrier: {first['carrier']}, document: {first['document']}, page: {first['page']})-----",
+            "|".join(columns),
+            *("|".join(json.loads(cells)) for cells in table_rows["cells"]),
+        ]
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+class TariffContextBuilder(LocalContextBuilder):
+    """Context of only the tariff table rows that match the question, from one or more workspaces."""
+
+    def __init__(self, workspaces, stores: TariffStores | None = None):
+        self.workspaces = [workspaces] if isinstance(workspaces, (str, Path)) else list(workspaces)
+        self.stores = stores or TariffStores()
+
+    def build_context(
+            self,
+            query: str,
+            conversation_history: ConversationHistory | None = None,
+            top_k_rows: int = 30,
+            **kwargs,
+    ) -> tuple[str, dict[str, pd.DataFrame]]:
+        rows = lookup_rows(self.workspaces, query, top_k_rows, stores=self.stores)
+        if rows.empty:
+            return "", {"tariff_rows": rows}
+        return render_rows(rows), {"tariff_rows": rows.drop(columns=["columns"])}
@@ -0,0 +1,158 @@
+"""
+Text bodies kept on disk and read by id.
+
+Text-unit texts and community report contents make up most of an index's size,
+but a query only puts a handful of them into its context. A TextStore keeps one
+such column in an uncompressed Arrow IPC file that is memory-mapped, so only the
+id -> row lookup is resident and a body is paged in when it is read. The lazy
+TextUnit and CommunityReport variants read their body from a store on attribute
+access, so every graphrag code path keeps working on them unchanged.
+
+An indexed workspace's bodies are published in the shared arena, which queriers
+map directly, so the indexer writes no IPC files of its own and removes those of
+earlier runs (remove_text_stores). build_text_stores writes them for a workspace
+that is served from its Parquet artifacts only. Queriers never write them: when
+one is missing or older than its artifact, the column is read into memory instead.
+"""
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+from graphrag.model import CommunityReport, TextUnit
+
+from grag_api.artifact_store import read_artifact_table
+
+
+class TextStore:
+    """One text column of an artifact table, addressable by id."""
+
+    def __init__(self, table: pa.Table, id_column: str, body_column: str):
+        """
+        :param table: A table holding at least the id and body columns, ideally memory-mapped
+        :param id_column: The column the bodies are looked up by
+        :param body_column: The text column
+        """
+        self.body_column = body_column
+        # indexed in place, without combining chunks, so the buffers stay in the mapping
+        self._bodies = table.column(body_column)
+        self.rows = {str(id): row for row, id in enumerate(table.column(id_column).to_pylist())}
+
+    @classmethod
+    def open(cls, path, id_column: str, body_column: str) -> "TextStore":
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        return cls(table, id_column, body_column)
+
+    @staticmethod
+    def default_path(parquet_path, body_column: str) -> Path:
+        parquet_path = Path(parquet_path)
+        return parquet_path.with_name(f"{parquet_path.stem}.{body_column}.arrow")
+
+    @classmethod
+    def write(cls, parquet_path, id_column: str, body_column: str, path=None) -> Path:
+        """
+        Write the IPC file for a Parquet artifact. Never called by queriers.
+
+        :param parquet_path: The artifact with the text column
+        :param path: Where to keep the IPC file, by default next to the artifact
+        """
+        path = Path(path or cls.default_path(parquet_path, body_column))
+        table = read_artifact_table(parquet_path, columns=[id_column, body_column])
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def from_parquet(cls, parquet_path, id_column: str, body_column: str, path=None) -> "TextStore":
+        """
+        Open the store for a Parquet artifact from its IPC file, or, if the indexer has not
+        written a current one, from the artifact's column read into memory. Writes nothing.
+
+        :param parquet_path: The artifact with the text column
+        :param path: Where the IPC file is kept, by default next to the artifact
+        """
+        parquet_path = Path(parquet_path)
+        path = Path(path or cls.default_path(parquet_path, body_column))
+        if path.exists() and path.stat().st_mtime >= parquet_path.stat().st_mtime:
+            return cls.open(path, id_column, body_column)
+        return cls(read_artifact_table(parquet_path, columns=[id_column, body_column]), id_column, body_column)
+
+    def get(self, id: str) -> str | None:
+        row = self.rows.get(str(id))
+        if row is None:
+            return None
+        return self._bodies[row].as_py()
+
+    def __contains__(self, id) -> bool:
+        return str(id) in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class LazyTextUnit(TextUnit):
+    """A TextUnit whose text is read from a TextStore when accessed."""
+
+    store: TextStore | None = None
+
+    @property
+    def text(self) -> str:
+        return (self.store.get(self.id) if self.store is not None else None) or ""
+
+    @text.setter
+    def text(self, value: str):
+        # set by the dataclass __init__; the body lives in the store
+        pass
+
+
+class LazyCommunityReport(CommunityReport):
+    """A CommunityReport whose full_content is read from a TextStore when accessed."""
+
+    store: TextStore | None = None
+
+    @property
+    def full_content(self) -> str:
+        return (self.store.get(self.id) if self.store is not None else None) or ""
+
+    @full_content.setter
+    def full_content(self, value: str):
+        pass
+
+
+def build_text_stores(artifacts_dir, bodies: dict[str, tuple[str, str]]):
+    """
+    Write the IPC files of an index run's text bodies, so queriers can map them.
+
+    :param artifacts_dir: Directory holding the pipeline's parquet artifacts
+    :param bodies: Artifact table -> (id column, body column)
+    """
+    for table, (id_column, body_column) in bodies.items():
+        parquet_path = Path(artifacts_dir) / f"{table}.parquet"
+        if parquet_path.exists():
+            TextStore.write(parquet_path, id_column, body_column)
+
+
+def remove_text_stores(artifacts_dir, bodies: dict[str, tuple[str, str]]):
+    """
+    Delete the IPC files of an index run's text bodies, once the arena carries them.
+
+    :param artifacts_dir: Directory holding the pipeline's parquet artifacts
+    :param bodies: Artifact table -> (id column, body column)
+    """
+    for table, (_, body_column) in bodies.items():
+        TextStore.default_path(Path(artifacts_dir) / f"{table}.parquet", body_column).unlink(missing_ok=True)
+
+
+def with_lazy_bodies(objects: list, lazy_class, store: TextStore) -> list:
+    """
+    Rebuild adapter output (read with empty bodies) as lazy objects backed by `store`.
+    """
+    lazy_objects = []
+    for obj in objects:
+        lazy = lazy_class(**vars(obj))
+        lazy.store = store
+        lazy_objects.append(lazy)
+    return lazy_objects
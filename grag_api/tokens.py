@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pandas as pd
+import tiktoken
+
+from grag_api.artifact_store import read_artifact
+
+TOKEN_COUNT_COLUMN = "n_tokens"
+
+# artifact table -> column whose token count is stored alongside each row
+TOKEN_COUNT_SOURCES = {
+    "create_final_text_units": "text",
+    "create_final_community_reports": "full_content",
+    "create_final_entities": "description",
+    "create_final_relationships": "description",
+}
+
+
+def count_tokens(texts, token_encoder: tiktoken.Encoding) -> list[int]:
+    """
+    Count tokens for many texts in a single batched encode.
+
+    :param texts: An iterable of strings (None is counted as empty)
+    :param token_encoder: The tiktoken encoding used by the query engine
+    :return: A list with the token count of each text
+    """
+    texts = ["" if text is None else str(text) for text in texts]
+    return [len(tokens) for tokens in token_encoder.encode_ordinary_batch(texts)]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for short metadata fields (ids, titles, ranks).
+
+    Avoids running the encoder for fields that are only a few tokens long.
+    """
+    return (len(text) + 3) // 4
+
+
+def ensure_token_counts(df: pd.DataFrame, text_column: str, token_encoder: tiktoken.Encoding) -> pd.DataFrame:
+    """
+    Make sure the dataframe carries a token count column for the given text column.
+
+    Artifacts written by the indexer already have it; older artifacts are counted once here.
+    """
+    if TOKEN_COUNT_COLUMN in df.columns and not df[TOKEN_COUNT_COLUMN].isna().any():
+        return df
+    df = df.copy()
+    df[TOKEN_COUNT_COLUMN] = count_tokens(df[text_column], token_encoder)
+    return df
+
+
+def token_count_map(df: pd.DataFrame, id_column: str) -> dict[str, int]:
+    """
+    Build an id -> token count lookup from a dataframe produced by ensure_token_counts.
+    """
+    return dict(zip(df[id_column].astype(str), df[TOKEN_COUNT_COLUMN].astype(int)))
+
+
+def add_token_counts(artifacts_dir, encoding_model: str = "cl100k_base"):
+    """
+    Store token counts with every retrievable artifact row.
+
+    Run once after indexing so the query path never has to re-encode unit bodies.
+
+    :param artifacts_dir: Directory holding the pipeline's parquet artifacts
+    :param encoding_model: The tiktoken encoding name used at query time
+    """
+    token_encoder = tiktoken.get_encoding(encoding_model)
+    artifacts_dir = Path(artifacts_dir)
+    for table, text_column in TOKEN_COUNT_SOURCES.items():
+        table_path = artifacts_dir / f"{table}.parquet"
+        if not table_path.exists():
+            continue
+        df = read_artifact(table_path)
+        counted_df = ensure_token_counts(df, text_column, token_encoder)
+        if counted_df is not df:
+            counted_df.to_parquet(table_path)
@@ -0,0 +1,182 @@
+"""
+Query-time tombstones for documents deleted since the last index.
+
+Deleting a file removes its rows from the dataset, but the indexed graph keeps
+its text units, entities and relationships until the next index run. The ids of
+deleted documents are recorded in <workspace>/tombstones.json; queriers check
+the file's mtime once per query and, when it changes, work out which loaded
+text units, entities and relationships are supported only by deleted documents
+so the context builder can leave them out. The next index run, which no longer
+sees those documents, purges their tombstones, and writing a document to the
+dataset again removes its tombstone.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+TOMBSTONE_FILE = "tombstones.json"
+
+
+class Tombstones:
+    """The deleted document ids of a workspace, with the title each was deleted under."""
+
+    def __init__(self, workspace):
+        self.path = Path(workspace) / TOMBSTONE_FILE
+        self.documents: dict[str, str] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def document_ids(self) -> set[str]:
+        return set(self.documents)
+
+    def refresh(self) -> bool:
+        """
+        Re-read the file if it changed since the last call.
+
+        :return: True if the set of tombstones changed
+        """
+        if self._stat() == self._mtime:
+            return False
+        with self._lock:
+            previous = self.documents
+            self._read()
+            return self.documents != previous
+
+    def _stat(self) -> int | None:
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        self._mtime = self._stat()
+        self.documents = json.loads(self.path.read_text()) if self._mtime is not None else {}
+
+    def _write(self, documents: dict[str, str]):
+        # a shard's workspace only exists once it has been indexed
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(documents, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+    def add(self, document_ids, title: str | None = None):
+        """
+        Tombstone documents so queries stop using them immediately.
+
+        :param document_ids: Ids of the deleted dataset rows
+        :param title: The file they came from, kept for reference
+        """
+        with self._lock:
+            self._read()
+            documents = dict(self.documents)
+            documents.update({str(id): title or "" for id in document_ids})
+            self._write(documents)
+
+    def remove(self, document_ids=(), titles=()):
+        """
+        Drop the tombstones of documents written to the dataset again, by id or by file title,
+        since a re-uploaded file gets the ids its deleted rows had.
+
+        :param document_ids: Ids of the upserted dataset rows
+        :param titles: The files they came from
+        """
+        document_ids = {str(id) for id in document_ids}
+        titles = {title for title in titles if title}
+        with self._lock:
+            self._read()
+            documents = {
+                id: title for id, title in self.documents.items() if id not in document_ids and title not in titles
+            }
+            if documents != self.documents:
+                self._write(documents)
+
+    def purge(self, indexed_ids):
+        """
+        Drop the tombstones of documents that an index run no longer saw, since the index has
+        physically removed them. Documents deleted while that run was in progress are kept.
+
+        :param indexed_ids: Ids of the dataset rows the index was built from
+        """
+        indexed_ids = {str(id) for id in indexed_ids}
+        with self._lock:
+            self._read()
+            documents = {id: title for id, title in self.documents.items() if id in indexed_ids}
+            if documents != self.documents:
+                self._write(documents)
+
+
+@dataclass
+class DeletedContent:
+    """Loaded rows that only deleted documents support, and the share of support the rest keep."""
+
+    text_unit_ids: set[str] = field(default_factory=set)
+    entity_ids: set[str] = field(default_factory=set)
+    relationship_ids: set[str] = field(default_factory=set)
+    # entity / relationship id -> fraction of its text units that are still live, for those below 1
+    support: dict[str, float] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.text_unit_ids)
+
+
+def _split_support(objects, dead_units: set[str], deleted: set[str], support: dict[str, float]):
+    for obj in objects:
+        unit_ids = obj.text_unit_ids or []
+        dead = sum(1 for unit_id in unit_ids if unit_id in dead_units)
+        if not dead:
+            continue
+        if dead == len(unit_ids):
+            deleted.add(obj.id)
+        else:
+            support[obj.id] = 1 - dead / len(unit_ids)
+
+
+def indexed_document_ids(tombstones: dict[str, str], documents: pd.DataFrame) -> set[str]:
+    """
+    Map tombstoned dataset rows to the ids the index gave their documents.
+
+    A document matches by id, by title, or, for indexes built from text files named
+    after the dataset rows, by the file name's stem.
+
+    :param tombstones: Deleted dataset row id -> title
+    :param documents: The index's create_final_documents id and title columns
+    """
+    if not tombstones or documents.empty:
+        return set(tombstones)
+    row_ids = set(tombstones)
+    titles = {title for title in tombstones.values() if title}
+    deleted = (
+        documents["id"].isin(row_ids)
+        | documents["title"].isin(titles)
+        | documents["title"].map(lambda title: Path(str(title)).stem).isin(row_ids)
+    )
+    return set(documents.loc[deleted, "id"]) | row_ids
+
+
+def deleted_content(document_ids: set[str], text_units, entities, relationships) -> DeletedContent:
+    """
+    Find the loaded text units from deleted documents, and the entities and relationships
+    that are supported by them alone.
+
+    :param document_ids: Tombstoned document ids, as the index knows them
+    :param text_units: The querier's text units, by id
+    :param entities: The querier's entities, by id
+    :param relationships: The querier's relationships, by id
+    """
+    content = DeletedContent()
+    if not document_ids:
+        return content
+    content.text_unit_ids = {
+        unit.id for unit in text_units.values()
+        if unit.document_ids and all(document_id in document_ids for document_id in unit.document_ids)
+    }
+    if not content.text_unit_ids:
+        return content
+    _split_support(entities.values(), content.text_unit_ids, content.entity_ids, content.support)
+    _split_support(relationships.values(), content.text_unit_ids, content.relationship_ids, content.support)
+    return content
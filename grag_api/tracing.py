@@ -0,0 +1,178 @@
+"""
+Span timing for the query path.
+
+A Trace collects nested spans (query embedding, vector search, ranking, prompt
+assembly, LLM first token, ...) for one query. The active trace and span travel
+in context variables, so spans opened inside `asyncio.to_thread` calls and
+nested helpers attach to the right parent without threading a tracer through
+every signature; `span()` is a no-op when no trace is active. Traces export as
+OTLP/JSON, which OpenTelemetry collectors and Jaeger/Tempo import directly.
+"""
+import contextvars
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+import pandas as pd
+
+SERVICE_NAME = "grag_api"
+
+_current_trace = contextvars.ContextVar("grag_api_trace", default=None)
+_current_span = contextvars.ContextVar("grag_api_span", default=None)
+
+
+@dataclass
+class Span:
+    """One timed stage of a query."""
+
+    name: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float | None:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Trace:
+    """The spans recorded for one query, rooted at a span named after the operation."""
+
+    def __init__(self, name: str = "query", **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self.root = self.start_span(name, None, attributes)
+
+    def start_span(self, name: str, parent_id: str | None, attributes: dict | None = None,
+                   start_ns: int | None = None) -> Span:
+        span = Span(
+            name=name,
+            span_id=secrets.token_hex(8),
+            parent_id=parent_id,
+            start_ns=start_ns or time.time_ns(),
+            attributes=dict(attributes or {}),
+        )
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, parent: Span | None = None, **attributes) -> Span:
+        """Record a span whose start and end were measured elsewhere, e.g. by a callback."""
+        span = self.start_span(name, (parent or self.root).span_id, attributes, start_ns=start_ns)
+        span.end_ns = end_ns
+        return span
+
+    def end(self):
+        if self.root.end_ns is None:
+            self.root.end_ns = time.time_ns()
+
+    @contextmanager
+    def activate(self):
+        """Make this the trace that `span()` records into for the current context."""
+        trace_token = _current_trace.set(self)
+        span_token = _current_span.set(self.root)
+        try:
+            yield self
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+
+    def summary(self) -> pd.DataFrame:
+        """One row per span, in start order, with offsets relative to the start of the trace."""
+        depth = {self.root.span_id: 0}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            level = depth.get(span.parent_id, -1) + 1 if span.parent_id else 0
+            depth[span.span_id] = level
+            rows.append({
+                "stage": "  " * level + span.name,
+                "start_ms": round((span.start_ns - self.root.start_ns) / 1e6, 1),
+                "duration_ms": round(span.duration_ms, 1) if span.duration_ms is not None else None,
+            })
+        return pd.DataFrame(rows, columns=["stage", "start_ms", "duration_ms"])
+
+    def to_otlp(self) -> dict:
+        """The trace in the OTLP/JSON export format."""
+        spans = []
+        for span in self.spans:
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2} if "error" in span.attributes else {},
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }]
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_otlp())
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block as a child of the current span. Yields the Span, or None when no trace is active.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = trace.start_span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attributes["error"] = repr(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+@contextmanager
+def ensure_trace(name: str, **attributes):
+    """Yield the active trace, or start, activate and finally end a new one named `name`."""
+    trace = _current_trace.get()
+    if trace is not None:
+        with span(name, **attributes):
+            yield trace
+        return
+    trace = Trace(name, **attributes)
+    try:
+        with trace.activate():
+            yield trace
+    finally:
+        trace.end()
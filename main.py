@@ -2,6 +2,7 @@ from streamlit_option_menu import option_menu
 
 from callback import StreamlitLLMCallback
 from grag_api import GraphRAG
+from grag_api.metrics import start_metrics_server
 import asyncio
 import streamlit as st
 import os
@@ -152,7 +153,14 @@ def save_system_prompt():
         f.write(st.session_state.system_prompt)
 
 
-grag = GraphRAG()
+@st.cache_resource
+def get_graphrag():
+    # one instance per server process, so reruns keep the loaded index
+    return GraphRAG()
+
+
+grag = get_graphrag()
+start_metrics_server(int(os.environ.get("METRICS_PORT", 9464)))
 def load_chat_page():
     st.title("GraphRAG PDF Assistant Chatbot")
     if "messages" not in st.session_state or st.sidebar.button("Clear message history"):
@@ -184,6 +192,15 @@ def load_chat_page():
             if 'sources' in result.context_data.keys():
                 with st.expander("View Source Data"):
                     st.write(result.context_data['sources'])
+                    if result.trace is not None:
+                        st.caption(f"Query trace ({result.trace.root.duration_ms:.0f} ms)")
+                        st.dataframe(result.trace.summary(), hide_index=True)
+                        st.download_button(
+                            "Download trace (OTLP JSON)",
+                            result.trace.to_json(),
+                            file_name=f"trace-{result.trace.trace_id}.json",
+                            mime="application/json",
+                        )
 
 
 def load_file_management_page():
@@ -192,21 +209,18 @@ def load_file_management_page():
     # Multi-file uploader
     uploaded_files = st.file_uploader("Choose PDF files to upload", type=["pdf"], accept_multiple_files=True)
 
-    upload_dir = Path("uploads")
-    if not upload_dir.exists():
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-    cnt = 0
     if uploaded_files:
-        with st.spinner("Upload files..."):
-            for uploaded_file in uploaded_files:
-                # Save the uploaded file
-                file_path = os.path.join("uploads", uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                grag.upsert_pdf(file_path)
-                cnt += 1
-        st.success(f"Successfully uploaded {cnt} new file(s).")
+        # files are processed in the background; the uploader keeps its files across reruns,
+        # so ones already queued, ingested or failed are skipped until a retry is asked for
+        queued = [f.name for f in uploaded_files if grag.enqueue_pdf(f.name, f.getvalue()) is not None]
+        if queued:
+            st.success(f"Queued {len(queued)} new file(s) for processing.")
+        failed_files = grag.ingestion_queue.failed_files()
+        failed = [f for f in uploaded_files if f.name in failed_files]
+        if failed and st.button(f"Retry {len(failed)} failed file(s)"):
+            retried = [f.name for f in failed if grag.enqueue_pdf(f.name, f.getvalue(), retry=True) is not None]
+            st.success(f"Queued {len(retried)} file(s) again.")
+    load_ingestion_status()
     st.divider()
 
     st.subheader("Uploaded Files")
@@ -224,6 +238,24 @@ def load_file_management_page():
                     st.success(f"Deleted {file}")
 
 
+@st.fragment(run_every=5)
+def load_ingestion_status():
+    jobs = grag.ingestion_queue.jobs()
+    if not jobs:
+        return
+    st.subheader("Processing")
+    active = sum(job["status"] in ("queued", "processing", "committing") for job in jobs)
+    if active:
+        st.caption(f"{active} file(s) in progress")
+    st.dataframe(
+        [
+            {"file": job["filename"], "status": job["status"], "pages": job["pages"], "error": job["error"]}
+            for job in jobs
+        ],
+        hide_index=True,
+    )
+
+
 def train_page():
     st.title("Training Data")
     last_training_time = grag.get_last_training_time()
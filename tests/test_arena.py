@@ -0,0 +1,21 @@
+import pandas as pd
+
+from grag_api.arena import EMBEDDING_COLUMN, open_arena, publish_arena
+
+
+def test_only_the_listed_columns_are_published(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    pd.DataFrame({
+        "id": ["e1", "e2"],
+        "name": ["ODFL", "SAIA"],
+        "graph_embedding": [[0.1] * 8, [0.2] * 8],
+        EMBEDDING_COLUMN: [[1.0, 0.0], [0.0, 1.0]],
+    }).to_parquet(artifacts / "entities.parquet")
+
+    publish_arena(artifacts, tmp_path / "arena", "1", {"entities": ["id", "name", EMBEDDING_COLUMN, "token_count"]})
+
+    arena = open_arena(tmp_path / "arena")
+    assert arena.tables["entities"].column_names == ["id", "name", EMBEDDING_COLUMN]
+    ids, matrix = arena.embedding_matrix("entities")
+    assert ids == ["e1", "e2"] and matrix.shape == (2, 2)
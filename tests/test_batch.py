@@ -0,0 +1,28 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from grag_api.batch import abatch_query, load_completed_ids
+
+
+class FlakyGraphRAG:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    async def aquery(self, question, callbacks, system_prompt=None):
+        # CustomSearch.asearch returns an empty response when the LLM call fails
+        response = "" if question in self.failing else f"answer to {question}"
+        return SimpleNamespace(response=response, latency=0.1, prompt_tokens=1, completion_time=0.1, llm_calls=1)
+
+
+def test_empty_answers_are_asked_again_on_resume(tmp_path):
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text("\n".join(json.dumps({"id": id, "question": id}) for id in ["q1", "q2", "q3"]))
+    output_dir = tmp_path / "results"
+
+    asyncio.run(abatch_query(FlakyGraphRAG(failing=["q2"]), questions, output_dir, concurrency=2))
+    assert load_completed_ids(output_dir) == {"q1", "q3"}
+
+    results = asyncio.run(abatch_query(FlakyGraphRAG(), questions, output_dir))
+    assert sorted(results["id"]) == ["q1", "q2", "q3"]
+    assert results.set_index("id").loc["q2", "response"] == "answer to q2"
@@ -0,0 +1,90 @@
+import asyncio
+
+from graphrag.query.llm.base import BaseLLMCallback
+
+from grag_api.coalesce import SingleFlight
+
+
+def test_followers_survive_a_cancelled_leader():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+        started = asyncio.Event()
+
+        async def search(fan_out):
+            calls.append(fan_out)
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.create_task(flights.run("q", search))
+        await started.wait()
+        followers = [asyncio.create_task(flights.run("q", search)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        assert results == ["answer"] * 3
+        # one follower took over the search, the others joined it
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_follower_leaves_the_flight_alone():
+    async def main():
+        flights = SingleFlight()
+
+        async def search(fan_out):
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.create_task(flights.run("q", search))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("q", search))
+        other = asyncio.create_task(flights.run("q", search))
+        await asyncio.sleep(0)
+        follower.cancel()
+        assert await leader == "answer"
+        assert await other == "answer"
+
+    asyncio.run(main())
+
+
+class Tokens(BaseLLMCallback):
+    def on_llm_new_token(self, token: str):
+        super().on_llm_new_token(token)
+
+
+def test_followers_of_a_cancelled_leader_are_not_replayed_the_new_search():
+    async def main():
+        flights = SingleFlight()
+        streamed = asyncio.Event()
+        resume = asyncio.Event()
+
+        async def cancelled_search(fan_out):
+            fan_out.on_llm_new_token("a")
+            streamed.set()
+            await asyncio.sleep(1)
+
+        async def search(fan_out):
+            fan_out.on_llm_new_token("x")
+            await resume.wait()
+            fan_out.on_llm_new_token("y")
+            return "answer"
+
+        leader = asyncio.create_task(flights.run("q", cancelled_search))
+        await streamed.wait()
+        tokens = [Tokens(), Tokens()]
+        followers = [asyncio.create_task(flights.run("q", search, [callback])) for callback in tokens]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        resume.set()
+
+        assert await asyncio.gather(*followers) == ["answer"] * 2
+        # the first follower leads the new search; the second joins it after "x" was streamed
+        assert tokens[0].response == ["a", "x", "y"]
+        assert tokens[1].response == ["a", "y"]
+
+    asyncio.run(main())
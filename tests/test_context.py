@@ -0,0 +1,37 @@
+from grag_api.context import ContextCandidate, context_budget, pack_sections
+
+
+def _candidates(section, sizes, score=1.0):
+    return [
+        ContextCandidate(section=section, id=f"{section}-{i}", record=[str(i), "x"], tokens=size, score=score)
+        for i, size in enumerate(sizes)
+    ]
+
+
+def _kept_tokens(data, sections):
+    kept = {name.lower(): set(data[name.lower()].iloc[:, 0]) if not data[name.lower()].empty else set()
+            for name in sections}
+    return sum(c.tokens for name, (_, cs) in sections.items() for c in cs if c.record[0] in kept[name.lower()])
+
+
+def test_pinned_source_counts_against_the_budget():
+    query = "What is item 175.5?"
+    budget = context_budget(query, 2000, 8000)
+    sections = {
+        "Reports": (["id", "text"], []),
+        "Entities": (["id", "text"], _candidates("Entities", [100] * 30)),
+        "Sources": (["id", "text"], _candidates("Sources", [1500, 7000])),
+    }
+    _, data = pack_sections(query, sections, 2000, 8000)
+    assert not data["sources"].empty
+    assert _kept_tokens(data, sections) <= budget
+
+
+def test_source_over_the_budget_is_not_pinned():
+    query = "What is item 175.5?"
+    sections = {
+        "Reports": (["id", "text"], []),
+        "Sources": (["id", "text"], _candidates("Sources", [7000])),
+    }
+    _, data = pack_sections(query, sections, 2000, 8000)
+    assert data["sources"].empty
@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+import time
+
+from grag_api.extraction_queue import DONE, LEASED, QUEUED, ExtractionQueue, ExtractionWorker
+
+ROWS = [("u1", "item 233"), ("u2", "ODFL class 85"), ("u3", "SAIA fuel surcharge")]
+STRATEGY = {"type": "graph_intelligence", "llm": {"api_key": "secret"}}
+
+
+def expire(queue, worker):
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE tasks SET lease_expires = ? WHERE worker = ?", (time.time() - 1, worker))
+
+
+def test_claims_only_queued_tasks_and_expired_leases(tmp_path):
+    queue = ExtractionQueue(tmp_path)
+    assert queue.submit("run", ROWS, STRATEGY, ["org"], task_size=2) == 2
+
+    first = queue.claim("host-a:1")
+    second = queue.claim("host-b:1")
+    assert [first["rows"], second["rows"]] == [[list(row) for row in ROWS[:2]], [list(ROWS[2])]]
+    assert "api_key" not in first["strategy"]["llm"]
+    assert queue.claim("host-c:1") is None
+
+    expire(queue, "host-a:1")
+    taken_over = queue.claim("host-c:1")
+    assert (taken_over["id"], taken_over["attempts"]) == (first["id"], 2)
+
+
+def test_workers_that_lost_their_lease_cannot_complete_or_requeue(tmp_path):
+    queue = ExtractionQueue(tmp_path)
+    queue.submit("run", ROWS, STRATEGY, ["org"], task_size=3)
+    task = queue.claim("host-a:1")
+    expire(queue, "host-a:1")
+    assert queue.claim("host-b:1")["id"] == task["id"]
+
+    assert not queue.complete(task["id"], "host-a:1", [["stale", ""]] * 3)
+    assert not queue.fail(task["id"], "host-a:1", 1, "boom")
+    assert queue.progress("run") == {LEASED: 1}
+    assert queue.complete(task["id"], "host-b:1", [[[], "<graphml/>"]] * 3)
+    assert queue.results("run")["u1"] == [[], "<graphml/>"]
+
+
+def test_renewed_leases_are_not_taken_over(tmp_path):
+    queue = ExtractionQueue(tmp_path, lease_seconds=60)
+    queue.submit("run", ROWS, STRATEGY, ["org"], task_size=3)
+    queue.claim("host-a:1")
+    expire(queue, "host-a:1")
+
+    assert queue.renew("host-a:1") == 1
+    assert queue.renew("host-b:1") == 0
+    assert queue.claim("host-b:1") is None
+
+
+def test_worker_renews_its_lease_while_it_extracts(tmp_path):
+    queue = ExtractionQueue(tmp_path, lease_seconds=0.3)
+    queue.submit("run", ROWS, STRATEGY, ["org"], task_size=3)
+
+    class SlowWorker(ExtractionWorker):
+        async def extract(self, task):
+            await asyncio.sleep(0.6)
+            # the lease would have expired twice over without renewal
+            assert queue.claim("host-b:1") is None
+            return [[[], ""]] * len(task["rows"])
+
+    worker = SlowWorker(tmp_path, config={"llm": {"api_key": "key"}}, queue=queue, cache=object())
+    assert asyncio.run(worker.run("run", exit_when_idle=True)) == 1
+    assert queue.progress("run") == {DONE: 1}
+
+
+def test_resubmitted_run_keeps_done_tasks_and_merged_runs_prune_others(tmp_path):
+    queue = ExtractionQueue(tmp_path)
+    queue.submit("old", ROWS[:1], STRATEGY, ["org"])
+    queue.submit("run", ROWS, STRATEGY, ["org"], task_size=2)
+    task = queue.claim("host-a:1", run_id="run")
+    queue.complete(task["id"], "host-a:1", [[[], ""]] * 2)
+
+    assert queue.submit("run", ROWS, STRATEGY, ["org"], task_size=2) == 2
+    assert queue.progress("run") == {DONE: 1, QUEUED: 1}
+
+    assert queue.prune("run") == 1
+    assert queue.progress("old") == {}
+    assert queue.progress("run") == {DONE: 1, QUEUED: 1}
@@ -0,0 +1,201 @@
+import asyncio
+
+import networkx as nx
+import pandas as pd
+import pytest
+from datashaper import NoopVerbCallbacks, NoopWorkflowCallbacks, TableContainer, VerbInput, Workflow
+
+from graphrag.index.cache import NoopPipelineCache
+from graphrag.index.context import PipelineRunContext, PipelineRunStats
+from graphrag.index.storage import MemoryPipelineStorage
+from graphrag.index.verbs.graph.clustering.cluster_graph import cluster_graph as graphrag_cluster_graph
+from graphrag.index.verbs.graph.merge.merge_graphs import merge_graphs as graphrag_merge_graphs
+from graphrag.index.workflows.v1 import create_final_communities, create_final_nodes
+from grag_api.graph_tables import GRAPH_VERBS, cluster_graph, merge_graphs, read_graphml, use_columnar_workflows
+
+CLUSTER_STRATEGY = {"type": "leiden", "max_cluster_size": 10}
+NODES_CONFIG = {"layout_graph_enabled": False, "snapshot_top_level_nodes": False, "level_for_node_positions": 0}
+
+
+class WorkflowReference:
+    def __init__(self, name: str, config: dict, steps: list):
+        self.name, self.config, self.steps = name, config, steps
+
+
+def graphml(nodes=(), edges=()) -> str:
+    """A partial graph from (label, attributes) nodes and (source, target, attributes) edges."""
+    graph = nx.Graph()
+    for label, attributes in nodes:
+        graph.add_node(label, **attributes)
+    for source, target, attributes in edges:
+        graph.add_edge(source, target, **attributes)
+    return "\n".join(nx.generate_graphml(graph))
+
+
+def undeclared_endpoints() -> str:
+    """An edge whose ends have no node elements, which networkx adds as nodes."""
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">'
+        '<key id="d0" for="edge" attr.name="weight" attr.type="double" />'
+        '<key id="d1" for="node" attr.name="source_id" attr.type="string" />'
+        '<graph edgedefault="undirected">'
+        '<node id="ACME"><data key="d1">u1</data></node>'
+        '<edge source="ZENITH" target="ACME"><data key="d0">2.0</data></edge>'
+        '<edge source="ZENITH" target="ORBIT" />'
+        "</graph></graphml>"
+    )
+
+
+def entity(unit: str, description: str | None = None, **attributes) -> dict:
+    attributes = {"type": "ORGANIZATION", "source_id": unit, **attributes}
+    if description is not None:
+        attributes["description"] = description
+    return attributes
+
+
+def relationship(unit: str, weight: float | None = 1.0, description: str | None = None) -> dict:
+    attributes = {"source_id": unit}
+    if weight is not None:
+        attributes["weight"] = weight
+    if description is not None:
+        attributes["description"] = description
+    return attributes
+
+
+# partial graphs per text unit, the way entity extraction emits them
+GRAPHS = {
+    "repeated": [
+        graphml(
+            [("ACME", entity("u1", "ACME is a carrier")), ("ZENITH", entity("u1", "ZENITH ships freight"))],
+            [("ACME", "ZENITH", relationship("u1", description="ACME hauls for ZENITH"))],
+        ),
+        graphml(
+            [("ZENITH", entity("u2", "ZENITH is a shipper")), ("ORBIT", entity("u2", "ORBIT brokers loads"))],
+            [("ZENITH", "ACME", relationship("u2", 2.0, "ZENITH pays ACME")), ("ORBIT", "ZENITH", relationship("u2"))],
+        ),
+    ],
+    "self_loops": [
+        graphml([("ACME", entity("u1", "ACME"))], [("ACME", "ACME", relationship("u1", description="merged"))]),
+        graphml(
+            [("ACME", entity("u2", "ACME again")), ("ZENITH", entity("u2", "ZENITH"))],
+            [("ACME", "ACME", relationship("u2", 3.0)), ("ZENITH", "ACME", relationship("u2"))],
+        ),
+    ],
+    "undeclared_endpoints": [
+        undeclared_endpoints(),
+        graphml([("ORBIT", entity("u2", "ORBIT"))], [("ORBIT", "ACME", relationship("u2"))]),
+    ],
+    "missing_attributes": [
+        graphml(
+            [("ACME", entity("u1", rank=2)), ("ZENITH", entity("u1", "ZENITH ships freight"))],
+            [("ACME", "ZENITH", relationship("u1", None))],
+        ),
+        graphml(
+            [("ACME", entity("u2", "ACME is a carrier")), ("ZENITH", {"type": "ORGANIZATION", "rank": 3})],
+            [("ZENITH", "ACME", relationship("u2", None, "ZENITH pays ACME"))],
+        ),
+        graphml(
+            [("ACME", {"source_id": "u3", "rank": 5}), ("ZENITH", entity("u3", "", rank=0))],
+            [("ACME", "ZENITH", relationship("u3", 0.5))],
+        ),
+    ],
+    "empty": [graphml(), graphml()],
+    "no_edges": [graphml([("ACME", entity("u1", "ACME"))]), graphml([("ACME", entity("u2"))])],
+}
+
+NODE_OPERATIONS = {
+    "default": None,
+    "replace": {"description": "replace", "*": "skip"},
+    "skip": {"description": "skip", "source_id": "replace", "*": "replace"},
+    "concat": {"description": {"operation": "concat", "separator": "|", "distinct": True}, "*": "concat"},
+    "average": {"rank": "average"},
+    "extremes": {"rank": "max", "*": "replace"},
+    "products": {"rank": "multiply", "source_id": "concat"},
+}
+EDGE_OPERATIONS = {
+    "default": None,
+    "replace": {"weight": "replace", "*": "skip"},
+    "skip": {"weight": "skip", "description": "replace"},
+    "concat": {"description": {"operation": "concat", "separator": "|"}, "*": "concat", "weight": "multiply"},
+    "average": {"weight": "average"},
+    "extremes": {"weight": "min", "*": "replace"},
+    "products": {"weight": "multiply", "description": "skip"},
+}
+
+
+def verb_input(table: pd.DataFrame) -> VerbInput:
+    return VerbInput(source=TableContainer(table=table))
+
+
+def assert_same_table(left: pd.DataFrame, right: pd.DataFrame):
+    pd.testing.assert_frame_equal(
+        left.reset_index(drop=True), right.reset_index(drop=True), check_dtype=False, check_like=True
+    )
+
+
+def assert_same_graph(left: str, right: str):
+    for left_table, right_table in zip(read_graphml(left), read_graphml(right)):
+        assert_same_table(left_table, right_table)
+
+
+def merge_args(operations: str) -> dict:
+    args = {"column": "entities_graph", "to": "entity_graph"}
+    if NODE_OPERATIONS[operations] is not None:
+        args.update(nodes=NODE_OPERATIONS[operations], edges=EDGE_OPERATIONS[operations])
+    return args
+
+
+def run_workflow(name: str, steps: list, table: pd.DataFrame, verbs: dict | None = None) -> pd.DataFrame:
+    workflow = Workflow(verbs=verbs or {}, schema={"name": name, "steps": steps}, validate=False)
+    workflow.add_table("workflow:create_base_entity_graph", table)
+    context = PipelineRunContext(stats=PipelineRunStats(), cache=NoopPipelineCache(), storage=MemoryPipelineStorage())
+    asyncio.run(workflow.run(context, NoopWorkflowCallbacks()))
+    return workflow.output()
+
+
+def final_workflows() -> dict[str, tuple[list, list]]:
+    references = [
+        WorkflowReference("create_final_nodes", NODES_CONFIG, create_final_nodes.build_steps(NODES_CONFIG)),
+        WorkflowReference("create_final_communities", {}, create_final_communities.build_steps({})),
+    ]
+    graphrag_steps = {reference.name: reference.steps for reference in references}
+    use_columnar_workflows(references)
+    return {reference.name: (graphrag_steps[reference.name], reference.steps) for reference in references}
+
+
+@pytest.mark.parametrize("operations", list(NODE_OPERATIONS))
+@pytest.mark.parametrize("graphs", list(GRAPHS))
+def test_merge_graphs_matches_graphrag(graphs, operations):
+    partial_graphs = pd.DataFrame({"entities_graph": GRAPHS[graphs]})
+    args = merge_args(operations)
+
+    expected = graphrag_merge_graphs(verb_input(partial_graphs), NoopVerbCallbacks(), **args).table
+    merged = merge_graphs(verb_input(partial_graphs), NoopVerbCallbacks(), **args).table
+
+    assert_same_graph(expected["entity_graph"][0], merged["entity_graph"][0])
+
+
+def assert_same_final_tables(base_entity_graph: pd.DataFrame):
+    for name, (graphrag_steps, columnar_steps) in final_workflows().items():
+        assert_same_table(
+            run_workflow(name, graphrag_steps, base_entity_graph),
+            run_workflow(name, columnar_steps, base_entity_graph, GRAPH_VERBS),
+        )
+
+
+# graphrag's Leiden clustering rejects a graph without edges, so those are only merged
+@pytest.mark.parametrize("graphs", [name for name in GRAPHS if name not in ("empty", "no_edges")])
+def test_final_tables_match_graphrag(graphs):
+    partial_graphs = pd.DataFrame({"entities_graph": GRAPHS[graphs]})
+    merged = merge_graphs(verb_input(partial_graphs), NoopVerbCallbacks(), **merge_args("default")).table
+    cluster_args = {"strategy": CLUSTER_STRATEGY, "column": "entity_graph", "to": "clustered_graph", "level_to": "level"}
+
+    expected = graphrag_cluster_graph(verb_input(merged), NoopVerbCallbacks(), **cluster_args).table
+    clustered = cluster_graph(verb_input(merged), NoopVerbCallbacks(), **cluster_args).table
+
+    assert list(expected["level"]) == list(clustered["level"])
+    for left, right in zip(expected["clustered_graph"], clustered["clustered_graph"]):
+        assert_same_graph(left, right)
+    assert_same_final_tables(clustered[["level", "clustered_graph"]])
+
@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+from grag_api.ingest import FAILED, PROCESSING, QUEUED, IngestionQueue
+
+
+class FakeDB:
+    def __init__(self):
+        self.rows = []
+
+    def get_all_titles(self):
+        return {row["title"] for row in self.rows}
+
+    def batch_upsert_data(self, rows):
+        self.rows.extend(rows)
+
+
+def make_queue(tmp_path, worker_id):
+    queue = IngestionQueue(tmp_path, FakeDB(), pdf_processor=None, upload_dir=tmp_path / "uploads")
+    queue.worker_id = worker_id
+    return queue
+
+
+def test_claims_only_queued_jobs_and_expired_leases(tmp_path):
+    first = make_queue(tmp_path, "host-a:1")
+    second = make_queue(tmp_path, "host-b:1")
+    first.submit("a.pdf", b"a")
+    first.submit("b.pdf", b"b")
+
+    assert first._claim_next()["filename"] == "a.pdf"
+    assert second._claim_next()["filename"] == "b.pdf"
+    # both leases are live, so a restarted process finds nothing to take over
+    assert make_queue(tmp_path, "host-c:1")._claim_next() is None
+
+    with sqlite3.connect(first.path) as conn:
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE filename = 'a.pdf'", (time.time() - 1,))
+    assert second._claim_next()["filename"] == "a.pdf"
+    with sqlite3.connect(first.path) as conn:
+        assert conn.execute("SELECT status, worker FROM jobs WHERE filename = 'a.pdf'").fetchone() == \
+            (PROCESSING, "host-b:1")
+
+
+def test_failed_files_wait_for_a_retry(tmp_path):
+    queue = make_queue(tmp_path, "host-a:1")
+    job_id = queue.submit("a.pdf", b"a")
+    assert queue.submit("a.pdf", b"a") is None
+    queue._set_status([job_id], FAILED, error="boom")
+
+    assert queue.failed_files() == {"a.pdf"}
+    assert queue.submit("a.pdf", b"a") is None
+    assert queue.submit("a.pdf", b"a", retry=True) is not None
+    assert queue.failed_files() == set()
+    assert queue.jobs()[0]["status"] == QUEUED
+    assert (tmp_path / "uploads" / "a.pdf").read_bytes() == b"a"
+    assert not list((tmp_path / "uploads").glob(".*.tmp"))
@@ -0,0 +1,27 @@
+import logging
+
+import httpx
+from openai import OpenAI
+
+from grag_api.metrics import LLM_RETRIES, count_openai_retries
+
+
+def test_openai_retries_are_counted_without_changing_the_client_logger(caplog):
+    responses = iter([httpx.Response(429, headers={"retry-after-ms": "1"}), httpx.Response(200, json={"data": []})])
+    client = OpenAI(
+        api_key="key",
+        max_retries=2,
+        http_client=httpx.Client(transport=httpx.MockTransport(lambda request: next(responses))),
+    )
+    logger = logging.getLogger("openai._base_client")
+    level = logger.level
+
+    count_openai_retries()
+    count_openai_retries()
+    before = LLM_RETRIES.value()
+    with caplog.at_level(logging.WARNING):
+        client.models.list()
+
+    assert LLM_RETRIES.value() == before + 1
+    assert logger.level == level
+    assert not [record for record in caplog.records if record.name == "openai._base_client"]
@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from grag_api.extract import pdf_extract
+from grag_api.extract.pdf_extract import FAILED_CAPTION, PDFProcessor
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+
+def completion(content: str) -> FakeResponse:
+    return FakeResponse(200, {"choices": [{"message": {"content": content}}]})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pdf_extract.time, "sleep", sleeps.append)
+    return sleeps
+
+
+@pytest.fixture
+def processor(monkeypatch, sleeps):
+    def make(*responses):
+        processor = PDFProcessor.__new__(PDFProcessor)
+        processor.config = {"openai_api_key": "key", "image_captions": {"max_retries": 2, "retry_delay": 0.5}}
+        processor.logger = pdf_extract.logging.getLogger(__name__)
+        processor.requests = []
+        pending = list(responses)
+
+        def post(url, headers, json):
+            processor.requests.append(json)
+            return pending.pop(0)
+
+        monkeypatch.setattr(pdf_extract.requests, "post", post)
+        return processor
+
+    return make
+
+
+def test_rate_limited_batches_are_retried_with_backoff(processor, sleeps):
+    captions = json.dumps({"captions": [{"image": 1, "description": "a truck"}, {"image": 2, "description": "a map"}]})
+    pdf = processor(FakeResponse(429), FakeResponse(503, headers={"Retry-After": "3"}), completion(captions))
+
+    assert pdf.get_image_descriptions([b"1", b"2"]) == ["a truck", "a map"]
+    assert len(pdf.requests) == 3
+    assert sleeps == [0.5, 3.0]
+
+
+def test_failed_batches_are_not_split_into_single_requests(processor):
+    pdf = processor(FakeResponse(500), FakeResponse(500), FakeResponse(500))
+
+    assert pdf.get_image_descriptions([b"1", b"2"]) == [FAILED_CAPTION, FAILED_CAPTION]
+    assert len(pdf.requests) == 3
+
+
+def test_unparsable_batches_fall_back_to_single_requests(processor):
+    pdf = processor(completion("not json"), completion("a truck"), completion("a map"))
+
+    assert pdf.get_image_descriptions([b"1", b"2"]) == ["a truck", "a map"]
+    assert [len(request["messages"][0]["content"]) for request in pdf.requests] == [3, 2, 2]
+
+
+def test_images_that_cannot_be_decoded_keep_their_own_type(processor):
+    image = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(image, format="PNG")
+    captioning = processor()
+
+    assert captioning._image_part(image.getvalue())["image_url"]["url"].startswith("data:image/jpeg;base64,")
+    truncated_png = b"\x89PNG\r\n\x1a\n" + b"\0" * 16
+    assert captioning._image_part(truncated_png)["image_url"]["url"].startswith("data:image/png;base64,")
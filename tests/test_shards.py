@@ -0,0 +1,42 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from grag_api.shards import ShardedIndexer, shard_workspace
+
+
+class FailingShardIndexer(ShardedIndexer):
+    def __init__(self, workspace, failing=()):
+        super().__init__(workspace, concurrency=2)
+        self.failing = set(failing)
+
+    async def _index_shard(self, key, rows):
+        if key in self.failing:
+            raise RuntimeError(f"{key} failed")
+        (shard_workspace(self.workspace, key) / "_index").parent.mkdir(parents=True, exist_ok=True)
+        (shard_workspace(self.workspace, key) / "_index").write_text("1")
+
+
+def dataset(*titles) -> pd.DataFrame:
+    return pd.DataFrame({"id": [f"{title}_1" for title in titles], "text": "rates", "title": list(titles)})
+
+
+def test_failed_shard_keeps_others_and_removes_stale_shards(tmp_path):
+    asyncio.run(FailingShardIndexer(tmp_path).run(dataset("a.pdf", "stale.pdf")))
+
+    indexer = FailingShardIndexer(tmp_path, failing=["b"])
+    with pytest.raises(RuntimeError, match="b failed"):
+        asyncio.run(indexer.run(dataset("a.pdf", "b.pdf", "c.pdf")))
+
+    assert set(indexer._read_state()) == {"a", "c"}
+    assert not shard_workspace(tmp_path, "stale").exists()
+
+
+def test_several_failed_shards_are_raised_together(tmp_path):
+    indexer = FailingShardIndexer(tmp_path, failing=["a", "b"])
+    with pytest.raises(ExceptionGroup) as raised:
+        asyncio.run(indexer.run(dataset("a.pdf", "b.pdf", "c.pdf")))
+
+    assert sorted(str(error) for error in raised.value.exceptions) == ["a failed", "b failed"]
+    assert set(indexer._read_state()) == {"c"}
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from grag_api.lexical import LexicalIndex, build_lexical_index
+from grag_api.text_store import TextStore, build_text_stores, remove_text_stores
+
+
+def write_text_units(artifacts_dir):
+    artifacts_dir.mkdir(parents=True, exist_ok=True)
+    path = artifacts_dir / "create_final_text_units.parquet"
+    pd.DataFrame({"id": ["u1", "u2"], "text": ["item 233 rate", "ODFL class 85"]}).to_parquet(path)
+    return path
+
+
+def test_queriers_read_artifacts_without_writing(tmp_path):
+    path = write_text_units(tmp_path / "artifacts")
+
+    store = TextStore.from_parquet(path, "id", "text")
+    index = LexicalIndex.from_parquet(path)
+
+    assert store.get("u2") == "ODFL class 85"
+    assert index.search("item 233")[0][0] == "u1"
+    assert sorted(p.name for p in path.parent.iterdir()) == [path.name]
+
+
+def test_queriers_open_what_the_indexer_built(tmp_path):
+    path = write_text_units(tmp_path / "artifacts")
+
+    build_lexical_index(path.parent)
+    build_text_stores(path.parent, {"create_final_text_units": ("id", "text")})
+    built = {p.name: p.stat().st_mtime_ns for p in path.parent.iterdir()}
+
+    assert TextStore.from_parquet(path, "id", "text").get("u1") == "item 233 rate"
+    assert LexicalIndex.from_parquet(path).search("odfl")[0][0] == "u2"
+    assert {p.name: p.stat().st_mtime_ns for p in path.parent.iterdir()} == built
+    assert set(built) == {path.name, "create_final_text_units.text.arrow", "create_final_text_units.bm25.npz"}
+
+
+def test_sidecars_are_removed_once_the_arena_carries_the_bodies(tmp_path):
+    path = write_text_units(tmp_path / "artifacts")
+    bodies = {"create_final_text_units": ("id", "text")}
+    build_text_stores(path.parent, bodies)
+
+    remove_text_stores(path.parent, bodies)
+    remove_text_stores(path.parent, bodies)
+
+    assert sorted(p.name for p in path.parent.iterdir()) == [path.name]
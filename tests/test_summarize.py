@@ -0,0 +1,35 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from graphrag.index.graph.extractors.summarize.prompts import SUMMARIZE_PROMPT
+
+from grag_api.summarize import _summarize_batch, batch_instructions
+
+CUSTOM_PROMPT = """
+Summarize the tariff terms of the entity in at most {max_length} words, keeping every rate and item number.
+-Data-
+Entities: {entity_name}
+Description List: {description_list}
+Output:"""
+
+
+def test_batch_prompt_keeps_the_configured_instructions():
+    prompts = []
+
+    async def llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return SimpleNamespace(json={"summaries": [{"id": 0, "description": "ODFL charges $12."}]}, output=None)
+
+    batch = [{"id": 0, "name": "ODFL", "descriptions": ["a", "b"]}]
+    answered = asyncio.run(_summarize_batch(llm, batch, batch_instructions(CUSTOM_PROMPT, 120)))
+
+    assert answered == {0: "ODFL charges $12."}
+    assert prompts[0].startswith("\nSummarize the tariff terms of the entity in at most 120 words")
+    assert json.dumps([{"id": 0, "entities": "ODFL", "descriptions": ["a", "b"]}]) in prompts[0]
+
+
+def test_prompts_that_cannot_be_shared_are_not_batched():
+    assert "500 words" in batch_instructions(SUMMARIZE_PROMPT, 500)
+    assert batch_instructions("Summarize {entity_name}: {description_list}", 500) is None
+    assert batch_instructions("Summarize {entity_name}.\n-Data-\n{description_list}", 500) is None
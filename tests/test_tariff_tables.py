@@ -0,0 +1,76 @@
+import sqlite3
+
+from grag_api.tariff_tables import TABLE_STORE_FILE, TariffStores, TariffTableStore, is_lookup_query, lookup_rows
+
+PAGES = [
+    {
+        "id": "Roadrunner_Rules_Tariff.pdf_4",
+        "title": "Roadrunner_Rules_Tariff.pdf",
+        "tables": [{
+            "columns": ["Item", "Description", "Charge"],
+            "rows": [["175.5", "Liftgate delivery", "$85.00"], ["180", "Inside delivery", "$95.00"]],
+        }],
+    },
+    {
+        "id": "Estes_Tariff.pdf_2",
+        "title": "Estes_Tariff.pdf",
+        "tables": [{"columns": ["Item", "Description", "Charge"], "rows": [["175.5", "Liftgate delivery", "$70.00"]]}],
+    },
+]
+
+
+def test_generic_tariff_words_do_not_make_a_lookup():
+    assert not is_lookup_query("What does the Roadrunner tariff say about liability per pound?")
+    assert is_lookup_query("What is the liftgate charge for item 175.5?")
+
+
+def test_rows_answer_only_when_they_cover_the_question(tmp_path):
+    store = TariffTableStore.for_workspace(tmp_path)
+    store.add_pages(PAGES)
+
+    rows = store.answering_rows("What is the Roadrunner liftgate charge for item 175.5?")
+    assert set(rows["carrier"]) == {"roadrunner"}
+    assert "175.5" in rows["cells"].iloc[0]
+    assert store.answering_rows("What is the Roadrunner charge for liability claims?").empty
+    # the rows match "liftgate", but nothing in them answers "hazmat"
+    assert store.answering_rows("What is the liftgate charge for hazmat freight?").empty
+
+
+def test_lookup_rows_merges_workspaces(tmp_path):
+    for position, page in enumerate(PAGES):
+        TariffTableStore.for_workspace(tmp_path / str(position)).add_pages([page])
+
+    rows = lookup_rows([tmp_path / "0", tmp_path / "1", tmp_path / "missing"], "liftgate charge", k=5)
+    assert set(rows["carrier"]) == {"roadrunner", "estes"}
+    assert rows["score"].is_monotonic_increasing
+
+
+def test_stores_are_opened_once_without_altering_the_file(tmp_path):
+    sqlite3.connect(tmp_path / TABLE_STORE_FILE).close()
+    stores = TariffStores()
+
+    store = stores.get(tmp_path)
+    assert stores.get(tmp_path) is store
+    assert stores.get(tmp_path / "missing") is None
+    with sqlite3.connect(tmp_path / TABLE_STORE_FILE) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+
+
+def test_carriers_are_read_again_only_after_the_file_changed(tmp_path):
+    writer = TariffTableStore.for_workspace(tmp_path)
+    writer.add_pages(PAGES[:1])
+    store = TariffStores().get(tmp_path)
+    reads = []
+    connect = store._connect
+
+    def counting_connect():
+        reads.append(1)
+        return connect()
+
+    store._connect = counting_connect
+    assert store.carriers() == {"roadrunner"}
+    assert not store.answering_rows("What is the Roadrunner liftgate charge for item 175.5?").empty
+    assert len(reads) == 2
+
+    writer.add_pages(PAGES[1:])
+    assert store.carriers() == {"roadrunner", "estes"}
@@ -0,0 +1,78 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from grag_api import GraphRAG
+from grag_api.tombstones import Tombstones, indexed_document_ids
+
+
+class FakePDFProcessor:
+    def run(self, pdf_path):
+        return [{"id": f"tariff.pdf_{page}", "text": f"page {page}", "title": "tariff.pdf"} for page in (1, 2)]
+
+
+class FakeIndexer:
+    def __init__(self):
+        self.datasets = []
+
+    async def run(self, dataset):
+        self.datasets.append(dataset)
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def make(sharded=False):
+        rag = GraphRAG(workspace=str(tmp_path / "ws"), sharded=sharded)
+        rag.__dict__["pdf_processor"] = FakePDFProcessor()
+        rag.__dict__["indexer"] = FakeIndexer()
+        rag.__dict__["sharded_indexer"] = FakeIndexer()
+        return rag
+
+    return make
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+def test_reuploaded_file_is_queried_again(rag, sharded):
+    rag = rag(sharded)
+    rag.upsert_pdf("uploads/tariff.pdf")
+    asyncio.run(rag.aindex())
+
+    rag.delete_pdf("tariff.pdf")
+    tombstones = Tombstones(rag._workspace_for("tariff.pdf"))
+    tombstones.refresh()
+    assert tombstones.document_ids == {"tariff.pdf_1", "tariff.pdf_2"}
+
+    rag.upsert_pdf("uploads/tariff.pdf")
+    asyncio.run(rag.aindex())
+
+    tombstones.refresh()
+    assert tombstones.documents == {}
+    # what a querier of the re-built index would hide
+    documents = pd.DataFrame({"id": ["doc-1"], "title": ["tariff.pdf"]})
+    assert indexed_document_ids(tombstones.documents, documents) == set()
+
+
+def test_reupload_keeps_other_tombstones(rag):
+    rag = rag()
+    rag.upsert_pdf("uploads/tariff.pdf")
+    rag.tombstones.add(["other.pdf_1"], title="other.pdf")
+    rag.delete_pdf("tariff.pdf")
+
+    rag.upsert_pdf("uploads/tariff.pdf")
+
+    rag.tombstones.refresh()
+    assert rag.tombstones.documents == {"other.pdf_1": "other.pdf"}
+
+
+def test_reupserted_row_is_revived_by_id(rag):
+    rag = rag()
+    rag.upsert_pdf("uploads/tariff.pdf")
+    rag.delete_item("tariff.pdf_2")
+
+    rag._after_upsert([{"id": "tariff.pdf_2", "text": "page 2", "title": "tariff.pdf"}])
+
+    rag.tombstones.refresh()
+    assert rag.tombstones.documents == {}